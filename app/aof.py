@@ -0,0 +1,275 @@
+import os
+import time
+import threading
+from pathlib import Path
+
+from app.encoder import ENCODER
+from app.namespace import ConfigNamespace
+from app.rdb_parser import RDBParser
+from app.resp_parser import RespParser
+from app.storage import Keyspace
+
+FSYNC_ALWAYS = 'always'
+FSYNC_EVERYSEC = 'everysec'
+FSYNC_NO = 'no'
+
+# manifest file types, as in Redis' aof.c
+AOF_FILE_TYPE_BASE = 'b'
+AOF_FILE_TYPE_INCR = 'i'
+
+
+def fsync_dir(directory: Path):
+    '''Makes renames and new files in `directory` survive a crash.'''
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class AppendOnlyFile:
+    '''Every write command, RESP encoded, appended to a file.
+
+    Writes made during a loop iteration are buffered and group committed by
+    one write() at the start of the next iteration. With `appendfsync
+    always` the write is fsynced right away and connections hold their
+    replies until it has been, see holds_replies(). With `everysec` a
+    background thread fsyncs once a second so the loop never waits on the
+    disk, and with `no` the kernel decides.
+
+    The AOF is several files in `appenddirname`, like Redis 7's multi part
+    AOF: a base file, an RDB snapshot, and the incremental files of the
+    commands written since, listed in order by a manifest. A rewrite sends
+    the writes made while it runs to a new incremental file, then swaps in
+    the new base and drops the old files by replacing the manifest, so the
+    manifest always names a complete set of files.'''
+
+    def __init__(self, directory: Path, filename: str, fsync_policy: str) -> None:
+        self.dir = directory
+        self.filename = filename
+        self.fsync_policy = fsync_policy
+        # (name, seq) of the base file and of the incremental files, in order
+        self.base = None
+        self.incrs = []
+        self.buf = bytearray()
+        self.flush_scheduled = False
+        self.loop = None
+        self.fd = None
+        # the db of the last SELECT written to the current incremental file
+        self.selected_db = -1
+        # held while fsyncing or swapping `fd`, the everysec thread takes it too
+        self.fd_lock = threading.Lock()
+        # size of all the files, and what it was after the last rewrite
+        self.size = 0
+        self.base_size = 0
+        self.last_write_ok = True
+        # set when written data hasn't been fsynced, read by the everysec thread
+        self.unsynced = False
+        self.fsync_thread = None
+
+    @property
+    def manifest_path(self):
+        return self.dir / f'{self.filename}.manifest'
+
+    def base_name(self, seq: int):
+        return f'{self.filename}.{seq}.base.rdb'
+
+    def incr_name(self, seq: int):
+        return f'{self.filename}.{seq}.incr.aof'
+
+    def base_seq(self):
+        return self.base[1] if self.base is not None else 0
+
+    def exists(self):
+        return self.manifest_path.exists()
+
+    def upgrade(self, path: Path):
+        '''Takes over a single file AOF, what this server wrote before the
+        AOF had a manifest, as the first incremental file.'''
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.incrs = [(self.incr_name(1), 1)]
+        os.replace(path, self.dir / self.incrs[0][0])
+        self.write_manifest()
+
+    def read_manifest(self):
+        '''Lines of `file <name> seq <n> type <b|i>`.'''
+        self.base, self.incrs = None, []
+        for line in self.manifest_path.read_text().splitlines():
+            if not line.strip():
+                continue
+            fields = line.split()
+            entry = dict(zip(fields[0::2], fields[1::2]))
+            file = (entry['file'], int(entry['seq']))
+            if entry['type'] == AOF_FILE_TYPE_BASE:
+                self.base = file
+            else:
+                self.incrs.append(file)
+
+    def write_manifest(self):
+        lines = []
+        if self.base is not None:
+            lines.append(f'file {self.base[0]} seq {self.base[1]} type {AOF_FILE_TYPE_BASE}\n')
+        for name, seq in self.incrs:
+            lines.append(f'file {name} seq {seq} type {AOF_FILE_TYPE_INCR}\n')
+        tmp_path = self.dir / f'temp-{self.manifest_path.name}'
+        with open(tmp_path, 'w') as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+        fsync_dir(self.dir)
+
+    def load(self, keyspace: Keyspace, command):
+        '''Loads the base file into `keyspace` and replays the incremental
+        files through `command`, a Command on it. Returns the bytes loaded.'''
+        self.read_manifest()
+        if self.base is not None:
+            rdb_parser = RDBParser(self.dir / self.base[0], progress=True,
+                                   check_crc=getattr(ConfigNamespace, 'rdbchecksum', 'yes') == 'yes')
+            rdb_parser.read_file()
+            keyspace.load_parsed(rdb_parser)
+        for name, _ in self.incrs:
+            self.replay(self.dir / name, command)
+        self.size = self.base_size = self.files_size()
+        self.open_incr(self.incrs[-1][0])
+        return self.size
+
+    def create(self, write_rdb):
+        '''Starts the AOF with a base file of the current keyspace, e.g. what
+        was loaded from the RDB file when AOF is turned on. `write_rdb(path)`
+        writes the snapshot.'''
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.base = (self.base_name(1), 1)
+        self.incrs = [(self.incr_name(1), 1)]
+        write_rdb(self.dir / self.base[0])
+        self.open_incr(self.incrs[0][0])
+        self.write_manifest()
+        self.size = self.base_size = self.files_size()
+
+    def files_size(self):
+        names = [self.base[0]] if self.base is not None else []
+        names += [name for name, _ in self.incrs]
+        return sum(os.path.getsize(self.dir / name) for name in names)
+
+    def open_incr(self, name: str):
+        '''Sends the writes from now on to the incremental file `name`.'''
+        fd = os.open(self.dir / name, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        with self.fd_lock:
+            if self.fd is not None:
+                if self.fsync_policy != FSYNC_NO:
+                    os.fsync(self.fd)
+                os.close(self.fd)
+            self.fd = fd
+        # what a new file holds doesn't depend on the db the last one ended in
+        self.selected_db = -1
+        if self.fsync_policy == FSYNC_EVERYSEC and self.fsync_thread is None:
+            self.fsync_thread = threading.Thread(target=self.fsync_every_second, name='aof-fsync', daemon=True)
+            self.fsync_thread.start()
+
+    def start(self, loop):
+        self.loop = loop
+
+    def feed(self, cmd_arr: list[bytes], db: int):
+        if db != self.selected_db:
+            self.buf += ENCODER.encode_array([b'SELECT', b'%d' % db])
+            self.selected_db = db
+        self.buf += ENCODER.encode_array(cmd_arr)
+        if not self.flush_scheduled and self.loop is not None:
+            self.flush_scheduled = True
+            self.loop.call_soon(self.flush)
+
+    def holds_replies(self):
+        '''Whether replies to the writes in `buf` must wait for flush().'''
+        return self.fsync_policy == FSYNC_ALWAYS and bool(self.buf)
+
+    def flush(self):
+        self.flush_scheduled = False
+        if not self.buf:
+            return
+        try:
+            with memoryview(self.buf) as view:
+                written = 0
+                while written < len(view):
+                    written += os.write(self.fd, view[written:])
+        except OSError as e:
+            # keep what wasn't written, the next flush retries it
+            print(f'Error writing to the AOF: {e}')
+            self.last_write_ok = False
+            del self.buf[:written]
+            return
+        self.last_write_ok = True
+        self.size += len(self.buf)
+        self.buf.clear()
+        if self.fsync_policy == FSYNC_ALWAYS:
+            os.fsync(self.fd)
+        elif self.fsync_policy == FSYNC_EVERYSEC:
+            self.unsynced = True
+
+    def fsync_every_second(self):
+        while True:
+            time.sleep(1)
+            if self.unsynced:
+                self.unsynced = False
+                with self.fd_lock:
+                    try:
+                        os.fsync(self.fd)
+                    except OSError as e:
+                        print(f'Error fsyncing the AOF: {e}')
+
+    def growth(self):
+        '''Percent the AOF grew since the last rewrite.'''
+        if not self.base_size:
+            return 0
+        return (self.size - self.base_size) * 100 // self.base_size
+
+    def start_rewrite(self) -> Path:
+        '''Moves writes to a new incremental file and returns the path the
+        new base file is to be written to. Until finish_rewrite() the
+        manifest lists the old files and the new incremental file, so a
+        crash mid rewrite loses nothing.'''
+        self.flush()
+        seq = self.incrs[-1][1] + 1
+        self.incrs.append((self.incr_name(seq), seq))
+        self.open_incr(self.incrs[-1][0])
+        self.write_manifest()
+        return self.dir / self.base_name(self.base_seq() + 1)
+
+    def finish_rewrite(self, base_path: Path, ok: bool):
+        '''Swaps in the base file the rewrite wrote and deletes the files it
+        replaces, or drops it if the rewrite failed.'''
+        if not ok:
+            base_path.unlink(missing_ok=True)
+            return
+        old = [name for name, _ in self.incrs[:-1]]
+        if self.base is not None:
+            old.append(self.base[0])
+        self.base = (base_path.name, self.base_seq() + 1)
+        self.incrs = self.incrs[-1:]
+        self.write_manifest()
+        for name in old:
+            (self.dir / name).unlink(missing_ok=True)
+        self.size = self.base_size = self.files_size()
+
+    def info(self):
+        return [
+            f'aof_last_write_status:{"ok" if self.last_write_ok else "err"}',
+            f'aof_current_size:{self.size}',
+            f'aof_base_size:{self.base_size}',
+        ]
+
+    def replay(self, path: Path, command):
+        '''Runs every command in `path` through `command`. A command cut short
+        by a crash at the end of the file is truncated away, like Redis'
+        aof-load-truncated. Returns the bytes replayed.'''
+        parser = RespParser()
+        total = 0
+        with open(path, 'rb') as f:
+            while chunk := f.read(RespParser.RECV_SIZE):
+                total += len(chunk)
+                for cmd_arr in parser.parse_multiple(chunk):
+                    command.handle_cmd(cmd_arr, None, False)
+        valid = total - len(parser.buffer)
+        if valid < total:
+            print(f'AOF {path} ends with a truncated command, truncating it to {valid} bytes')
+            os.truncate(path, valid)
+        return valid
@@ -0,0 +1,105 @@
+import asyncio
+
+from app.commands import MasterCommand, ReplicaCommand
+from app.connection import Connection, MasterLink
+from app.cron import ServerCron
+from app.persistence import Persistence
+from app.namespace import ConfigNamespace
+from app.storage import Keyspace
+from app.replicas import Replicas
+
+
+class RedisProtocol(Connection, asyncio.Protocol):
+    '''One instance per client connection, served on the asyncio loop.'''
+
+    def __init__(self, keyspace: Keyspace, replicas: Replicas, persistence: Persistence) -> None:
+        super().__init__(MasterCommand(keyspace=keyspace, replicas=replicas, persistence=persistence))
+        self.transport: asyncio.Transport = None
+        self.peername = None
+        self.write_paused = False
+
+    def connection_made(self, transport: asyncio.Transport):
+        self.transport = transport
+        self.peername = transport.get_extra_info('peername')
+        self.attach(asyncio.get_running_loop())
+
+    def connection_lost(self, exc):
+        self.connection_closed()
+        self.transport = None
+
+    def flush(self):
+        self.flush_scheduled = False
+        if self.out and self.transport is not None:
+            # hand the buffer over, the transport may keep a reference to it
+            data, self.out = self.out, bytearray()
+            self.transport.write(data)
+
+    def pause_writing(self):
+        # the client isn't keeping up with its replies, stop reading its
+        # commands until the transport buffer drains
+        self.write_paused = True
+        self.transport.pause_reading()
+
+    def resume_writing(self):
+        self.write_paused = False
+        self.transport.resume_reading()
+        self.drained()
+
+    def write_backed_up(self):
+        return self.write_paused
+
+    def output_size(self):
+        if self.transport is None:
+            return len(self.out)
+        return len(self.out) + self.transport.get_write_buffer_size()
+
+    def close(self):
+        if self.transport is not None:
+            # drop whatever is still buffered, like Redis freeing a client
+            self.transport.abort()
+        self.connection_closed()
+
+    def getpeername(self):
+        return self.peername
+
+
+class MasterLinkProtocol(MasterLink, RedisProtocol):
+
+    def __init__(self, keyspace: Keyspace, persistence: Persistence) -> None:
+        super().__init__(keyspace, None, persistence)
+        self.cmd_parser = ReplicaCommand(keyspace=keyspace, persistence=persistence)
+
+    def connection_made(self, transport: asyncio.Transport):
+        super().connection_made(transport)
+        self.start_handshake()
+
+    def reconnect(self):
+        connect_to_master(self.loop, self.cmd_parser.keyspace, self.cmd_parser.persistence)
+
+
+def connect_to_master(loop: asyncio.AbstractEventLoop, keyspace: Keyspace, persistence: Persistence):
+    host, port = ConfigNamespace.replicaof.split()
+
+    async def connect():
+        try:
+            await loop.create_connection(lambda: MasterLinkProtocol(keyspace, persistence), host, int(port))
+        except OSError as e:
+            print(f"Couldn't connect to master {host}:{port}: {e}")
+            loop.call_later(MasterLink.RECONNECT_DELAY, connect_to_master, loop, keyspace, persistence)
+
+    return loop.create_task(connect())
+
+
+async def serve(keyspace: Keyspace, replicas: Replicas, persistence: Persistence):
+    loop = asyncio.get_running_loop()
+    ServerCron(keyspace, persistence, replicas).start(loop)
+    server = await loop.create_server(
+        lambda: RedisProtocol(keyspace, replicas, persistence),
+        'localhost', ConfigNamespace.port, reuse_port=True, backlog=100
+    )
+
+    if ConfigNamespace.is_replica():
+        await connect_to_master(loop, keyspace, persistence)
+
+    async with server:
+        await server.serve_forever()
@@ -0,0 +1,47 @@
+class ReplicationBacklog:
+    '''The last `size` bytes of the replication stream in a circular buffer.
+
+    Offsets are replication offsets: the master's offset counts every byte
+    ever propagated and the first one is offset 1, like Redis. A replica that
+    reconnects asks for the offset after the last byte it processed and, if
+    that is still here, gets just the bytes it missed.'''
+
+    def __init__(self, size: int, offset: int) -> None:
+        self.buf = bytearray(size)
+        self.size = size
+        # where the next byte goes in `buf`
+        self.idx = 0
+        # how many bytes of `buf` hold data, at most `size`
+        self.histlen = 0
+        # replication offset of the last byte appended
+        self.offset = offset
+
+    @property
+    def first_offset(self):
+        return self.offset - self.histlen + 1
+
+    def append(self, data: bytes):
+        n = len(data)
+        self.offset += n
+        self.histlen = min(self.histlen + n, self.size)
+        if n >= self.size:
+            self.buf[:] = memoryview(data)[n - self.size:]
+            self.idx = 0
+            return
+        first = min(n, self.size - self.idx)
+        self.buf[self.idx:self.idx + first] = memoryview(data)[:first]
+        if first < n:
+            self.buf[:n - first] = memoryview(data)[first:]
+        self.idx = (self.idx + n) % self.size
+
+    def can_continue(self, offset: int):
+        return self.first_offset <= offset <= self.offset + 1
+
+    def read_from(self, offset: int) -> bytes:
+        '''Bytes from replication offset `offset` to the end of the stream.
+        The caller checks can_continue() first.'''
+        length = self.offset + 1 - offset
+        start = (self.idx - length) % self.size
+        if start + length <= self.size:
+            return bytes(self.buf[start:start + length])
+        return bytes(self.buf[start:]) + bytes(self.buf[:length - (self.size - start)])
@@ -0,0 +1,91 @@
+'''Clients blocked by commands like XREAD BLOCK and WAIT.
+
+A blocked client parks a Waiter under every key it waits on instead of a
+thread. Writes signal the keys they touch, and once the writing command is
+done only the waiters of those keys are retried, in the order they blocked.
+Timeouts are timers on the connection's event loop, like Redis' blocking.c
+with its clients-by-timeout table.'''
+from typing import Callable
+
+
+class Waiter:
+    __slots__ = ('registry', 'conn', 'keys', 'retry', 'on_timeout', 'timer')
+
+    def __init__(self, registry: 'BlockingRegistry', conn, keys, retry: Callable, on_timeout: Callable) -> None:
+        self.registry = registry
+        self.conn = conn
+        self.keys = keys
+        # returns the reply once the client can be served, None to keep waiting
+        self.retry = retry
+        # returns the reply sent when the timeout fires
+        self.on_timeout = on_timeout
+        self.timer = None
+
+    def timed_out(self):
+        self.timer = None
+        self.finish(self.on_timeout())
+
+    def finish(self, reply: bytes):
+        self.cancel()
+        self.conn.sendall(reply)
+        self.conn.unblock()
+
+    def cancel(self):
+        '''Forgets the waiter without replying, e.g. when the client is gone.'''
+        self.registry.remove(self)
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.conn.waiter = None
+
+
+class BlockingRegistry:
+
+    def __init__(self, signalled: dict | None = None) -> None:
+        # key -> waiters blocked on it, oldest first. A dict is an ordered set
+        # that removes in O(1), for keys with thousands of waiters.
+        self.waiters: dict[object, dict[Waiter, None]] = {}
+        # keys written to since waiters were last served
+        self.ready: set = set()
+        # registries with ready keys, shared by the dbs of a keyspace so that
+        # a command that wrote to several of them serves all of them
+        self.signalled = signalled
+
+    def __len__(self):
+        return sum(len(waiters) for waiters in self.waiters.values())
+
+    def block(self, conn, keys, timeout_ms: int, retry: Callable, on_timeout: Callable):
+        '''Blocks `conn` on `keys` until retry() returns a reply, or for at
+        most `timeout_ms`, 0 meaning forever.'''
+        waiter = Waiter(self, conn, keys, retry, on_timeout)
+        for key in keys:
+            self.waiters.setdefault(key, {})[waiter] = None
+        if timeout_ms:
+            waiter.timer = conn.loop.call_later(timeout_ms / 1000, waiter.timed_out)
+        conn.block(waiter)
+        return waiter
+
+    def remove(self, waiter: Waiter):
+        for key in waiter.keys:
+            waiters = self.waiters.get(key)
+            if waiters is None:
+                continue
+            waiters.pop(waiter, None)
+            if not waiters:
+                del self.waiters[key]
+
+    def signal(self, key):
+        '''Marks `key` as changed, a no-op unless someone waits on it.'''
+        if key in self.waiters:
+            self.ready.add(key)
+            if self.signalled is not None:
+                self.signalled[self] = None
+
+    def serve_ready(self):
+        while self.ready:
+            key = self.ready.pop()
+            # waiters that are served leave the dict while it is walked
+            for waiter in list(self.waiters.get(key, ())):
+                reply = waiter.retry()
+                if reply is not None:
+                    waiter.finish(reply)
@@ -0,0 +1,23 @@
+'''Millisecond clock shared by the whole server.
+
+It is read with now_ms() as often as needed but only advanced by tick(),
+which the event loop calls once per batch of work, like Redis caching
+mstime() per command. Values are monotonic but offset to unix epoch
+milliseconds, so they compare with expiry times from RDB files.'''
+import time
+
+_offset = time.time_ns() // 1_000_000 - time.monotonic_ns() // 1_000_000
+_now_ms = 0
+
+
+def tick():
+    global _now_ms
+    _now_ms = _offset + time.monotonic_ns() // 1_000_000
+    return _now_ms
+
+
+def now_ms():
+    return _now_ms
+
+
+tick()
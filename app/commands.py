@@ -1,18 +1,19 @@
-import re
-import threading
-import threading
+import math
 from enum import StrEnum
 from socket import socket
 from typing import Any
 
-from app.encoder import RespEncoder, EncodedMessageType, ENCODER, QUEUED
-from app.storage import RedisDB
-from app.constants import SET_ARGS, BOUNDARY
+from app import clock
+from app.globmatch import compile_glob
+from app.encoder import RespEncoder, EncodedMessageType, ENCODER, QUEUED, WRONGTYPE
+from app.storage import Keyspace, WrongTypeError
+from app.constants import SET_ARGS, MAGIC_STR
 from app.namespace import ConfigNamespace, server_config
-from app.util import decode
-from app.replicas import Replicas
+from app.util import decode, INT64_MIN, INT64_MAX
+from app.replicas import Replicas, REPLICA_ACK
+from app.persistence import Persistence
+from app.zset import InvalidScore, format_score, parse_score, parse_score_bound
 
-accum_lock = threading.Condition()
 
 class CommandQueue():
     ''' Used for MULTI cmd to store trx before being commited.'''
@@ -41,6 +42,7 @@ class CommandEnum(StrEnum):
     PING = 'ping'
     SET = 'set'
     GET = 'get'
+    DEL = 'del'
     CONFIG = 'config'
     KEYS = 'keys'
     INFO = 'info'
@@ -55,6 +57,90 @@ class CommandEnum(StrEnum):
     MULTI = 'multi'
     EXEC = 'exec'
     DISCARD = 'discard'
+    COMMAND = 'command'
+    SAVE = 'save'
+    BGSAVE = 'bgsave'
+    LASTSAVE = 'lastsave'
+    BGREWRITEAOF = 'bgrewriteaof'
+    SELECT = 'select'
+    SWAPDB = 'swapdb'
+    DBSIZE = 'dbsize'
+    FLUSHDB = 'flushdb'
+    FLUSHALL = 'flushall'
+    SCAN = 'scan'
+    LPUSH = 'lpush'
+    RPUSH = 'rpush'
+    LPOP = 'lpop'
+    RPOP = 'rpop'
+    LLEN = 'llen'
+    LINDEX = 'lindex'
+    LRANGE = 'lrange'
+    BLPOP = 'blpop'
+    BRPOP = 'brpop'
+    HSET = 'hset'
+    HGET = 'hget'
+    HGETALL = 'hgetall'
+    HINCRBY = 'hincrby'
+    HDEL = 'hdel'
+    HLEN = 'hlen'
+    ZADD = 'zadd'
+    ZREM = 'zrem'
+    ZSCORE = 'zscore'
+    ZCARD = 'zcard'
+    ZRANK = 'zrank'
+    ZREVRANK = 'zrevrank'
+    ZRANGE = 'zrange'
+    ZRANGEBYSCORE = 'zrangebyscore'
+
+class CommandFlag(StrEnum):
+    WRITE = 'write'
+    READONLY = 'readonly'
+    # may park the client until something else happens
+    BLOCKING = 'blocking'
+    # queued instead of run while the client is in a MULTI
+    QUEUEABLE = 'queueable'
+
+class CommandSpec:
+    '''Registry entry for a command. Arity follows COMMAND INFO, the number of
+    arguments including the name, negative meaning "at least". Key positions
+    are first key, last key and step, all 0 for commands without keys.'''
+
+    def __init__(self, name: str, handler: str, arity: int, flags: tuple[CommandFlag], keys: tuple[int, int, int]) -> None:
+        self.name = name
+        self.handler = handler
+        self.arity = arity
+        self.flags = frozenset(flags)
+        self.first_key, self.last_key, self.step = keys
+        self.is_write = CommandFlag.WRITE in self.flags
+        self.is_queueable = CommandFlag.QUEUEABLE in self.flags
+
+    def arity_ok(self, no_of_args: int):
+        if self.arity < 0:
+            return no_of_args >= -self.arity
+        return no_of_args == self.arity
+
+# command name in lowercase bytes -> spec, filled in by @command below
+COMMANDS: dict[bytes, CommandSpec] = {}
+
+def command(name: CommandEnum, arity: int, *flags: CommandFlag, keys: tuple[int, int, int] = (0, 0, 0)):
+    '''Registers the decorated Command method as the handler of `name`. The
+    handler is looked up by method name, so subclasses override it as usual.'''
+    def register(handler):
+        COMMANDS[name.encode('utf-8')] = CommandSpec(name, handler.__name__, arity, flags, keys)
+        return handler
+    return register
+
+def absolute_ttl(cmd_arr: list[bytes]) -> list[bytes]:
+    '''SET ... PX <ms> as SET ... PXAT <unix ms>, so that a key expires on
+    replicas and when the AOF is replayed when it does here, not PX after
+    they got the write.'''
+    if cmd_arr[0].lower() != b'set':
+        return cmd_arr
+    for idx in range(3, len(cmd_arr) - 1):
+        if cmd_arr[idx].lower() == b'px':
+            expires = clock.now_ms() + int(cmd_arr[idx + 1])
+            return [*cmd_arr[:idx], b'PXAT', b'%d' % expires, *cmd_arr[idx + 2:]]
+    return cmd_arr
 
 class InvalidCommandCall(Exception):
     pass
@@ -63,13 +149,32 @@ class CantEncodeMessage(Exception):
     pass
 
 class Command:
+    '''Handlers take the command array and the connection it came from and
+    return the encoded reply. handle_cmd() does everything that is the same
+    for every command: lookup, arity check, MULTI queueing, sending the reply
+    and propagating writes.
+
+    A write command is only propagated if its handler changed the keyspace,
+    which it reports by adding the number of changes to `dirty`, like
+    server.dirty in Redis. An LPOP of a missing key or a ZADD XX that
+    matched nothing goes no further than the client.'''
 
-    def __init__(self, *, encoder: RespEncoder = None, storage: RedisDB = None, replicas: Replicas | None = None) -> None:
+    def __init__(self, *, encoder: RespEncoder = None, keyspace: Keyspace = None, replicas: Replicas | None = None,
+                 persistence: Persistence | None = None) -> None:
         self.encoder = ENCODER
-        self.storage = RedisDB() if storage is None else storage
+        self.keyspace = Keyspace() if keyspace is None else keyspace
+        # the db the client SELECTed, and its RedisDB which handlers use
+        self.db = 0
+        self.storage = self.keyspace[0]
         self.replicas = replicas
+        self.persistence = persistence
         self.cmd_queue = CommandQueue()
-        self.in_wait_cmd = False
+        self.in_exec = False
+        # keyspace changes made by the commands run so far
+        self.dirty = 0
+        # (command, db) of the writes made by the commands EXEC runs, passed
+        # on together once it is done
+        self.exec_writes = []
 
     def handle_cmd(self, command_arr: list[bytes], socket: socket, send_to_sock = True):
         if not isinstance(command_arr, list):
@@ -77,265 +182,873 @@ class Command:
 
         if len(command_arr) < 1:
             raise InvalidCommandCall('Must pass a command.')
-        cmd = command_arr[0].strip().lower()
 
-        # prevents infinite recursion because we might
-        # call this method in one of the methods handling
-        # one of the commands in the array
-        if cmd in [CommandEnum.EXEC, CommandEnum.MULTI]:
+        name = command_arr[0].lower()
+        spec = COMMANDS.get(name)
+        if spec is None:
+            msg = self.encoder.encode(f"ERR unknown command '{decode(command_arr[0])}'", EncodedMessageType.ERROR)
+        elif not spec.arity_ok(len(command_arr)):
+            msg = self.encoder.encode(f"ERR wrong number of arguments for '{spec.name}' command", EncodedMessageType.ERROR)
+        elif spec.is_queueable and self.cmd_queue.in_transaction():
+            self.cmd_queue.add_command(command_arr)
+            msg = QUEUED
+        else:
+            dirty = self.dirty
+            try:
+                msg = getattr(self, spec.handler)(command_arr, socket)
+            except Exception as e:
+                # a pipelined client counts replies, it must get one
+                print(f"Exception while handling {command_arr}: {e}")
+                msg = self.encoder.encode(f'ERR {e}', EncodedMessageType.ERROR)
+            if spec.is_write and self.dirty != dirty:
+                self.written(command_arr, self.db)
+            # clients blocked on keys this wrote to, in whichever db, once the
+            # whole EXEC is done
+            if self.keyspace.signalled and not self.in_exec:
+                self.keyspace.serve_ready()
+
+        if send_to_sock and msg is not None:
+            socket.sendall(msg)
+        return msg
+
+    def propagate(self, cmd_arr: list[bytes], db: int | None = None):
+        '''Called after every write command that changed the keyspace, with
+        the db it ran in. `db` is None for what doesn't depend on it, like
+        GETACK.'''
+        pass
+
+    def written(self, cmd_arr: list[bytes], db: int):
+        '''Passes a write on to the replicas and the AOF, or holds it back
+        until the EXEC running it is done.'''
+        cmd_arr = absolute_ttl(cmd_arr)
+        if self.in_exec:
+            self.exec_writes.append((cmd_arr, db))
             return
+        self.propagate(cmd_arr, db)
+        if self.persistence is not None:
+            self.persistence.written(cmd_arr, db)
+
+    def exec_written(self):
+        '''Passes on the writes of an EXEC, wrapped in MULTI and EXEC when
+        there are several, so that replicas and the AOF apply them all or
+        none, as the client saw them.'''
+        writes, self.exec_writes = self.exec_writes, []
+        if len(writes) > 1:
+            writes = [([b'MULTI'], writes[0][1]), *writes, ([b'EXEC'], writes[-1][1])]
+        for cmd_arr, db in writes:
+            self.propagate(cmd_arr, db)
+            if self.persistence is not None:
+                self.persistence.written(cmd_arr, db)
+
+    def select(self, db: int):
+        self.db = db
+        self.storage = self.keyspace[db]
 
-        match cmd.decode('utf-8'):
-            case CommandEnum.ECHO:
-                return self.handle_echo_cmd(command_arr, socket, send_to_sock)
-            case CommandEnum.PING:
-                return self.handle_ping_cmd(socket)
-            case CommandEnum.SET:
-                return self.handle_set_cmd(command_arr, socket, send_to_sock)
-            case CommandEnum.GET:
-                return self.handle_get_cmd(command_arr, socket, send_to_sock)
-            case CommandEnum.CONFIG:
-                return self.handle_config_cmd(command_arr, socket)
-            case CommandEnum.KEYS:
-                return self.handle_keys_cmd(command_arr, socket)
-            case CommandEnum.INFO:
-                return self.handle_info_cmd(command_arr, socket)
-            case CommandEnum.REPLCONF:
-                return self.handle_replconf_cmd(command_arr, socket)
-            case CommandEnum.PSYNC:
-                return self.handle_psync_cmd(command_arr, socket)
-            case CommandEnum.WAIT:
-                return self.handle_wait_cmd(command_arr, socket)
-            case CommandEnum.TYPE:
-                return self.handle_get_type_cmd(command_arr, socket)
-            case CommandEnum.XADD:
-                return self.handle_xadd_cmd(command_arr, socket)
-            case CommandEnum.XRANGE:
-                return self.handle_xrange_cmd(command_arr, socket)
-            case CommandEnum.XREAD:
-                return self.handle_xread_cmd(command_arr, socket)
-            case CommandEnum.INCR:
-                return self.handle_incr_cmd(command_arr, socket, send_to_sock)
-            case CommandEnum.MULTI:
-                return self.handle_multi_cmd(socket)
-            case CommandEnum.EXEC:
-                return self.handle_exec_cmd(socket)
-            case CommandEnum.DISCARD:
-                return self.handle_discard_cmd(socket)
-
-    
     def accum_proc(self, cmd_arr):
         '''Accumulates the cmd bytes that have been processed by the server.
-        Currently only used when PINGing replica, REPLCONF and SET'''
+        On a master these are the commands propagated to replicas and GETACKs,
+        on a replica everything received from the master.'''
         encoded = self.encoder.encode(cmd_arr, EncodedMessageType.ARRAY)
         server_config.acked_commands += len(encoded)
 
-    def verify_args_len(self, _type, num, args):
-        if len(args) < num:
-            raise InvalidCommandCall(f'{_type.upper()} cmd must be called with enough argument(s). Called with only {num} argument(s).')
+    @command(CommandEnum.COMMAND, -1)
+    def handle_command_cmd(self, cmd_arr, socket: socket):
+        sub_cmd = cmd_arr[1].lower() if len(cmd_arr) > 1 else None
+        if sub_cmd is None:
+            specs = list(COMMANDS.values())
+        elif sub_cmd == b'count':
+            return self.encoder.encode(len(COMMANDS), EncodedMessageType.INTEGER)
+        elif sub_cmd == b'info':
+            specs = [COMMANDS.get(name.lower()) for name in cmd_arr[2:]]
+        elif sub_cmd == b'docs':
+            return self.encoder.encode([], EncodedMessageType.ARRAY)
+        else:
+            return self.encoder.encode(f"ERR unknown subcommand '{decode(cmd_arr[1])}'", EncodedMessageType.ERROR)
+        return self.encoder.encode([self.encode_command_info(spec) for spec in specs], EncodedMessageType.ARRAY, already_encoded=True)
 
-    def handle_multi_cmd(self, socket: socket):
+    def encode_command_info(self, spec: CommandSpec | None):
+        if spec is None:
+            return self.encoder.null_bulk_str()
+        flags = [self.encoder.encode(flag, EncodedMessageType.SIMPLE_STRING) for flag in sorted(spec.flags)]
+        info = [
+            self.encoder.encode(spec.name, EncodedMessageType.BULK_STRING),
+            self.encoder.encode(spec.arity, EncodedMessageType.INTEGER),
+            self.encoder.encode(flags, EncodedMessageType.ARRAY, already_encoded=True),
+            self.encoder.encode(spec.first_key, EncodedMessageType.INTEGER),
+            self.encoder.encode(spec.last_key, EncodedMessageType.INTEGER),
+            self.encoder.encode(spec.step, EncodedMessageType.INTEGER),
+        ]
+        return self.encoder.encode(info, EncodedMessageType.ARRAY, already_encoded=True)
+
+    @command(CommandEnum.MULTI, 1)
+    def handle_multi_cmd(self, cmd_arr, socket: socket):
+        if self.cmd_queue.in_transaction():
+            return self.encoder.encode('ERR MULTI calls can not be nested', EncodedMessageType.ERROR)
         self.cmd_queue.start_transaction()
-        socket.sendall(self.encoder.encode('OK', EncodedMessageType.SIMPLE_STRING))
+        return self.encoder.encode('OK', EncodedMessageType.SIMPLE_STRING)
 
-    def handle_discard_cmd(self, socket: socket):
+    @command(CommandEnum.DISCARD, 1)
+    def handle_discard_cmd(self, cmd_arr, socket: socket):
         if not self.cmd_queue.in_transaction():
-            socket.sendall(self.encoder.encode('ERR DISCARD without MULTI', EncodedMessageType.ERROR))
-        else:
-            self.cmd_queue.end_transaction()
-            socket.sendall(self.encoder.encode('OK', EncodedMessageType.SIMPLE_STRING))
+            return self.encoder.encode('ERR DISCARD without MULTI', EncodedMessageType.ERROR)
+        self.cmd_queue.end_transaction()
+        return self.encoder.encode('OK', EncodedMessageType.SIMPLE_STRING)
 
-    def handle_exec_cmd(self, socket: socket):
+    @command(CommandEnum.EXEC, 1)
+    def handle_exec_cmd(self, cmd_arr, socket: socket):
         if not self.cmd_queue.in_transaction():
-            socket.sendall(self.encoder.encode('ERR EXEC without MULTI', EncodedMessageType.ERROR))
-        else:
-            response = []
-            queued_cmds = self.cmd_queue.get_commands()
-            self.cmd_queue.end_transaction()
+            return self.encoder.encode('ERR EXEC without MULTI', EncodedMessageType.ERROR)
+        response = []
+        queued_cmds = self.cmd_queue.get_commands()
+        self.cmd_queue.end_transaction()
 
+        self.in_exec = True
+        try:
             for cmd in queued_cmds:
                 ret = self.handle_cmd(cmd, socket, False)
                 response.append(ret)
+        finally:
+            self.in_exec = False
+            self.exec_written()
 
-            to_send = self.encoder.encode(response, EncodedMessageType.ARRAY, already_encoded = True)
-            socket.sendall(to_send)
+        return self.encoder.encode(response, EncodedMessageType.ARRAY, already_encoded = True)
 
+    @command(CommandEnum.WAIT, 3, CommandFlag.BLOCKING)
     def handle_wait_cmd(self, cmd_arr, socket: socket):
-        self.verify_args_len(CommandEnum.WAIT, 3, cmd_arr)
         no_of_replicas = int(cmd_arr[1])
         wait_ms = int(cmd_arr[2])
-        accum_bytes = False # Flag needed below to determi
-        
+
         # We havent sent any commands, so we always return no of replicas
         # regardless of args
         if not server_config.acked_commands:
-            processed = len(self.replicas)
-        else:
-            # some replicas are lagging behind, check if we need to send GETACK
-            if self.get_uptodate_replicas() < no_of_replicas:
-                cmd_to_send = ['REPLCONF', 'GETACK', '*']
-                for replica in self.replicas.get_all_replicas():
-                    replica.sendall(self.encoder.encode(cmd_to_send, EncodedMessageType.ARRAY))
-                accum_bytes = True
-            # We use a condition here to lock this thread until time expires or required number of
-            # replicas acknowledge they are up to date
-            with accum_lock:
-                accum_lock.wait_for(lambda : self.get_uptodate_replicas() >= no_of_replicas, wait_ms / 1000)
-                processed = self.get_uptodate_replicas()
-
-            if accum_bytes:
-                self.accum_proc(cmd_to_send)
-        socket.sendall(self.encoder.encode(str(processed).encode('utf-8'), EncodedMessageType.INTEGER))
-
-    def get_uptodate_replicas(self):
-        '''Check if any replicas are lagging behind, if any, we return the number, we do GETACK for all though'''
-        return len([x for x in server_config.acked_replicas.values() if x >= server_config.acked_commands])
+            return self.encoder.encode_int(len(self.replicas))
+
+        # replicas are up to date once they acked everything sent before WAIT,
+        # the GETACK below comes after that and isn't waited for
+        target = server_config.acked_commands
+        if self.get_uptodate_replicas(target) >= no_of_replicas:
+            return self.encoder.encode_int(self.get_uptodate_replicas(target))
+
+        self.propagate(['REPLCONF', 'GETACK', '*'])
+
+        def retry():
+            processed = self.get_uptodate_replicas(target)
+            return self.encoder.encode_int(processed) if processed >= no_of_replicas else None
 
+        self.replicas.ack_waiters.block(
+            socket, (REPLICA_ACK,), wait_ms, retry,
+            lambda: self.encoder.encode_int(self.get_uptodate_replicas(target))
+        )
+
+    def get_uptodate_replicas(self, offset: int):
+        '''Number of replicas that acked at least `offset` bytes.'''
+        return len([x for x in server_config.acked_replicas.values() if x >= offset])
+
+    @command(CommandEnum.XREAD, -4, CommandFlag.READONLY, CommandFlag.BLOCKING, CommandFlag.QUEUEABLE)
     def handle_xread_cmd(self, cmd_arr, socket: socket):
-        self.verify_args_len(CommandEnum.XREAD, 4, cmd_arr)
-        
-        cmd_arr = [decode(x) for x in cmd_arr]
+        args = self.parse_xread(cmd_arr)
+        if isinstance(args, bytes):
+            return args
+        streams, count, block = args['streams'], args['count'], args['block']
+        success, ids = self.storage.xread_ids(streams, args['ids'])
+        if not success:
+            return self.encoder.encode(ids, EncodedMessageType.ERROR)
 
-        # In a MULTI trx, queue cmd
-        if self.cmd_queue.in_transaction():
-            self.cmd_queue.add_command(cmd_arr)
-            return socket.sendall(QUEUED)
+        def read():
+            success, response = self.storage.xread(streams, ids, count)
+            if not success:
+                return self.encoder.encode(response, EncodedMessageType.ERROR)
+            if response:
+                return self.encoder.encode(response, EncodedMessageType.ARRAY)
+            return None
 
-        response = self.storage.xread(**self.parse_xread(cmd_arr))
-        if response:
-            msg = self.encoder.encode(response, EncodedMessageType.ARRAY)
-        else:
-            msg = self.encoder.encode('', EncodedMessageType.NULL_STR)
-        socket.sendall(msg)
-        return msg
+        reply = read()
+        if reply is not None or block is None:
+            return reply or self.encoder.null_bulk_str()
+        self.storage.blocking.block(socket, streams, block, read, self.encoder.null_bulk_str)
 
-    def handle_incr_cmd(self, cmd_arr, socket: socket, send_to_sock: bool):
-        if self.cmd_queue.in_transaction():
-            self.cmd_queue.add_command(cmd_arr)
-            return socket.sendall(QUEUED)
+    @command(CommandEnum.INCR, 2, CommandFlag.WRITE, CommandFlag.QUEUEABLE, keys=(1, 1, 1))
+    def handle_incr_cmd(self, cmd_arr, socket: socket):
+        success, response = self.storage.incr(cmd_arr[1].decode('utf-8'))
+        if not success:
+            return self.encoder.encode(response, EncodedMessageType.ERROR)
+        self.dirty += 1
+        return self.encoder.encode_int(response)
 
-        self.verify_args_len(CommandEnum.INCR, 2, cmd_arr)
-        key = cmd_arr[1].decode('utf-8')
-        value = self.storage.get(key)
-        to_send = None
-        try:
-            if not value:
-                value = 1
+    def parse_xread(self, cmd_arr: list[bytes]):
+        '''XREAD [COUNT count] [BLOCK ms] STREAMS key [key ...] id [id ...],
+        returns the storage.xread() kwargs or an encoded error.'''
+        count, block = None, None
+        idx = 1
+        while idx < len(cmd_arr):
+            option = cmd_arr[idx].lower()
+            if option == b'streams':
+                break
+            if option not in (b'count', b'block') or idx + 1 >= len(cmd_arr):
+                return self.encoder.encode('ERR syntax error', EncodedMessageType.ERROR)
+            try:
+                value = int(cmd_arr[idx + 1])
+            except ValueError:
+                return self.encoder.encode('ERR value is not an integer or out of range', EncodedMessageType.ERROR)
+            if option == b'count':
+                count = value if value > 0 else None
             else:
-                value = int(value)
-                value += 1
-            to_send = self.encoder.encode(value, EncodedMessageType.INTEGER)
-        except:
-            to_send = self.encoder.encode('ERR value is not an integer or out of range', EncodedMessageType.ERROR)
-        self.storage.set(key, str(value))
-        
-        if send_to_sock:
-            socket.sendall(to_send)
-        return to_send
-
-    def parse_xread(self, cmd_arr: list[str]):
-        streams_idx = cmd_arr.index('streams')
-
-        str_keys = cmd_arr[streams_idx+1:]
-        s_k_len = len(str_keys)
-        mid = s_k_len // 2
-        streams = str_keys[:mid]
-        keys = str_keys[mid:]
-        block_idx, block = None, None
-        
-        try:
-            block_idx = cmd_arr.index('block')
-        except ValueError:
-            pass
-        
-        if block_idx:
-            block = int(cmd_arr[block_idx+1])
+                if value < 0:
+                    return self.encoder.encode('ERR timeout is negative', EncodedMessageType.ERROR)
+                block = value
+            idx += 2
+
+        streams_and_ids = [decode(x) for x in cmd_arr[idx + 1:]]
+        if idx >= len(cmd_arr) or not streams_and_ids:
+            return self.encoder.encode('ERR syntax error', EncodedMessageType.ERROR)
+        if len(streams_and_ids) % 2:
+            return self.encoder.encode(
+                "ERR Unbalanced 'xread' list of streams: for each stream key an ID or '$' must be specified.",
+                EncodedMessageType.ERROR
+            )
+        mid = len(streams_and_ids) // 2
 
         return {
-            "streams": streams,
-            "keys": keys,
-            "block": block
+            "streams": streams_and_ids[:mid],
+            "ids": streams_and_ids[mid:],
+            # commands run by EXEC never block
+            "block": None if self.in_exec else block,
+            "count": count,
         }
 
+    @command(CommandEnum.XRANGE, -4, CommandFlag.READONLY, CommandFlag.QUEUEABLE, keys=(1, 1, 1))
     def handle_xrange_cmd(self, cmd_arr, socket: socket):
-        self.verify_args_len(CommandEnum.XRANGE, 4, cmd_arr)
-        if self.cmd_queue.in_transaction():
-            self.cmd_queue.add_command(cmd_arr)
-            return socket.sendall(QUEUED)
-        
-        cmd_arr = [decode(x) for x in cmd_arr]
-        response = self.storage.xrange(cmd_arr[1], cmd_arr[2], cmd_arr[3])
-        msg = self.encoder.encode(response, EncodedMessageType.ARRAY)
-        socket.sendall(msg)
-        return msg
+        count = None
+        if len(cmd_arr) > 4:
+            if len(cmd_arr) != 6 or cmd_arr[4].lower() != b'count':
+                return self.encoder.encode('ERR syntax error', EncodedMessageType.ERROR)
+            try:
+                count = int(cmd_arr[5])
+            except ValueError:
+                return self.encoder.encode('ERR value is not an integer or out of range', EncodedMessageType.ERROR)
+        success, response = self.storage.xrange(decode(cmd_arr[1]), decode(cmd_arr[2]), decode(cmd_arr[3]), count)
+        if not success:
+            return self.encoder.encode(response, EncodedMessageType.ERROR)
+        return self.encoder.encode(response, EncodedMessageType.ARRAY)
 
+    @command(CommandEnum.XADD, -5, CommandFlag.WRITE, CommandFlag.QUEUEABLE, keys=(1, 1, 1))
     def handle_xadd_cmd(self, cmd_arr, socket: socket):
-        self.verify_args_len(CommandEnum.XADD, 5, cmd_arr)
-        if self.cmd_queue.in_transaction():
-            self.cmd_queue.add_command(cmd_arr)
-            return socket.sendall(QUEUED)
-        
-        cmd_arr = [decode(x) for x in cmd_arr]
-        success, response = self.storage.xadd(cmd_arr[1], cmd_arr[2], cmd_arr[3], cmd_arr[4])
-        
+        fields = cmd_arr[3:]
+        if len(fields) % 2:
+            return self.encoder.encode("ERR wrong number of arguments for 'xadd' command", EncodedMessageType.ERROR)
+        success, response = self.storage.xadd(decode(cmd_arr[1]), decode(cmd_arr[2]), fields)
+
         if not success:
-            msg = self.encoder.encode(response, EncodedMessageType.ERROR)
-        else:
-            msg = self.encoder.encode(response, EncodedMessageType.BULK_STRING)
-        socket.sendall(msg)
-        return msg
-        
+            return self.encoder.encode(response, EncodedMessageType.ERROR)
+        self.dirty += 1
+        # replicas must store the entry under the id generated here
+        cmd_arr[2] = response.encode('utf-8')
+        return self.encoder.encode(response, EncodedMessageType.BULK_STRING)
+
+    @command(CommandEnum.PSYNC, -3)
     def handle_psync_cmd(self, cmd_arr, socket: socket):
-        self.verify_args_len(CommandEnum.PSYNC, 2, cmd_arr)
-        res = self.encoder.encode('FULLRESYNC 8371b4fb1155b71f4a04d3e1bc3e18c4a990aeeb 0', EncodedMessageType.SIMPLE_STRING)
-        full_db = b'$' + str(len(EMPTY_DB)).encode('utf-8') + BOUNDARY + EMPTY_DB
-        socket.sendall(res + full_db)
+        replid = decode(cmd_arr[1])
+        try:
+            offset = int(cmd_arr[2])
+        except ValueError:
+            offset = -1
+        backlog = self.replicas.backlog
+        can_continue = replid == server_config.replid and backlog is not None and backlog.can_continue(offset)
+
+        if can_continue:
+            # the replica only missed what is still in the backlog
+            self.replicas.add_replica(socket)
+            server_config.acked_replicas[socket.getpeername()] = offset - 1
+            res = self.encoder.encode(f'CONTINUE {server_config.replid}', EncodedMessageType.SIMPLE_STRING)
+            return res + backlog.read_from(offset)
 
+        server_config.acked_replicas[socket.getpeername()] = 0
+        # FULLRESYNC is sent once the snapshot child is forked
+        self.replicas.full_sync(socket)
+
+    @command(CommandEnum.REPLCONF, -2)
     def handle_replconf_cmd(self, cmd_arr, socket: socket):
-        self.verify_args_len(CommandEnum.REPLCONF, 2, cmd_arr)
         msg = self.encoder.encode('OK', EncodedMessageType.SIMPLE_STRING)
 
-        if cmd_arr[1].lower() == b'listening-port':
-            # A replica has connected to master, add to list of replicas,
-            # also maintain a map of replica to ack bytes.
-            self.replicas.add_replica(socket)
-            server_config.acked_replicas[socket.getpeername()] = 0
         if cmd_arr[1].lower() == b'ack':
-            acked_bytes = int(cmd_arr[2])
-            # acquire lock for thread, we send GETACKS in WAIT cmd, updated with
-            # latest replica offset, wakeup sleeping thread
-            with accum_lock:
-                peername = socket.getpeername()
-                server_config.acked_replicas[peername] = acked_bytes
-                accum_lock.notify_all()
+            server_config.acked_replicas[socket.getpeername()] = int(cmd_arr[2])
+            # WAITs blocked for this ack
+            self.replicas.ack_waiters.signal(REPLICA_ACK)
+            self.replicas.ack_waiters.serve_ready()
             msg = None
-        if msg:
-            socket.sendall(msg)
+        return msg
 
+    @command(CommandEnum.INFO, -1)
     def handle_info_cmd(self, cmd_arr, socket: socket):
-        return_vals = [
-            f'role:{ConfigNamespace.server_type}',
-            'master_replid:8371b4fb1155b71f4a04d3e1bc3e18c4a990aeeb',
-            'master_repl_offset:0',
+        sections = self.info_sections()
+        requested = [decode(x).lower() for x in cmd_arr[1:]]
+        if not requested or {'all', 'default', 'everything'} & set(requested):
+            requested = list(sections)
+
+        return_vals = []
+        for name in requested:
+            if name in sections:
+                return_vals.append(f'# {name.capitalize()}')
+                return_vals.extend(sections[name])
+        return self.encoder.encode('\n'.join(return_vals), EncodedMessageType.BULK_STRING)
+
+    def info_sections(self):
+        return {
+            'replication': [
+                f'role:{ConfigNamespace.server_type}',
+                f'connected_slaves:{len(self.replicas) if self.replicas is not None else 0}',
+                f'master_replid:{server_config.replid}',
+                f'master_repl_offset:{server_config.acked_commands}',
+                *self.backlog_info(),
+            ],
+            'persistence': self.persistence.info() if self.persistence is not None else [],
+            'stats': [
+                f'expired_keys:{self.keyspace.expired_keys}',
+                f'expire_cycle_cpu_milliseconds:{int(self.keyspace.expire_cycle_cpu * 1000)}',
+                f'client_output_buffer_limit_disconnections:{self.replicas.disconnected_for_output if self.replicas is not None else 0}',
+                f'lazyfree_pending_objects:{self.keyspace.lazyfree.pending}',
+                f'lazyfreed_objects:{self.keyspace.lazyfree.freed_objects}',
+            ],
+            'keyspace': [
+                f'db{db.id}:keys={db.dbsize()},expires={len(db.expires)},avg_ttl=0'
+                for db in self.keyspace.dbs if db.store
+            ],
+        }
+
+    @command(CommandEnum.SAVE, 1)
+    def handle_save_cmd(self, cmd_arr, socket: socket):
+        if self.persistence.bgsave_in_progress():
+            return self.encoder.encode('ERR Background save already in progress', EncodedMessageType.ERROR)
+        if not self.persistence.save():
+            return self.encoder.encode('ERR', EncodedMessageType.ERROR)
+        return self.encoder.encode('OK', EncodedMessageType.SIMPLE_STRING)
+
+    @command(CommandEnum.BGSAVE, -1)
+    def handle_bgsave_cmd(self, cmd_arr, socket: socket):
+        if self.persistence.bgsave_in_progress():
+            return self.encoder.encode('ERR Background save already in progress', EncodedMessageType.ERROR)
+        if self.persistence.aof_rewrite_in_progress():
+            return self.encoder.encode("ERR Another child process is active (AOF?): can't BGSAVE right now",
+                                       EncodedMessageType.ERROR)
+        if not self.persistence.bgsave():
+            return self.encoder.encode('ERR', EncodedMessageType.ERROR)
+        return self.encoder.encode('Background saving started', EncodedMessageType.SIMPLE_STRING)
+
+    @command(CommandEnum.BGREWRITEAOF, 1)
+    def handle_bgrewriteaof_cmd(self, cmd_arr, socket: socket):
+        if self.persistence.aof is None:
+            return self.encoder.encode('ERR Background append only file rewriting needs appendonly yes',
+                                       EncodedMessageType.ERROR)
+        if self.persistence.aof_rewrite_in_progress():
+            return self.encoder.encode('ERR Background append only file rewriting already in progress',
+                                       EncodedMessageType.ERROR)
+        if self.persistence.bgsave_in_progress():
+            # runs once the BGSAVE child is done
+            self.persistence.aof_rewrite_scheduled = True
+            return self.encoder.encode('Background append only file rewriting scheduled', EncodedMessageType.SIMPLE_STRING)
+        if not self.persistence.rewrite_aof():
+            return self.encoder.encode('ERR Background append only file rewriting failed', EncodedMessageType.ERROR)
+        return self.encoder.encode('Background append only file rewriting started', EncodedMessageType.SIMPLE_STRING)
+
+    @command(CommandEnum.LASTSAVE, 1)
+    def handle_lastsave_cmd(self, cmd_arr, socket: socket):
+        return self.encoder.encode_int(self.persistence.lastsave)
+
+    def backlog_info(self):
+        backlog = self.replicas.backlog if self.replicas is not None else None
+        if backlog is None:
+            return ['repl_backlog_active:0']
+        return [
+            'repl_backlog_active:1',
+            f'repl_backlog_size:{backlog.size}',
+            f'repl_backlog_first_byte_offset:{backlog.first_offset}',
+            f'repl_backlog_histlen:{backlog.histlen}',
         ]
-        socket.sendall(self.encoder.encode('\n'.join(return_vals), EncodedMessageType.BULK_STRING))
 
+    def parse_db_index(self, arg: bytes):
+        '''The db index `arg` names, or an encoded error.'''
+        try:
+            db = int(arg)
+        except ValueError:
+            return self.encoder.encode('ERR value is not an integer or out of range', EncodedMessageType.ERROR)
+        if not 0 <= db < len(self.keyspace):
+            return self.encoder.encode('ERR DB index is out of range', EncodedMessageType.ERROR)
+        return db
+
+    def parse_flush_mode(self, cmd_arr: list[bytes]):
+        '''Whether FLUSHDB or FLUSHALL is ASYNC, or an encoded error.'''
+        if len(cmd_arr) == 1:
+            return False
+        mode = cmd_arr[1].lower()
+        if len(cmd_arr) > 2 or mode not in (b'async', b'sync'):
+            return self.encoder.encode('ERR syntax error', EncodedMessageType.ERROR)
+        return mode == b'async'
+
+    @command(CommandEnum.SELECT, 2, CommandFlag.QUEUEABLE)
+    def handle_select_cmd(self, cmd_arr, socket: socket):
+        db = self.parse_db_index(cmd_arr[1])
+        if isinstance(db, bytes):
+            return db
+        self.select(db)
+        return self.encoder.encode('OK', EncodedMessageType.SIMPLE_STRING)
+
+    @command(CommandEnum.DBSIZE, 1, CommandFlag.READONLY, CommandFlag.QUEUEABLE)
+    def handle_dbsize_cmd(self, cmd_arr, socket: socket):
+        return self.encoder.encode_int(self.storage.dbsize())
+
+    @command(CommandEnum.SWAPDB, 3, CommandFlag.WRITE, CommandFlag.QUEUEABLE)
+    def handle_swapdb_cmd(self, cmd_arr, socket: socket):
+        dbs = [self.parse_db_index(arg) for arg in cmd_arr[1:]]
+        for db in dbs:
+            if isinstance(db, bytes):
+                return db
+        self.keyspace.swap(*dbs)
+        self.dirty += 1
+        return self.encoder.encode('OK', EncodedMessageType.SIMPLE_STRING)
+
+    @command(CommandEnum.FLUSHDB, -1, CommandFlag.WRITE, CommandFlag.QUEUEABLE)
+    def handle_flushdb_cmd(self, cmd_arr, socket: socket):
+        lazy = self.parse_flush_mode(cmd_arr)
+        if isinstance(lazy, bytes):
+            return lazy
+        self.keyspace.flush(self.db, lazy)
+        self.dirty += 1
+        return self.encoder.encode('OK', EncodedMessageType.SIMPLE_STRING)
+
+    @command(CommandEnum.FLUSHALL, -1, CommandFlag.WRITE, CommandFlag.QUEUEABLE)
+    def handle_flushall_cmd(self, cmd_arr, socket: socket):
+        lazy = self.parse_flush_mode(cmd_arr)
+        if isinstance(lazy, bytes):
+            return lazy
+        self.keyspace.flush(None, lazy)
+        self.dirty += 1
+        return self.encoder.encode('OK', EncodedMessageType.SIMPLE_STRING)
+
+    @command(CommandEnum.KEYS, 2, CommandFlag.READONLY, CommandFlag.QUEUEABLE)
     def handle_keys_cmd(self, cmd_arr, socket: socket):
-        self.verify_args_len(CommandEnum.KEYS, 2, cmd_arr)
-        if self.cmd_queue.in_transaction():
-            self.cmd_queue.add_command(cmd_arr)
-            return socket.sendall(QUEUED)
-        key_arg = cmd_arr[1]
-        if isinstance(key_arg, bytes):
-            key_arg = key_arg.decode('utf-8')
-        regex = re.compile(re.escape(key_arg).replace(r'\*', '.*').replace(r'\?', '.'))
-        matches = [s for s in self.storage.get_all_keys() if regex.match(s)]
-        matches = self.encoder.encode(matches, EncodedMessageType.ARRAY)
-        socket.sendall(matches)
-        return matches
+        return self.encoder.encode(self.storage.keys(decode(cmd_arr[1])), EncodedMessageType.ARRAY)
+
+    @command(CommandEnum.SCAN, -2, CommandFlag.READONLY, CommandFlag.QUEUEABLE)
+    def handle_scan_cmd(self, cmd_arr, socket: socket):
+        args = self.parse_scan(cmd_arr)
+        if isinstance(args, bytes):
+            return args
+        cursor, count, pattern, key_type = args
+        cursor, keys = self.storage.scan(cursor, count)
+        if pattern is not None:
+            matches = compile_glob(pattern).match
+            keys = [key for key in keys if matches(key)]
+        if key_type is not None:
+            keys = [key for key in keys if self.storage.get_type(key) == key_type]
+        return self.encoder.encode([b'%d' % cursor, keys], EncodedMessageType.ARRAY)
+
+    def parse_scan(self, cmd_arr: list[bytes]):
+        '''SCAN cursor [MATCH pattern] [COUNT count] [TYPE type], returns
+        (cursor, count, pattern, type) or an encoded error.'''
+        try:
+            cursor = int(cmd_arr[1])
+        except ValueError:
+            cursor = -1
+        if not 0 <= cursor < 1 << 64:
+            return self.encoder.encode('ERR invalid cursor', EncodedMessageType.ERROR)
+        count, pattern, key_type = 10, None, None
+        idx = 2
+        while idx < len(cmd_arr):
+            option = cmd_arr[idx].lower()
+            if option not in (b'match', b'count', b'type') or idx + 1 >= len(cmd_arr):
+                return self.encoder.encode('ERR syntax error', EncodedMessageType.ERROR)
+            value = cmd_arr[idx + 1]
+            if option == b'count':
+                try:
+                    count = int(value)
+                except ValueError:
+                    return self.encoder.encode('ERR value is not an integer or out of range', EncodedMessageType.ERROR)
+                if count < 1:
+                    return self.encoder.encode('ERR syntax error', EncodedMessageType.ERROR)
+            elif option == b'match':
+                # a lone * matches everything, no need to test the keys
+                pattern = decode(value) if value != b'*' else None
+            else:
+                key_type = decode(value).lower()
+            idx += 2
+        return cursor, count, pattern, key_type
+
+    @command(CommandEnum.LPUSH, -3, CommandFlag.WRITE, CommandFlag.QUEUEABLE, keys=(1, 1, 1))
+    def handle_lpush_cmd(self, cmd_arr, socket: socket):
+        return self.push(cmd_arr, left=True)
+
+    @command(CommandEnum.RPUSH, -3, CommandFlag.WRITE, CommandFlag.QUEUEABLE, keys=(1, 1, 1))
+    def handle_rpush_cmd(self, cmd_arr, socket: socket):
+        return self.push(cmd_arr, left=False)
+
+    def push(self, cmd_arr: list[bytes], left: bool):
+        success, response = self.storage.push(decode(cmd_arr[1]), cmd_arr[2:], left)
+        if not success:
+            return self.encoder.encode(response, EncodedMessageType.ERROR)
+        self.dirty += len(cmd_arr) - 2
+        return self.encoder.encode_int(response)
+
+    @command(CommandEnum.LPOP, -2, CommandFlag.WRITE, CommandFlag.QUEUEABLE, keys=(1, 1, 1))
+    def handle_lpop_cmd(self, cmd_arr, socket: socket):
+        return self.pop(cmd_arr, left=True)
 
+    @command(CommandEnum.RPOP, -2, CommandFlag.WRITE, CommandFlag.QUEUEABLE, keys=(1, 1, 1))
+    def handle_rpop_cmd(self, cmd_arr, socket: socket):
+        return self.pop(cmd_arr, left=False)
+
+    def pop(self, cmd_arr: list[bytes], left: bool):
+        '''LPOP and RPOP key [count]. Without a count the reply is the
+        element, with one an array of up to `count` elements.'''
+        if len(cmd_arr) > 3:
+            return self.encoder.encode('ERR syntax error', EncodedMessageType.ERROR)
+        count = None
+        if len(cmd_arr) == 3:
+            try:
+                count = int(cmd_arr[2])
+            except ValueError:
+                count = -1
+            if count < 0:
+                return self.encoder.encode('ERR value is out of range, must be positive', EncodedMessageType.ERROR)
+        success, response = self.storage.pop(decode(cmd_arr[1]), left, count)
+        if not success:
+            return self.encoder.encode(response, EncodedMessageType.ERROR)
+        if response is None:
+            return self.encoder.null_bulk_str() if count is None else self.encoder.null_array()
+        if count is None:
+            self.dirty += 1
+            return self.encoder.encode_bulk_msg(response)
+        self.dirty += len(response)
+        return self.encoder.encode_bulk_array(response)
+
+    @command(CommandEnum.LLEN, 2, CommandFlag.READONLY, CommandFlag.QUEUEABLE, keys=(1, 1, 1))
+    def handle_llen_cmd(self, cmd_arr, socket: socket):
+        try:
+            quicklist = self.storage.get_list(decode(cmd_arr[1]))
+        except WrongTypeError:
+            return WRONGTYPE
+        return self.encoder.encode_int(len(quicklist) if quicklist is not None else 0)
+
+    @command(CommandEnum.LINDEX, 3, CommandFlag.READONLY, CommandFlag.QUEUEABLE, keys=(1, 1, 1))
+    def handle_lindex_cmd(self, cmd_arr, socket: socket):
+        try:
+            idx = int(cmd_arr[2])
+        except ValueError:
+            return self.encoder.encode('ERR value is not an integer or out of range', EncodedMessageType.ERROR)
+        try:
+            quicklist = self.storage.get_list(decode(cmd_arr[1]))
+        except WrongTypeError:
+            return WRONGTYPE
+        element = quicklist.index(idx) if quicklist is not None else None
+        if element is None:
+            return self.encoder.null_bulk_str()
+        return self.encoder.encode_bulk_msg(element)
+
+    @command(CommandEnum.LRANGE, 4, CommandFlag.READONLY, CommandFlag.QUEUEABLE, keys=(1, 1, 1))
+    def handle_lrange_cmd(self, cmd_arr, socket: socket):
+        try:
+            start, stop = int(cmd_arr[2]), int(cmd_arr[3])
+        except ValueError:
+            return self.encoder.encode('ERR value is not an integer or out of range', EncodedMessageType.ERROR)
+        try:
+            quicklist = self.storage.get_list(decode(cmd_arr[1]))
+        except WrongTypeError:
+            return WRONGTYPE
+        return self.encoder.encode_bulk_array(quicklist.range(start, stop) if quicklist is not None else [])
+
+    @command(CommandEnum.BLPOP, -3, CommandFlag.WRITE, CommandFlag.BLOCKING, CommandFlag.QUEUEABLE, keys=(1, -2, 1))
+    def handle_blpop_cmd(self, cmd_arr, socket: socket):
+        return self.blocking_pop(cmd_arr, socket, left=True)
+
+    @command(CommandEnum.BRPOP, -3, CommandFlag.WRITE, CommandFlag.BLOCKING, CommandFlag.QUEUEABLE, keys=(1, -2, 1))
+    def handle_brpop_cmd(self, cmd_arr, socket: socket):
+        return self.blocking_pop(cmd_arr, socket, left=False)
+
+    def blocking_pop(self, cmd_arr: list[bytes], socket: socket, left: bool):
+        '''BLPOP and BRPOP key [key ...] timeout: pops from the first of the
+        keys that holds a list, or blocks until a push to one of them. A pop
+        is passed on as the LPOP or RPOP it amounts to, which replicas and
+        the AOF replay without blocking.'''
+        try:
+            timeout = float(cmd_arr[-1])
+            if not math.isfinite(timeout):
+                raise ValueError
+        except ValueError:
+            return self.encoder.encode('ERR timeout is not a float or out of range', EncodedMessageType.ERROR)
+        if timeout < 0:
+            return self.encoder.encode('ERR timeout is negative', EncodedMessageType.ERROR)
+        keys = [decode(key) for key in cmd_arr[1:-1]]
+        pop_cmd = b'LPOP' if left else b'RPOP'
+        storage, db = self.storage, self.db
+
+        def pop(skip_other_types: bool):
+            '''(key, element) from the first key that holds a list, None if
+            none does, the error if a key before it holds another type.'''
+            for key in keys:
+                success, element = storage.pop(key, left)
+                if not success:
+                    if skip_other_types:
+                        continue
+                    return element
+                if element is not None:
+                    return key, element
+            return None
+
+        popped = pop(skip_other_types=False)
+        if isinstance(popped, str):
+            return self.encoder.encode(popped, EncodedMessageType.ERROR)
+        if popped is not None:
+            key, element = popped
+            # what handle_cmd() propagates
+            cmd_arr[:] = [pop_cmd, key.encode()]
+            self.dirty += 1
+            return self.encoder.encode_bulk_array([key.encode(), element])
+        if self.in_exec:
+            # commands run by EXEC never block
+            return self.encoder.null_array()
+
+        def retry():
+            # a key set to another type meanwhile is skipped, not an error
+            popped = pop(skip_other_types=True)
+            if popped is None:
+                return None
+            key, element = popped
+            self.written([pop_cmd, key.encode()], db)
+            return self.encoder.encode_bulk_array([key.encode(), element])
+
+        timeout_ms = math.ceil(timeout * 1000)
+        storage.blocking.block(socket, keys, timeout_ms, retry, self.encoder.null_array)
+
+    @command(CommandEnum.HSET, -4, CommandFlag.WRITE, CommandFlag.QUEUEABLE, keys=(1, 1, 1))
+    def handle_hset_cmd(self, cmd_arr, socket: socket):
+        args = cmd_arr[2:]
+        if len(args) % 2:
+            return self.encoder.encode("ERR wrong number of arguments for 'hset' command", EncodedMessageType.ERROR)
+        success, response = self.storage.hset(decode(cmd_arr[1]), list(zip(args[0::2], args[1::2])))
+        if not success:
+            return self.encoder.encode(response, EncodedMessageType.ERROR)
+        self.dirty += len(args) // 2
+        return self.encoder.encode_int(response)
+
+    @command(CommandEnum.HGET, 3, CommandFlag.READONLY, CommandFlag.QUEUEABLE, keys=(1, 1, 1))
+    def handle_hget_cmd(self, cmd_arr, socket: socket):
+        try:
+            hash = self.storage.get_hash(decode(cmd_arr[1]))
+        except WrongTypeError:
+            return WRONGTYPE
+        value = hash.get(cmd_arr[2]) if hash is not None else None
+        if value is None:
+            return self.encoder.null_bulk_str()
+        if isinstance(value, int):
+            return self.encoder.encode_int_bulk(value)
+        return self.encoder.encode_bulk_msg(value)
+
+    @command(CommandEnum.HGETALL, 2, CommandFlag.READONLY, CommandFlag.QUEUEABLE, keys=(1, 1, 1))
+    def handle_hgetall_cmd(self, cmd_arr, socket: socket):
+        try:
+            hash = self.storage.get_hash(decode(cmd_arr[1]))
+        except WrongTypeError:
+            return WRONGTYPE
+        if hash is None:
+            return self.encoder.encode_bulk_array([])
+        reply = []
+        for field, value in hash.items():
+            reply += (field, b'%d' % value if isinstance(value, int) else value)
+        return self.encoder.encode_bulk_array(reply)
+
+    @command(CommandEnum.HINCRBY, 4, CommandFlag.WRITE, CommandFlag.QUEUEABLE, keys=(1, 1, 1))
+    def handle_hincrby_cmd(self, cmd_arr, socket: socket):
+        try:
+            by = int(cmd_arr[3])
+            if not INT64_MIN <= by <= INT64_MAX:
+                raise ValueError
+        except ValueError:
+            return self.encoder.encode('ERR value is not an integer or out of range', EncodedMessageType.ERROR)
+        success, response = self.storage.hincrby(decode(cmd_arr[1]), cmd_arr[2], by)
+        if not success:
+            return self.encoder.encode(response, EncodedMessageType.ERROR)
+        self.dirty += 1
+        return self.encoder.encode_int(response)
+
+    @command(CommandEnum.HDEL, -3, CommandFlag.WRITE, CommandFlag.QUEUEABLE, keys=(1, 1, 1))
+    def handle_hdel_cmd(self, cmd_arr, socket: socket):
+        success, response = self.storage.hdel(decode(cmd_arr[1]), cmd_arr[2:])
+        if not success:
+            return self.encoder.encode(response, EncodedMessageType.ERROR)
+        self.dirty += response
+        return self.encoder.encode_int(response)
+
+    @command(CommandEnum.HLEN, 2, CommandFlag.READONLY, CommandFlag.QUEUEABLE, keys=(1, 1, 1))
+    def handle_hlen_cmd(self, cmd_arr, socket: socket):
+        try:
+            hash = self.storage.get_hash(decode(cmd_arr[1]))
+        except WrongTypeError:
+            return WRONGTYPE
+        return self.encoder.encode_int(len(hash) if hash is not None else 0)
+
+    def parse_zadd(self, cmd_arr: list[bytes]):
+        '''ZADD key [NX|XX] [GT|LT] [CH] [INCR] score member [score member ...],
+        returns the storage.zadd() kwargs and CH, or an encoded error.'''
+        flags = set()
+        idx = 2
+        while idx < len(cmd_arr) and cmd_arr[idx].lower() in (b'nx', b'xx', b'gt', b'lt', b'ch', b'incr'):
+            flags.add(cmd_arr[idx].lower().decode())
+            idx += 1
+        args = cmd_arr[idx:]
+        if not args or len(args) % 2:
+            return self.encoder.encode('ERR syntax error', EncodedMessageType.ERROR)
+        if 'nx' in flags and 'xx' in flags:
+            return self.encoder.encode('ERR XX and NX options at the same time are not compatible', EncodedMessageType.ERROR)
+        if ('gt' in flags and 'lt' in flags) or ('nx' in flags and ('gt' in flags or 'lt' in flags)):
+            return self.encoder.encode('ERR GT, LT, and/or NX options at the same time are not compatible',
+                                       EncodedMessageType.ERROR)
+        if 'incr' in flags and len(args) > 2:
+            return self.encoder.encode('ERR INCR option supports a single increment-element pair', EncodedMessageType.ERROR)
+        try:
+            pairs = [(parse_score(args[idx]), args[idx + 1]) for idx in range(0, len(args), 2)]
+        except InvalidScore as e:
+            return self.encoder.encode(str(e), EncodedMessageType.ERROR)
+        ch = 'ch' in flags
+        flags.discard('ch')
+        return pairs, flags, ch
+
+    @command(CommandEnum.ZADD, -4, CommandFlag.WRITE, CommandFlag.QUEUEABLE, keys=(1, 1, 1))
+    def handle_zadd_cmd(self, cmd_arr, socket: socket):
+        args = self.parse_zadd(cmd_arr)
+        if isinstance(args, bytes):
+            return args
+        pairs, flags, ch = args
+        success, response = self.storage.zadd(decode(cmd_arr[1]), pairs, **{flag: True for flag in flags})
+        if not success:
+            return self.encoder.encode(response, EncodedMessageType.ERROR)
+        added, changed, score = response
+        self.dirty += added + changed
+        if 'incr' in flags:
+            return self.encoder.null_bulk_str() if score is None else self.encoder.encode_bulk_msg(format_score(score))
+        return self.encoder.encode_int(added + changed if ch else added)
+
+    @command(CommandEnum.ZREM, -3, CommandFlag.WRITE, CommandFlag.QUEUEABLE, keys=(1, 1, 1))
+    def handle_zrem_cmd(self, cmd_arr, socket: socket):
+        success, response = self.storage.zrem(decode(cmd_arr[1]), cmd_arr[2:])
+        if not success:
+            return self.encoder.encode(response, EncodedMessageType.ERROR)
+        self.dirty += response
+        return self.encoder.encode_int(response)
+
+    @command(CommandEnum.ZSCORE, 3, CommandFlag.READONLY, CommandFlag.QUEUEABLE, keys=(1, 1, 1))
+    def handle_zscore_cmd(self, cmd_arr, socket: socket):
+        try:
+            zset = self.storage.get_zset(decode(cmd_arr[1]))
+        except WrongTypeError:
+            return WRONGTYPE
+        score = zset.score(cmd_arr[2]) if zset is not None else None
+        if score is None:
+            return self.encoder.null_bulk_str()
+        return self.encoder.encode_bulk_msg(format_score(score))
+
+    @command(CommandEnum.ZCARD, 2, CommandFlag.READONLY, CommandFlag.QUEUEABLE, keys=(1, 1, 1))
+    def handle_zcard_cmd(self, cmd_arr, socket: socket):
+        try:
+            zset = self.storage.get_zset(decode(cmd_arr[1]))
+        except WrongTypeError:
+            return WRONGTYPE
+        return self.encoder.encode_int(len(zset) if zset is not None else 0)
+
+    @command(CommandEnum.ZRANK, -3, CommandFlag.READONLY, CommandFlag.QUEUEABLE, keys=(1, 1, 1))
+    def handle_zrank_cmd(self, cmd_arr, socket: socket):
+        return self.zrank(cmd_arr, reverse=False)
+
+    @command(CommandEnum.ZREVRANK, -3, CommandFlag.READONLY, CommandFlag.QUEUEABLE, keys=(1, 1, 1))
+    def handle_zrevrank_cmd(self, cmd_arr, socket: socket):
+        return self.zrank(cmd_arr, reverse=True)
+
+    def zrank(self, cmd_arr: list[bytes], reverse: bool):
+        '''ZRANK and ZREVRANK key member [WITHSCORE].'''
+        if len(cmd_arr) > 4 or (len(cmd_arr) == 4 and cmd_arr[3].lower() != b'withscore'):
+            return self.encoder.encode('ERR syntax error', EncodedMessageType.ERROR)
+        try:
+            zset = self.storage.get_zset(decode(cmd_arr[1]))
+        except WrongTypeError:
+            return WRONGTYPE
+        rank = zset.rank(cmd_arr[2]) if zset is not None else None
+        if rank is None:
+            return self.encoder.null_bulk_str()
+        if reverse:
+            rank = len(zset) - 1 - rank
+        if len(cmd_arr) == 3:
+            return self.encoder.encode_int(rank)
+        score = self.encoder.encode_bulk_msg(format_score(zset.score(cmd_arr[2])))
+        return self.encoder.encode_array([self.encoder.encode_int(rank), score], already_encoded=True)
+
+    @command(CommandEnum.ZRANGE, -4, CommandFlag.READONLY, CommandFlag.QUEUEABLE, keys=(1, 1, 1))
+    def handle_zrange_cmd(self, cmd_arr, socket: socket):
+        return self.zrange(cmd_arr, (b'byscore', b'rev', b'limit', b'withscores'))
+
+    @command(CommandEnum.ZRANGEBYSCORE, -4, CommandFlag.READONLY, CommandFlag.QUEUEABLE, keys=(1, 1, 1))
+    def handle_zrangebyscore_cmd(self, cmd_arr, socket: socket):
+        return self.zrange(cmd_arr, (b'limit', b'withscores'), by_score=True)
+
+    def zrange(self, cmd_arr: list[bytes], options: tuple[bytes, ...], by_score: bool = False):
+        '''ZRANGE key start stop [BYSCORE] [REV] [LIMIT offset count] [WITHSCORES],
+        and ZRANGEBYSCORE, which takes LIMIT and WITHSCORES. With REV and
+        BYSCORE the range is given as max then min.'''
+        reverse = withscores = False
+        offset, count = 0, -1
+        limit = False
+        idx = 4
+        while idx < len(cmd_arr):
+            option = cmd_arr[idx].lower()
+            if option not in options:
+                return self.encoder.encode('ERR syntax error', EncodedMessageType.ERROR)
+            if option == b'limit':
+                if idx + 2 >= len(cmd_arr):
+                    return self.encoder.encode('ERR syntax error', EncodedMessageType.ERROR)
+                try:
+                    offset, count = int(cmd_arr[idx + 1]), int(cmd_arr[idx + 2])
+                except ValueError:
+                    return self.encoder.encode('ERR value is not an integer or out of range', EncodedMessageType.ERROR)
+                limit = True
+                idx += 2
+            elif option == b'byscore':
+                by_score = True
+            elif option == b'rev':
+                reverse = True
+            else:
+                withscores = True
+            idx += 1
+        if limit and not by_score:
+            return self.encoder.encode('ERR syntax error, LIMIT is only supported in combination with either BYSCORE or BYLEX',
+                                       EncodedMessageType.ERROR)
+
+        try:
+            if by_score:
+                low, high = (cmd_arr[3], cmd_arr[2]) if reverse else (cmd_arr[2], cmd_arr[3])
+                minimum, min_exclusive = parse_score_bound(low)
+                maximum, max_exclusive = parse_score_bound(high)
+            else:
+                start, stop = int(cmd_arr[2]), int(cmd_arr[3])
+        except InvalidScore as e:
+            return self.encoder.encode(str(e), EncodedMessageType.ERROR)
+        except ValueError:
+            return self.encoder.encode('ERR value is not an integer or out of range', EncodedMessageType.ERROR)
+        try:
+            zset = self.storage.get_zset(decode(cmd_arr[1]))
+        except WrongTypeError:
+            return WRONGTYPE
+        if zset is None:
+            return self.encoder.encode_bulk_array([])
+
+        if by_score:
+            pairs = zset.range_by_score(minimum, min_exclusive, maximum, max_exclusive, offset, count, reverse)
+        else:
+            pairs = zset.range_by_rank(start, stop, reverse)
+        if withscores:
+            reply = [x for score, member in pairs for x in (member, format_score(score))]
+        else:
+            reply = [member for _, member in pairs]
+        return self.encoder.encode_bulk_array(reply)
+
+    @command(CommandEnum.CONFIG, -3)
     def handle_config_cmd(self, cmd_arr, socket: socket):
-        self.verify_args_len(CommandEnum.CONFIG, 3, cmd_arr)
         config_type = cmd_arr[1].lower()
 
         if config_type == b'get':
@@ -343,108 +1056,100 @@ class Command:
 
     def handle_config_get(self, key, socket: socket):
         value = getattr(ConfigNamespace, key, None)
-        res = self.encoder.encode([key, value], EncodedMessageType.ARRAY)
-        socket.sendall(res)
-        return res
+        return self.encoder.encode([key, value], EncodedMessageType.ARRAY)
 
-    def handle_get_cmd(self, cmd_arr, socket: socket, send_to_sock: bool):
-        self.verify_args_len(CommandEnum.GET, 2, cmd_arr)
-        if self.cmd_queue.in_transaction():
-            self.cmd_queue.add_command(cmd_arr)
-            return socket.sendall(QUEUED)
-        msg = self.storage.get(cmd_arr[1].decode('utf-8'))
-        if msg is None:
-            msg = self.encoder.encode('', EncodedMessageType.NULL_STR)
-        else:
-            msg = self.encoder.encode(msg, EncodedMessageType.BULK_STRING)
-        if send_to_sock:
-            socket.sendall(msg)
-        return msg
-        
+    @command(CommandEnum.GET, 2, CommandFlag.READONLY, CommandFlag.QUEUEABLE, keys=(1, 1, 1))
+    def handle_get_cmd(self, cmd_arr, socket: socket):
+        value = self.storage.get(cmd_arr[1].decode('utf-8'))
+        if value is None:
+            return self.encoder.null_bulk_str()
+        if isinstance(value, bytes):
+            return self.encoder.encode_bulk_msg(value)
+        if isinstance(value, int):
+            return self.encoder.encode_int_bulk(value)
+        return WRONGTYPE
+
+    @command(CommandEnum.DEL, -2, CommandFlag.WRITE, CommandFlag.QUEUEABLE, keys=(1, -1, 1))
+    def handle_del_cmd(self, cmd_arr, socket: socket):
+        removed = 0
+        for key in cmd_arr[1:]:
+            key = decode(key)
+            # an expired key isn't there to remove
+            if self.storage.get(key) is not None:
+                removed += self.storage.delete(key)
+        self.dirty += removed
+        return self.encoder.encode_int(removed)
+
+    @command(CommandEnum.TYPE, 2, CommandFlag.READONLY, CommandFlag.QUEUEABLE, keys=(1, 1, 1))
     def handle_get_type_cmd(self, cmd_arr, socket: socket):
-        self.verify_args_len(CommandEnum.GET, 2, cmd_arr)
-        if self.cmd_queue.in_transaction():
-            self.cmd_queue.add_command(cmd_arr)
-            return socket.sendall(QUEUED)
         msg = self.storage.get_type(cmd_arr[1].decode('utf-8'))
         if msg is None:
-            msg = self.encoder.encode('', EncodedMessageType.NULL_STR)
-        else:
-            msg = self.encoder.encode(msg, EncodedMessageType.SIMPLE_STRING)
-        socket.sendall(msg)
-        return msg
-    
+            return self.encoder.encode('', EncodedMessageType.NULL_STR)
+        return self.encoder.encode(msg, EncodedMessageType.SIMPLE_STRING)
+
     def parse_set_args(self, cmd_arr):
         # list of args for SET cmd, we return a dict
         args_dict = {}
-        cmd_arr = [b.decode('utf-8') for b in cmd_arr]
-        other_args: list = [x.lower() if isinstance(x, str) else x for x in cmd_arr[3:]]
+        # only options are decoded, the value may be any bytes
+        other_args: list = [b.decode('utf-8').lower() for b in cmd_arr[3:]]
         for cmd in SET_ARGS:
             if cmd in other_args:
                 idx = other_args.index(cmd)
                 args_dict[cmd] = other_args[idx+1]
         return args_dict
 
-    def handle_set_cmd(self, cmd_arr, socket: socket, send_to_sock):
-        self.verify_args_len(CommandEnum.SET, 3, cmd_arr)
-        if self.cmd_queue.in_transaction():
-            self.cmd_queue.add_command(cmd_arr)
-            return socket.sendall(QUEUED)
+    @command(CommandEnum.SET, -3, CommandFlag.WRITE, CommandFlag.QUEUEABLE, keys=(1, 1, 1))
+    def handle_set_cmd(self, cmd_arr, socket: socket):
         other_args = self.parse_set_args(cmd_arr)
         resp = self.storage.set(cmd_arr[1], cmd_arr[2], **other_args)
-        msg = self.encoder.encode(resp, EncodedMessageType.SIMPLE_STRING)
-        self.accum_proc(cmd_arr)
-        if send_to_sock:
-            socket.sendall(msg)
-        return msg
+        self.dirty += 1
+        return self.encoder.encode(resp, EncodedMessageType.SIMPLE_STRING)
 
-    def handle_echo_cmd(self, cmd_arr, socket: socket, send_to_sock: bool):
-        self.verify_args_len(CommandEnum.ECHO, 2, cmd_arr)
-        if self.cmd_queue.in_transaction():
-            self.cmd_queue.add_command(cmd_arr)
-            return socket.sendall(QUEUED)
+    @command(CommandEnum.ECHO, 2, CommandFlag.QUEUEABLE)
+    def handle_echo_cmd(self, cmd_arr, socket: socket):
         encoded_msg = self.encoder.encode(cmd_arr[1], EncodedMessageType.BULK_STRING)
         if encoded_msg is None:
             raise CantEncodeMessage(f'Cant encode message.')
-        if send_to_sock:
-            socket.sendall(encoded_msg)
         return encoded_msg
 
-    def handle_ping_cmd(self, socket: socket):
-        self.accum_proc([b'PING'])
+    @command(CommandEnum.PING, -1)
+    def handle_ping_cmd(self, cmd_arr, socket: socket):
+        return self.encoder.encode('PONG', EncodedMessageType.SIMPLE_STRING)
 
 class MasterCommand(Command):
 
-    def __init__(self, *, encoder: RespEncoder = None, storage: RedisDB = None, replicas: Replicas | None = None) -> None:
-        super().__init__(encoder=encoder, storage=storage, replicas=replicas)
+    def __init__(self, *, encoder: RespEncoder = None, keyspace: Keyspace = None, replicas: Replicas | None = None,
+                 persistence: Persistence | None = None) -> None:
+        super().__init__(encoder=encoder, keyspace=keyspace, replicas=replicas, persistence=persistence)
 
-    def handle_set_cmd(self, cmd_arr, socket: socket, send_to_sock):
-        msg = super().handle_set_cmd(cmd_arr, socket, send_to_sock)
-        for replica in self.replicas.get_all_replicas():
-            replica.sendall(self.encoder.encode(cmd_arr, EncodedMessageType.ARRAY))
-        return msg
-    
-    def handle_ping_cmd(self, socket: socket):
-        # Initially, replica sends PING cmd to master during handshake phase,
-        # we dont need to add to processed bytes for master
-        if server_config.finished_handshake:
-            super().handle_ping_cmd(socket)
-        socket.sendall(self.encoder.encode('PONG', EncodedMessageType.SIMPLE_STRING))
+    def propagate(self, cmd_arr: list[bytes], db: int | None = None):
+        self.replicas.feed(self.encoder.encode(cmd_arr, EncodedMessageType.ARRAY), db)
 
 class ReplicaCommand(Command):
 
-    def __init__(self, *, encoder: RespEncoder = None, storage: RedisDB = None) -> None:
-        super().__init__(encoder=encoder, storage=storage)
+    def __init__(self, *, encoder: RespEncoder = None, keyspace: Keyspace = None, persistence: Persistence | None = None) -> None:
+        super().__init__(encoder=encoder, keyspace=keyspace, persistence=persistence)
+        # the master only sends SELECT when its stream changes db, a link
+        # that resumes the stream after a reconnect carries on in its db
+        self.select(server_config.master_db)
+
+    def select(self, db: int):
+        super().select(db)
+        server_config.master_db = db
+
+    def handle_cmd(self, command_arr: list[bytes], socket: socket, send_to_sock = True):
+        if isinstance(command_arr, bytes) and command_arr.startswith(MAGIC_STR):
+            # the snapshot sent on a full sync
+            self.keyspace.load_snapshot(command_arr)
+            return None
+        # commands from the master are never answered, GETACK replies by itself
+        msg = super().handle_cmd(command_arr, socket, False)
+        # what EXEC runs was counted when it came in queued
+        if isinstance(command_arr, list) and not self.in_exec:
+            self.accum_proc(command_arr)
+        return msg
 
     def handle_replconf_cmd(self, cmd_arr, socket: socket):
-        proc_bytes = server_config.acked_commands
-        self.accum_proc(cmd_arr)
         if cmd_arr[1].lower() == b'getack':
-            msg = self.encoder.encode([CommandEnum.REPLCONF, 'ACK', proc_bytes], EncodedMessageType.ARRAY)
+            msg = self.encoder.encode([CommandEnum.REPLCONF, 'ACK', server_config.acked_commands], EncodedMessageType.ARRAY)
             socket.sendall(msg)
-
-    def handle_set_cmd(self, cmd_arr, socket: socket, send_to_sock):
-        # SET handling cmd in replica should not send reply to master
-        return super().handle_set_cmd(cmd_arr, socket, False)
-
-EMPTY_DB = bytes.fromhex("524544495330303131fa0972656469732d76657205372e322e30fa0a72656469732d62697473c040fa056374696d65c26d08bc65fa08757365642d6d656dc2b0c41000fa08616f662d62617365c000fff06e3bfec0ff5aa2")
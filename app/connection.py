@@ -0,0 +1,161 @@
+from collections import deque
+
+from app import clock
+from app.resp_parser import RespParser
+from app.commands import Command
+from app.handshake import Handshake, HandShakeStates
+
+
+class Connection:
+    '''A connection in either io mode, and the "socket" command handlers reply to.
+
+    Commands run inline on the event loop. Their replies are appended to `out`
+    and written once the whole batch parsed from a read has run, so 100
+    pipelined GETs cost one write instead of 100. Anything sent outside of a
+    batch, like commands propagated to a replica, is written once per loop
+    iteration. Subclasses implement flush() for their transport.
+
+    A command that blocks, like XREAD BLOCK, parks a waiter and replies
+    later. Until then commands pipelined after it stay in `pending`.'''
+    # stop reading from a client while this much output is queued for it
+    OUT_HIGH_WATER = 1024 * 1024
+
+    def __init__(self, cmd_parser: Command) -> None:
+        self.parser = RespParser()
+        self.cmd_parser = cmd_parser
+        self.out = bytearray()
+        # commands parsed but not yet run, only non-empty while blocked
+        self.pending = deque()
+        self.waiter = None
+        self.in_batch = False
+        self.flush_scheduled = False
+        self.closed = False
+        self.loop = None
+        # called once buffered output has drained, see when_drained()
+        self.drain_callback = None
+
+    def attach(self, loop):
+        self.loop = loop
+
+    @property
+    def blocked(self):
+        return self.waiter is not None
+
+    def data_received(self, data: bytes):
+        self.messages_received(self.parser.parse_multiple(data))
+
+    def messages_received(self, messages: list):
+        self.pending.extend(messages)
+        self.run_pending()
+
+    def run_pending(self):
+        clock.tick()
+        self.in_batch = True
+        try:
+            while self.pending and not self.blocked and not self.closed:
+                self.handle_cmd(self.pending.popleft())
+        finally:
+            self.in_batch = False
+        persistence = self.cmd_parser.persistence
+        if persistence is not None and persistence.holds_replies():
+            # appendfsync always: the AOF flush is already scheduled, the
+            # replies go out after it, once the writes are on disk
+            if not self.flush_scheduled:
+                self.flush_scheduled = True
+                self.loop.call_soon(self.flush)
+        else:
+            self.flush()
+
+    def block(self, waiter):
+        self.waiter = waiter
+
+    def unblock(self):
+        '''Called once the waiter replied, runs what was pipelined after it.'''
+        self.waiter = None
+        if self.pending:
+            self.loop.call_soon(self.run_pending)
+
+    def connection_closed(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.waiter is not None:
+            self.waiter.cancel()
+
+    def handle_cmd(self, cmd: list[bytes]):
+        try:
+            self.cmd_parser.handle_cmd(cmd, self)
+        except Exception as e:
+            print(f"Exception while handling {cmd}: {e}")
+
+    def sendall(self, data: bytes):
+        if self.closed:
+            return
+        self.out += data
+        if not self.in_batch and not self.flush_scheduled:
+            self.flush_scheduled = True
+            self.loop.call_soon(self.flush)
+
+    def when_drained(self, callback):
+        '''Runs `callback` once the output flushed so far was taken by the
+        kernel, for producers like an RDB transfer that must not queue more
+        than the peer reads.'''
+        if self.closed:
+            return
+        if self.write_backed_up():
+            self.drain_callback = callback
+        else:
+            self.loop.call_soon(callback)
+
+    def drained(self):
+        callback, self.drain_callback = self.drain_callback, None
+        if callback is not None:
+            callback()
+
+    def flush(self):
+        raise NotImplementedError
+
+    def write_backed_up(self):
+        raise NotImplementedError
+
+    def output_size(self):
+        '''Bytes of output queued and not yet taken by the kernel.'''
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+    def getpeername(self):
+        raise NotImplementedError
+
+
+class MasterLink:
+    '''Mixed into the connection a replica holds to its master. Drives the
+    handshake and then applies the replication stream. When the link drops
+    it reconnects, and PSYNC resumes from the master's backlog if the master
+    still has what was missed.'''
+    RECONNECT_DELAY = 1
+
+    def start_handshake(self):
+        Handshake.state = HandShakeStates.INIT
+        ping_encoded = Handshake.handle_stage()
+        if ping_encoded:
+            self.sendall(ping_encoded)
+
+    def messages_received(self, messages: list):
+        if not messages:
+            return
+        res = Handshake.handle_stage(messages[0])
+        if res and res != HandShakeStates.END:
+            self.sendall(res)
+        else:
+            super().messages_received(messages)
+
+    def connection_closed(self):
+        if self.closed:
+            return
+        super().connection_closed()
+        self.loop.call_later(self.RECONNECT_DELAY, self.reconnect)
+
+    def reconnect(self):
+        raise NotImplementedError
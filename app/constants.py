@@ -1,10 +1,11 @@
 
 BOUNDARY = b'\r\n'
 NULL_BULK_STR = b'$-1'
+NULL_ARRAY = b'*-1'
 STRING = b'+'
 BULK_STRING = b'$'
 ARRAY = b'*'
 INTEGER = b':'
 ERR = b'-'
 MAGIC_STR = b'\x52\x45\x44\x49\x53'
-SET_ARGS = ['px']
+SET_ARGS = ['px', 'pxat']
@@ -0,0 +1,113 @@
+'''The CRC-64 Redis puts at the end of RDB files, the Jones polynomial,
+reflected, with no initial or final xor.
+
+A byte at a time in Python runs at a few MB/s, too slow to check a large
+dump on startup. Large inputs are cut into LANES parts instead, whose CRCs
+are computed side by side: the byte each part is at is gathered with a
+strided slice, and the table lookup for all of them is a bytes.translate()
+per byte of the CRC, so the per byte work happens in C. With no initial or
+final xor the CRC is linear, and the parts' CRCs are combined by moving
+each past the bytes that follow it, like zlib's crc32_combine().'''
+import struct
+
+POLY = 0x95AC9329AC4BC9B5
+# parts a large input is cut into, and the size under which it isn't
+LANES = 4096
+MIN_LANES_SIZE = 64 * LANES
+
+
+def _make_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ POLY if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+TABLE = _make_table()
+# byte j of each TABLE entry, for bytes.translate()
+TABLE_BYTES = [bytes((crc >> 8 * j) & 0xFF for crc in TABLE) for j in range(8)]
+
+
+def _crc64_bytewise(data, crc: int) -> int:
+    table = TABLE
+    for b in data:
+        crc = table[(crc ^ b) & 0xFF] ^ (crc >> 8)
+    return crc
+
+
+def _apply(matrix: list[int], vector: int) -> int:
+    '''The GF(2) product of the 64x64 `matrix`, as its columns, and `vector`.'''
+    result = 0
+    i = 0
+    while vector:
+        if vector & 1:
+            result ^= matrix[i]
+        vector >>= 1
+        i += 1
+    return result
+
+
+def _zeros_tables(n: int) -> list[list[int]]:
+    '''Eight tables of 256 whose lookups of a CRC's bytes, xored, give the
+    CRC carried on over `n` zero bytes.'''
+    # the matrix of one zero byte, squared into that of n
+    step = [_crc64_bytewise(b'\0', 1 << i) for i in range(64)]
+    matrix = None
+    while n:
+        if n & 1:
+            matrix = step if matrix is None else [_apply(step, column) for column in matrix]
+        n >>= 1
+        if n:
+            step = [_apply(step, column) for column in step]
+    tables = []
+    for j in range(8):
+        table = [0] * 256
+        for bit in range(8):
+            column = matrix[8 * j + bit]
+            for b in range(1 << bit):
+                table[b | 1 << bit] = table[b] ^ column
+        tables.append(table)
+    return tables
+
+
+def _crc64_lanes(data: memoryview, crc: int) -> int:
+    lanes = LANES
+    # lanes are a whole number of 8 byte words, gathered a word at a time
+    words = len(data) // lanes // 8
+    end = 8 * words * lanes
+    gather = data[:end].cast('Q')
+    # p<j> holds byte j of the CRC of every lane, lane k in byte k
+    p0 = p1 = p2 = p3 = p4 = p5 = p6 = p7 = 0
+    from_bytes = int.from_bytes
+    b0, b1, b2, b3, b4, b5, b6, b7 = TABLE_BYTES
+    for word in range(words):
+        gathered = gather[word::words].tobytes()
+        for byte in range(8):
+            idx = (p0 ^ from_bytes(gathered[byte::8], 'little')).to_bytes(lanes, 'little')
+            p0 = from_bytes(idx.translate(b0), 'little') ^ p1
+            p1 = from_bytes(idx.translate(b1), 'little') ^ p2
+            p2 = from_bytes(idx.translate(b2), 'little') ^ p3
+            p3 = from_bytes(idx.translate(b3), 'little') ^ p4
+            p4 = from_bytes(idx.translate(b4), 'little') ^ p5
+            p5 = from_bytes(idx.translate(b5), 'little') ^ p6
+            p6 = from_bytes(idx.translate(b6), 'little') ^ p7
+            p7 = from_bytes(idx.translate(b7), 'little')
+    interleaved = bytearray(8 * lanes)
+    for j, plane in enumerate((p0, p1, p2, p3, p4, p5, p6, p7)):
+        interleaved[j::8] = plane.to_bytes(lanes, 'little')
+    t0, t1, t2, t3, t4, t5, t6, t7 = _zeros_tables(8 * words)
+    for lane_crc, in struct.iter_unpack('<Q', interleaved):
+        crc = (t0[crc & 0xFF] ^ t1[crc >> 8 & 0xFF] ^ t2[crc >> 16 & 0xFF] ^ t3[crc >> 24 & 0xFF] ^
+               t4[crc >> 32 & 0xFF] ^ t5[crc >> 40 & 0xFF] ^ t6[crc >> 48 & 0xFF] ^ t7[crc >> 56]) ^ lane_crc
+    return _crc64_bytewise(data[end:], crc)
+
+
+def crc64(data: bytes, crc: int = 0) -> int:
+    '''CRC of `data`, carrying on from `crc` when computing it in parts.'''
+    data = memoryview(data).cast('B')
+    if len(data) < MIN_LANES_SIZE:
+        return _crc64_bytewise(data, crc)
+    return _crc64_lanes(data, crc)
@@ -0,0 +1,48 @@
+from app import clock
+from app.persistence import Persistence
+from app.replicas import Replicas
+from app.storage import Keyspace
+
+
+class ServerCron:
+    '''Background work that runs on a timer in the event loop, either the
+    asyncio loop or the SelectorLoop.
+
+    Active expiry follows Redis: a slow cycle runs HZ times a second with a
+    budget of a quarter of the time between runs. When a cycle runs out of
+    budget with expired keys left, a fast cycle with a much smaller budget
+    follows right away, so the backlog drains without starving clients.'''
+    HZ = 10
+    SLOW_CYCLE_BUDGET = 0.25 / HZ
+    FAST_CYCLE_BUDGET = 0.001
+
+    def __init__(self, keyspace: Keyspace, persistence: Persistence, replicas: Replicas) -> None:
+        self.keyspace = keyspace
+        self.persistence = persistence
+        self.replicas = replicas
+        self.loop = None
+
+    def start(self, loop):
+        self.loop = loop
+        self.persistence.start(loop)
+        loop.call_later(1 / self.HZ, self.expire_cycle, self.SLOW_CYCLE_BUDGET)
+        loop.call_later(1 / self.HZ, self.cron)
+
+    def cron(self):
+        '''Periodic work other than expiry: reaping a BGSAVE, AOF rewrite
+        or full sync child, the save policies, automatic AOF rewrites,
+        snapshots for replicas waiting to sync and compacting what SCAN
+        walks.'''
+        self.persistence.check_child()
+        # replicas waiting for a full sync go before the save policies
+        self.replicas.start_pending_sync()
+        self.persistence.cron()
+        self.keyspace.compact_scan_orders()
+        self.loop.call_later(1 / self.HZ, self.cron)
+
+    def expire_cycle(self, time_budget: float):
+        clock.tick()
+        if self.keyspace.active_expire_cycle(time_budget):
+            self.loop.call_later(0, self.expire_cycle, self.FAST_CYCLE_BUDGET)
+        else:
+            self.loop.call_later(1 / self.HZ, self.expire_cycle, self.SLOW_CYCLE_BUDGET)
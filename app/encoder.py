@@ -1,8 +1,15 @@
 from enum import IntEnum
-from app.constants import BOUNDARY, STRING, ARRAY, BULK_STRING, NULL_BULK_STR, INTEGER, ERR
+from app.constants import BOUNDARY, STRING, ARRAY, BULK_STRING, NULL_BULK_STR, NULL_ARRAY, INTEGER, ERR
 from app.util import encode
 
 QUEUED = b'+QUEUED\r\n'
+WRONGTYPE = b'-WRONGTYPE Operation against a key holding the wrong kind of value\r\n'
+
+# Preallocated replies for small integers, as integer replies and as bulk
+# strings for int encoded values, like Redis' shared integers.
+OBJ_SHARED_INTEGERS = 10000
+SHARED_INTEGERS = [INTEGER + str(i).encode() + BOUNDARY for i in range(OBJ_SHARED_INTEGERS)]
+SHARED_BULK_INTEGERS = [BULK_STRING + str(len(str(i))).encode() + BOUNDARY + str(i).encode() + BOUNDARY for i in range(OBJ_SHARED_INTEGERS)]
 
 class EncodedMessageType(IntEnum):
     SIMPLE_STRING = 0
@@ -33,6 +40,18 @@ class RespEncoder:
 
     def encode_integer(self, msg) -> bytes:
         return INTEGER + msg + BOUNDARY
+
+    def encode_int(self, value: int) -> bytes:
+        '''Integer reply straight from an int.'''
+        if 0 <= value < OBJ_SHARED_INTEGERS:
+            return SHARED_INTEGERS[value]
+        return INTEGER + str(value).encode() + BOUNDARY
+
+    def encode_int_bulk(self, value: int) -> bytes:
+        '''Bulk string reply for an int encoded value.'''
+        if 0 <= value < OBJ_SHARED_INTEGERS:
+            return SHARED_BULK_INTEGERS[value]
+        return self.encode_bulk_msg(str(value).encode())
     
     def encode_smpl_str(self, message, starter=STRING) -> bytes:
         return starter + message + BOUNDARY
@@ -57,9 +76,18 @@ class RespEncoder:
             to_ret.append(element)
         return b''.join(to_ret)
             
+    def encode_bulk_array(self, items: list[bytes]) -> bytes:
+        '''Array reply of bulk strings from items that are all bytes already,
+        without encode_array()'s per element type dispatch.'''
+        return b''.join([b'*%d\r\n' % len(items), *[b'$%d\r\n%s\r\n' % (len(item), item) for item in items]])
+
     @staticmethod
     def null_bulk_str():
         return NULL_BULK_STR + BOUNDARY
+
+    @staticmethod
+    def null_array():
+        return NULL_ARRAY + BOUNDARY
     
 
 ENCODER = RespEncoder()
@@ -0,0 +1,156 @@
+import time
+import heapq
+import socket
+import threading
+import selectors
+from collections import deque
+
+
+class Handle:
+    '''A scheduled callback, cancellable like asyncio's handles.'''
+    __slots__ = ('callback', 'args', 'cancelled')
+
+    def __init__(self, callback, args) -> None:
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        try:
+            self.callback(*self.args)
+        except Exception as e:
+            print(f"Exception in callback {self.callback}: {e}")
+
+
+class TimerHandle(Handle):
+    __slots__ = ('when',)
+
+    def __init__(self, when: float, callback, args) -> None:
+        super().__init__(callback, args)
+        self.when = when
+
+    def __lt__(self, other: 'TimerHandle'):
+        return self.when < other.when
+
+
+class SelectorLoop:
+    '''Event loop for the selectors io mode. It mirrors the small part of the
+    asyncio loop API the server relies on (call_soon, add_reader, ...) so
+    connections and commands don't need to know which mode they run under.'''
+
+    def __init__(self) -> None:
+        self.selector = selectors.DefaultSelector()
+        self.ready: deque[Handle] = deque()
+        self.timers: list[TimerHandle] = []
+        self.thread_id = None
+        # written to by other threads to wake up a loop sitting in select()
+        self.wakeup_r, self.wakeup_w = socket.socketpair()
+        self.wakeup_r.setblocking(False)
+        self.wakeup_w.setblocking(False)
+        self.add_reader(self.wakeup_r, self._drain_wakeup)
+
+    def _drain_wakeup(self):
+        try:
+            while self.wakeup_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _update(self, sock: socket.socket, event: int, handle: Handle | None):
+        try:
+            key = self.selector.get_key(sock)
+            reader, writer = key.data
+        except KeyError:
+            key, reader, writer = None, None, None
+
+        if event == selectors.EVENT_READ:
+            reader = handle
+        else:
+            writer = handle
+        mask = (selectors.EVENT_READ if reader else 0) | (selectors.EVENT_WRITE if writer else 0)
+
+        if key is None:
+            if mask:
+                self.selector.register(sock, mask, (reader, writer))
+        elif mask:
+            self.selector.modify(sock, mask, (reader, writer))
+        else:
+            self.selector.unregister(sock)
+
+    def add_reader(self, sock: socket.socket, callback, *args):
+        self._update(sock, selectors.EVENT_READ, Handle(callback, args))
+
+    def remove_reader(self, sock: socket.socket):
+        self._update(sock, selectors.EVENT_READ, None)
+
+    def add_writer(self, sock: socket.socket, callback, *args):
+        self._update(sock, selectors.EVENT_WRITE, Handle(callback, args))
+
+    def remove_writer(self, sock: socket.socket):
+        self._update(sock, selectors.EVENT_WRITE, None)
+
+    def call_soon(self, callback, *args):
+        handle = Handle(callback, args)
+        self.ready.append(handle)
+        return handle
+
+    def call_soon_threadsafe(self, callback, *args):
+        handle = self.call_soon(callback, *args)
+        try:
+            self.wakeup_w.send(b'\0')
+        except (BlockingIOError, InterruptedError):
+            # a wakeup is already pending
+            pass
+        return handle
+
+    def time(self):
+        return time.monotonic()
+
+    def call_later(self, delay: float, callback, *args):
+        return self.call_at(self.time() + delay, callback, *args)
+
+    def call_at(self, when: float, callback, *args):
+        handle = TimerHandle(when, callback, args)
+        heapq.heappush(self.timers, handle)
+        return handle
+
+    def run_once(self):
+        while self.timers and self.timers[0].cancelled:
+            heapq.heappop(self.timers)
+        if self.ready:
+            timeout = 0
+        elif self.timers:
+            timeout = max(0, self.timers[0].when - self.time())
+        else:
+            timeout = None
+
+        for key, mask in self.selector.select(timeout):
+            reader, writer = key.data
+            if mask & selectors.EVENT_READ and reader is not None:
+                reader.run()
+            if mask & selectors.EVENT_WRITE and writer is not None:
+                # the reader may have closed the socket or stopped writing
+                try:
+                    _, writer = self.selector.get_key(key.fileobj).data
+                except (KeyError, ValueError):
+                    writer = None
+                if writer is not None:
+                    writer.run()
+
+        now = self.time()
+        while self.timers and self.timers[0].when <= now:
+            self.ready.append(heapq.heappop(self.timers))
+
+        # callbacks scheduled while these run wait for the next iteration
+        for _ in range(len(self.ready)):
+            handle = self.ready.popleft()
+            if not handle.cancelled:
+                handle.run()
+
+    def run_forever(self):
+        self.thread_id = threading.get_ident()
+        while True:
+            self.run_once()
@@ -0,0 +1,95 @@
+'''Glob patterns as KEYS and SCAN MATCH take them, like Redis'
+stringmatchlen(): `*`, `?`, `[abc]`, `[^abc]`, `[a-z]` and `\\` escaping the
+next character. A pattern matches a key only as a whole.
+
+Patterns are compiled into GlobMatchers, kept in an LRU cache since clients
+tend to use the same few over and over. The common shapes don't need a
+regex: a literal is compared, and a literal followed by a `*` is a prefix
+test. The literal a pattern starts with lets a sorted key index skip to the
+keys that can match.'''
+import re
+from functools import lru_cache
+
+SPECIAL_CHARS = frozenset('*?[\\')
+
+
+def glob_to_regex(pattern: str) -> str:
+    out = []
+    idx, n = 0, len(pattern)
+    while idx < n:
+        char = pattern[idx]
+        if char == '*':
+            if not out or out[-1] != '.*':
+                out.append('.*')
+        elif char == '?':
+            out.append('.')
+        elif char == '\\' and idx + 1 < n:
+            idx += 1
+            out.append(re.escape(pattern[idx]))
+        elif char == '[':
+            idx += 1
+            negate = idx < n and pattern[idx] == '^'
+            if negate:
+                idx += 1
+            items = []
+            # an unterminated class runs to the end of the pattern
+            while idx < n and pattern[idx] != ']':
+                if pattern[idx] == '\\' and idx + 1 < n:
+                    idx += 1
+                    items.append(re.escape(pattern[idx]))
+                elif idx + 2 < n and pattern[idx + 1] == '-' and pattern[idx + 2] != ']':
+                    low, high = sorted((pattern[idx], pattern[idx + 2]))
+                    items.append(f'{re.escape(low)}-{re.escape(high)}')
+                    idx += 2
+                else:
+                    items.append(re.escape(pattern[idx]))
+                idx += 1
+            if items:
+                out.append(f'[{"^" if negate else ""}{"".join(items)}]')
+            else:
+                # [] matches nothing, [^] any character
+                out.append('.' if negate else '(?!)')
+        else:
+            out.append(re.escape(char))
+        idx += 1
+    return ''.join(out)
+
+
+def literal_prefix(pattern: str) -> tuple[str, int]:
+    '''The literal `pattern` starts with, escapes resolved, and the index
+    in `pattern` where the rest starts.'''
+    prefix = []
+    idx = 0
+    while idx < len(pattern):
+        char = pattern[idx]
+        if char == '\\' and idx + 1 < len(pattern):
+            prefix.append(pattern[idx + 1])
+            idx += 2
+        elif char in SPECIAL_CHARS:
+            break
+        else:
+            prefix.append(char)
+            idx += 1
+    return ''.join(prefix), idx
+
+
+class GlobMatcher:
+    __slots__ = ('pattern', 'prefix', 'match')
+
+    def __init__(self, pattern: str) -> None:
+        self.pattern = pattern
+        self.prefix, rest = literal_prefix(pattern)
+        if rest == len(pattern):
+            self.match = self.prefix.__eq__
+        elif pattern[rest:].strip('*') == '':
+            self.match = self.match_prefix
+        else:
+            self.match = re.compile(glob_to_regex(pattern), re.DOTALL).fullmatch
+
+    def match_prefix(self, key: str):
+        return key.startswith(self.prefix)
+
+
+@lru_cache(maxsize=256)
+def compile_glob(pattern: str) -> GlobMatcher:
+    return GlobMatcher(pattern)
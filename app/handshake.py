@@ -1,7 +1,7 @@
 from enum import IntEnum
 from app.commands import CommandEnum
 from app.encoder import ENCODER, EncodedMessageType
-from app.namespace import ConfigNamespace, ServerConfig, server_config
+from app.namespace import ConfigNamespace, server_config
 
 class HandShakeStates(IntEnum):
     INIT = 0
@@ -17,7 +17,7 @@ class Handshake:
         pass
 
     @classmethod
-    def handle_stage(cls, data=None | bytes, server_config: ServerConfig | None = None):
+    def handle_stage(cls, data: bytes | None = None):
         if cls.state == HandShakeStates.INIT:
             # initial state, send PING
             cls.state = HandShakeStates.AWAIT_PONG
@@ -36,10 +36,19 @@ class Handshake:
             if data != b'OK':
                 return
             cls.state = HandShakeStates.FULLRESYNC
-            return ENCODER.encode([CommandEnum.PSYNC, '?', '-1'], EncodedMessageType.ARRAY)
-        if cls.state == HandShakeStates.FULLRESYNC:
-            # consume and do nothing
-            if server_config:
-                server_config.finished_handshake = True
+            if server_config.master_replid is None:
+                return ENCODER.encode([CommandEnum.PSYNC, '?', '-1'], EncodedMessageType.ARRAY)
+            # reconnecting, ask for what we missed since the last processed byte
+            return ENCODER.encode([CommandEnum.PSYNC, server_config.master_replid, server_config.acked_commands + 1], EncodedMessageType.ARRAY)
+        if cls.state == HandShakeStates.FULLRESYNC and data is not None:
+            reply = data.split()
+            if reply[0] == b'FULLRESYNC':
+                # the snapshot that follows is the master's data at this offset
+                server_config.master_replid = reply[1].decode()
+                server_config.acked_commands = int(reply[2])
+            elif reply[0] == b'CONTINUE' and len(reply) > 1:
+                server_config.master_replid = reply[1].decode()
+            server_config.replid = server_config.master_replid
+            server_config.finished_handshake = True
             cls.state = HandShakeStates.END
             return HandShakeStates.END
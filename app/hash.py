@@ -0,0 +1,93 @@
+'''Hashes, a key's own map of fields to values.
+
+Like Redis, a hash starts out in a compact encoding and converts once it
+grows. Small hashes are one flat list, field, value, field, value, the
+counterpart of the listpack encoding: a field is found with list.index(),
+a scan in C, and the whole hash costs one list object instead of a dict's
+hash table. Past HASH_MAX_LISTPACK_ENTRIES fields, or with a field or value
+longer than HASH_MAX_LISTPACK_VALUE bytes, it converts to a dict.
+
+Values are stored like string values: as an int when they are the
+canonical form of one, the bytes received otherwise.'''
+from app.util import int_encoding
+
+HASH_MAX_LISTPACK_ENTRIES = 128
+HASH_MAX_LISTPACK_VALUE = 64
+
+
+def too_long(value: bytes | int) -> bool:
+    return isinstance(value, bytes) and len(value) > HASH_MAX_LISTPACK_VALUE
+
+
+class RedisHash:
+    __slots__ = ('entries',)
+
+    def __init__(self, fields: dict | None = None) -> None:
+        # [field, value, ...] while small, field -> value once converted
+        self.entries: list | dict = []
+        if fields:
+            if len(fields) > HASH_MAX_LISTPACK_ENTRIES or any(too_long(f) or too_long(v) for f, v in fields.items()):
+                self.entries = {field: int_encoding(value) for field, value in fields.items()}
+            else:
+                self.entries = [x for field, value in fields.items() for x in (field, int_encoding(value))]
+
+    @property
+    def encoding(self):
+        return 'listpack' if isinstance(self.entries, list) else 'hashtable'
+
+    def __len__(self):
+        entries = self.entries
+        return len(entries) // 2 if isinstance(entries, list) else len(entries)
+
+    def items(self):
+        '''(field, value) pairs, in the order the fields were added.'''
+        entries = self.entries
+        if isinstance(entries, list):
+            return zip(entries[0::2], entries[1::2])
+        return entries.items()
+
+    def find(self, field: bytes) -> int:
+        '''Position of `field` in the flat list, -1 if it isn't there. A
+        value equal to it is skipped over.'''
+        entries = self.entries
+        idx = -1
+        try:
+            while True:
+                idx = entries.index(field, idx + 1)
+                if not idx & 1:
+                    return idx
+        except ValueError:
+            return -1
+
+    def get(self, field: bytes) -> bytes | int | None:
+        entries = self.entries
+        if not isinstance(entries, list):
+            return entries.get(field)
+        idx = self.find(field)
+        return entries[idx + 1] if idx >= 0 else None
+
+    def set(self, field: bytes, value: bytes | int) -> bool:
+        '''Sets `field`, returns whether it is new.'''
+        entries = self.entries
+        if not isinstance(entries, list):
+            new = field not in entries
+            entries[field] = value
+            return new
+        idx = self.find(field)
+        if idx >= 0:
+            entries[idx + 1] = value
+        else:
+            entries += (field, value)
+        if len(entries) > 2 * HASH_MAX_LISTPACK_ENTRIES or too_long(field) or too_long(value):
+            self.entries = dict(zip(entries[0::2], entries[1::2]))
+        return idx < 0
+
+    def delete(self, field: bytes) -> bool:
+        entries = self.entries
+        if not isinstance(entries, list):
+            return entries.pop(field, None) is not None
+        idx = self.find(field)
+        if idx < 0:
+            return False
+        del entries[idx:idx + 2]
+        return True
@@ -0,0 +1,45 @@
+'''Freeing big containers off the event loop, like Redis' lazyfree.c.
+
+Dropping the last reference to a dict of millions of keys frees it in one C
+call that holds the GIL throughout, so handing that to a thread would still
+stall the loop. The thread instead empties what it is given a batch of items
+at a time, and the interpreter switches back to the loop between batches.'''
+import queue
+import threading
+
+
+class LazyFree:
+    # containers smaller than this are cheaper to free right away, Redis'
+    # LAZYFREE_THRESHOLD
+    THRESHOLD = 64
+    BATCH = 1024
+
+    def __init__(self) -> None:
+        self.queue = queue.Queue()
+        self.thread = None
+        self.freed_objects = 0
+
+    @property
+    def pending(self):
+        return self.queue.unfinished_tasks
+
+    def free(self, *containers):
+        '''Takes over `containers`, dicts and lists no one else refers to.'''
+        for container in containers:
+            if len(container) < self.THRESHOLD:
+                continue
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='lazyfree', daemon=True)
+                self.thread.start()
+            self.queue.put(container)
+
+    def run(self):
+        while True:
+            container = self.queue.get()
+            pop = container.popitem if isinstance(container, dict) else container.pop
+            while container:
+                for _ in range(min(self.BATCH, len(container))):
+                    pop()
+            del container, pop
+            self.freed_objects += 1
+            self.queue.task_done()
@@ -0,0 +1,98 @@
+'''The listpack format Redis uses for small collections and stream nodes.
+
+    <total-bytes:u32> <num-elements:u16> <entry> ... <0xFF>
+
+Each entry is an encoding byte with its data, followed by the entry's length
+backwards so the list can be walked from the tail. Integers and strings
+that look like integers are stored in the smallest integer encoding.'''
+from app.util import int_encoding
+
+LP_HDR_SIZE = 6
+LP_EOF = 0xFF
+LP_NUMELE_UNKNOWN = 0xFFFF
+
+
+def _backlen(length: int) -> bytes:
+    if length <= 127:
+        return bytes((length,))
+    if length < 16383:
+        return bytes((length >> 7, (length & 127) | 128))
+    if length < 2097151:
+        return bytes((length >> 14, ((length >> 7) & 127) | 128, (length & 127) | 128))
+    if length < 268435455:
+        return bytes((length >> 21, ((length >> 14) & 127) | 128, ((length >> 7) & 127) | 128, (length & 127) | 128))
+    return bytes((length >> 28, ((length >> 21) & 127) | 128, ((length >> 14) & 127) | 128,
+                  ((length >> 7) & 127) | 128, (length & 127) | 128))
+
+
+def _encode_int(value: int) -> bytes:
+    if 0 <= value <= 127:
+        return bytes((value,))
+    if -4096 <= value <= 4095:
+        value &= 0x1FFF
+        return bytes((0xC0 | value >> 8, value & 0xFF))
+    if -2**15 <= value < 2**15:
+        return b'\xF1' + value.to_bytes(2, 'little', signed=True)
+    if -2**23 <= value < 2**23:
+        return b'\xF2' + value.to_bytes(3, 'little', signed=True)
+    if -2**31 <= value < 2**31:
+        return b'\xF3' + value.to_bytes(4, 'little', signed=True)
+    return b'\xF4' + value.to_bytes(8, 'little', signed=True)
+
+
+def _encode_str(value: bytes) -> bytes:
+    n = len(value)
+    if n < 64:
+        return bytes((0x80 | n,)) + value
+    if n < 4096:
+        return bytes((0xE0 | n >> 8, n & 0xFF)) + value
+    return b'\xF0' + n.to_bytes(4, 'little') + value
+
+
+def encode(elements: list[int | bytes]) -> bytes:
+    out = bytearray(LP_HDR_SIZE)
+    for element in elements:
+        if isinstance(element, bytes):
+            element = int_encoding(element)
+        entry = _encode_int(element) if isinstance(element, int) else _encode_str(element)
+        out += entry
+        out += _backlen(len(entry))
+    out.append(LP_EOF)
+    out[0:4] = len(out).to_bytes(4, 'little')
+    count = len(elements) if len(elements) < LP_NUMELE_UNKNOWN else LP_NUMELE_UNKNOWN
+    out[4:6] = count.to_bytes(2, 'little')
+    return bytes(out)
+
+
+def _backlen_size(length: int) -> int:
+    return 1 if length <= 127 else 2 if length < 16383 else 3 if length < 2097151 else 4 if length < 268435455 else 5
+
+
+def decode(data: bytes) -> list[int | bytes]:
+    '''Elements in order, integers as ints and strings as bytes.'''
+    elements = []
+    pos = LP_HDR_SIZE
+    while (b := data[pos]) != LP_EOF:
+        if b < 0x80:
+            value, size = b, 1
+        elif b < 0xC0:
+            n = b & 0x3F
+            value, size = bytes(data[pos + 1:pos + 1 + n]), 1 + n
+        elif b < 0xE0:
+            value = ((b & 0x1F) << 8) | data[pos + 1]
+            if value >= 1 << 12:
+                value -= 1 << 13
+            size = 2
+        elif b < 0xF0:
+            n = ((b & 0x0F) << 8) | data[pos + 1]
+            value, size = bytes(data[pos + 2:pos + 2 + n]), 2 + n
+        elif b == 0xF0:
+            n = int.from_bytes(data[pos + 1:pos + 5], 'little')
+            value, size = bytes(data[pos + 5:pos + 5 + n]), 5 + n
+        else:
+            width = {0xF1: 2, 0xF2: 3, 0xF3: 4, 0xF4: 8}[b]
+            value = int.from_bytes(data[pos + 1:pos + 1 + width], 'little', signed=True)
+            size = 1 + width
+        elements.append(value)
+        pos += size + _backlen_size(size)
+    return elements
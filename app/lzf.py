@@ -0,0 +1,37 @@
+'''Decompression of the LZF format Redis compresses RDB strings with.
+
+A stream of literal runs and back references: a control byte under 32 starts
+a run of that many plus one literal bytes, anything else is a back
+reference, with its length in the top 3 bits (7 meaning a length byte
+follows) and a 13 bit offset into the output.'''
+
+
+def decompress(data: bytes, expected_len: int) -> bytes:
+    out = bytearray()
+    pos, end = 0, len(data)
+    while pos < end:
+        ctrl = data[pos]
+        pos += 1
+        if ctrl < 32:
+            ctrl += 1
+            out += data[pos:pos + ctrl]
+            pos += ctrl
+            continue
+        length = ctrl >> 5
+        if length == 7:
+            length += data[pos]
+            pos += 1
+        ref = len(out) - ((ctrl & 0x1F) << 8) - data[pos] - 1
+        pos += 1
+        length += 2
+        if ref < 0:
+            raise ValueError('invalid LZF back reference')
+        if ref + length <= len(out):
+            out += out[ref:ref + length]
+        else:
+            # the reference overlaps what it writes, a repeated pattern
+            for i in range(length):
+                out.append(out[ref + i])
+    if len(out) != expected_len:
+        raise ValueError(f'LZF data decompressed to {len(out)} bytes, expected {expected_len}')
+    return bytes(out)
@@ -1,99 +1,66 @@
-import socket  # noqa: F401
-import selectors
+import asyncio
 import argparse
-import threading
 
-from app.resp_parser import RespParser
-from app.commands import MasterCommand, ReplicaCommand
-from app.namespace import ConfigNamespace, server_config
-from app.handshake import Handshake, HandShakeStates
-from app.storage import RedisDB
+from app import async_server, selector_server
+from app.commands import MasterCommand
+from app.namespace import ConfigNamespace
+from app.persistence import Persistence, parse_save_params
+from app.storage import Keyspace
 from app.replicas import Replicas
+from app.util import parse_size
 
 parser = argparse.ArgumentParser('Redis')
 parser.add_argument("--dir")
 parser.add_argument("--dbfilename")
 parser.add_argument ("-p", "--port", default=6379, type=int)
 parser.add_argument("--replicaof")
-
-sel = selectors.DefaultSelector()
-storage = RedisDB()
-replicas = Replicas()
-
-def handle_client(sock: socket.socket, cmd_parser: MasterCommand):
-    try:
-        parser = RespParser()
-        parsed_msg = parser.parse_all(sock, sel)
-        if parsed_msg is None:
-            return
-
-        for cmd in parsed_msg:
-            cmd_parser.handle_cmd(cmd, sock)
-    except Exception as e:
-        print(f"Exception in thread {threading.current_thread().name}: {e}")
-
-
-def read(cmd_parser: MasterCommand):
-    def inner(sock: socket.socket):
-        thread = threading.Thread(target=handle_client, args=(sock, cmd_parser))
-        thread.start()
-    return inner
-
-
-def accept(sock: socket.socket):
-    conn, _ = sock.accept()
-    conn.setblocking(False)
-    cmd_parser = MasterCommand(storage=storage, replicas=replicas)
-    sel.register(conn, selectors.EVENT_READ, read(cmd_parser))
-
-
-def handle_master_data(sock: socket.socket):
-    parser = RespParser()
-    cmd_parser = ReplicaCommand(storage=storage)
-    parsed_msg = parser.parse_all(sock, sel)
-
-    if not parsed_msg:
-        return
-    res = Handshake.handle_stage(parsed_msg[0])
-    if res and res != HandShakeStates.END:
-        sock.sendall(res)
-    else:
-        for cmd in parsed_msg:
-            cmd_parser.handle_cmd(cmd, sock)
-
-
-def connect_replica():
-    host, port = ConfigNamespace.replicaof.split()
-    
-    conn = socket.create_connection((host, int(port)))
-    ConfigNamespace.master_conn = conn
-    # send PING cmd
-    conn.setblocking(False)
-    ping_encoded = Handshake.handle_stage()
-    if ping_encoded:
-        conn.sendall(ping_encoded)
-
-    sel.register(conn, selectors.EVENT_READ, handle_master_data)
+parser.add_argument("--databases", default=16, type=int,
+                    help='number of logical databases, SELECT takes 0 to one less than this')
+parser.add_argument("--key-index", choices=['yes', 'no'], default='no',
+                    help='keep the keys of each db sorted too, so that KEYS patterns with a literal prefix, like '
+                         '"session:*", only visit the keys with that prefix')
+parser.add_argument("--save", default=parse_save_params('3600 1 300 100 60 10000'), type=parse_save_params,
+                    help='"<seconds> <changes> ...", BGSAVE after that many changes in that many seconds, "" disables')
+parser.add_argument("--rdbchecksum", choices=['yes', 'no'], default='yes',
+                    help='verify the CRC64 of RDB files that have one when loading them')
+parser.add_argument("--rdb-load-workers", default=0, type=int,
+                    help='processes to decode the RDB file with at startup, 0 decodes it in the server process')
+parser.add_argument("--appendonly", choices=['yes', 'no'], default='no',
+                    help='log every write to the AOF and load it, not the RDB file, at startup')
+parser.add_argument("--appendfilename", default='appendonly.aof')
+parser.add_argument("--appenddirname", default='appendonlydir',
+                    help='directory in --dir holding the AOF base, incremental files and manifest')
+parser.add_argument("--appendfsync", choices=['always', 'everysec', 'no'], default='everysec',
+                    help='fsync the AOF after every write, once a second on a background thread, or leave it to the OS')
+parser.add_argument("--auto-aof-rewrite-percentage", default=100, type=int,
+                    help='rewrite the AOF once it grew this many percent since the last rewrite, 0 disables')
+parser.add_argument("--auto-aof-rewrite-min-size", default=64 * 1024**2, type=parse_size,
+                    help='no automatic rewrite while the AOF is smaller than this')
+parser.add_argument("--repl-backlog-size", default=1024 * 1024, type=parse_size,
+                    help='bytes of the replication stream kept for replicas to resume from')
+parser.add_argument("--replica-output-buffer-limit", default=(256 * 1024**2, 64 * 1024**2, 60), nargs=3,
+                    metavar=('HARD', 'SOFT', 'SECONDS'), type=parse_size,
+                    help='disconnect a replica with more output queued than HARD, or more than SOFT for SECONDS, 0 disables')
+parser.add_argument("--io", choices=['asyncio', 'selectors'], default='asyncio',
+                    help='event loop to serve clients with, selectors is a minimal loop kept for comparison')
 
 def main():
     # You can use print statements as follows for debugging, they'll be visible when running tests.
     print("Logs from your program will appear here!")
-    storage.load_db()
-
-    with socket.create_server(("localhost", ConfigNamespace.port), reuse_port=True) as server:
-        server.listen(100)
-        server.setblocking(False)
-        sel.register(server, selectors.EVENT_READ, accept)
-
-        if ConfigNamespace.is_replica():
-            connect_replica()
-
-        while True:
-            events = sel.select()
-            # print(events)
-            for key, _ in events:
-                cb = key.data
-                cb(key.fileobj)
+    keyspace = Keyspace(ConfigNamespace.databases, ConfigNamespace.key_index == 'yes')
+    persistence = Persistence(keyspace)
+    persistence.load()
+    replicas = Replicas(persistence)
+    if not ConfigNamespace.is_replica():
+        # a key that expires is deleted on replicas and in the AOF by a DEL,
+        # as if a client had deleted it
+        expirer = MasterCommand(keyspace=keyspace, replicas=replicas, persistence=persistence)
+        keyspace.set_expired_hook(lambda db, key: expirer.written([b'DEL', key.encode()], db))
+
+    if ConfigNamespace.io == 'selectors':
+        selector_server.serve(keyspace, replicas, persistence)
+    else:
+        asyncio.run(async_server.serve(keyspace, replicas, persistence))
 
 if __name__ == "__main__":
     parser.parse_known_args(namespace=ConfigNamespace)[0]
@@ -1,3 +1,5 @@
+import secrets
+
 class ConfigNamespace:
     server_type = 'master'
     replica_just_conn = None
@@ -13,7 +15,16 @@ class ConfigNamespace:
 
 class ServerConfig:
     acked_replicas = {}
+    # the replication offset: bytes propagated on a master, bytes processed
+    # from the master on a replica
     acked_commands = 0
+    # id of the replication history the offset belongs to, a replica takes
+    # its master's
+    replid = secrets.token_hex(20)
+    # on a replica, the replid of the master it synced from
+    master_replid = None
+    # on a replica, the db the master's stream last SELECTed
+    master_db = 0
     finished_handshake = False
 
 server_config = ServerConfig()
@@ -0,0 +1,248 @@
+import gc
+import os
+import time
+from pathlib import Path
+
+from app.aof import AppendOnlyFile
+from app.namespace import ConfigNamespace
+from app.rdb_writer import RDBWriter
+from app.storage import Keyspace
+
+
+def parse_save_params(value: str):
+    '''`save` policies as Redis takes them: "3600 1 300 100", pairs of
+    seconds and changes, an empty string disabling them.'''
+    numbers = [int(x) for x in value.split()]
+    if len(numbers) % 2:
+        raise ValueError(f'invalid save parameters {value!r}')
+    return list(zip(numbers[0::2], numbers[1::2]))
+
+
+class Persistence:
+    '''RDB snapshots: SAVE, BGSAVE and the `save` policies, and the AOF when
+    `appendonly` is on.
+
+    BGSAVE forks. The child writes the snapshot from its copy-on-write view
+    of the keyspace while the parent keeps serving clients, and the cron
+    reaps it without blocking. Snapshots go to a temp file that is renamed
+    over the RDB file, so the RDB file is always complete. An AOF rewrite
+    forks the same way to write the AOF's new base file, as does the snapshot
+    of a full sync to replicas, and like Redis only one child runs at a
+    time.'''
+
+    def __init__(self, keyspace: Keyspace) -> None:
+        self.keyspace = keyspace
+        # writes since the last successful save
+        self.dirty = 0
+        self.dirty_before_bgsave = 0
+        self.lastsave = int(time.time())
+        self.last_bgsave_status = 'ok'
+        self.last_bgsave_time = -1
+        # the one forked child, a BGSAVE, an AOF rewrite or a full sync's snapshot
+        self.child_pid = None
+        self.child_type = None
+        self.child_started = None
+        self.aof = None
+        self.aof_rewrite_scheduled = False
+        self.aof_rewrite_base = None
+        self.last_aof_rewrite_status = 'ok'
+        # called with whether it worked once a replication snapshot child exits
+        self.sync_done = None
+
+    @property
+    def rdb_path(self):
+        return Path(ConfigNamespace.dir or '.') / (ConfigNamespace.dbfilename or 'dump.rdb')
+
+    def load(self):
+        '''Loads the keyspace at startup. With AOF on the AOF is the more
+        complete record and is loaded instead of the RDB file.'''
+        if getattr(ConfigNamespace, 'appendonly', 'no') != 'yes':
+            self.keyspace.load_db()
+            return
+        directory = Path(ConfigNamespace.dir or '.')
+        filename = getattr(ConfigNamespace, 'appendfilename', None) or 'appendonly.aof'
+        self.aof = AppendOnlyFile(directory / (getattr(ConfigNamespace, 'appenddirname', None) or 'appendonlydir'),
+                                  filename, getattr(ConfigNamespace, 'appendfsync', 'everysec'))
+        if not self.aof.exists() and (directory / filename).exists():
+            self.aof.upgrade(directory / filename)
+        if self.aof.exists():
+            # imported here, commands.py imports this module
+            from app.commands import Command
+            started = time.monotonic()
+            size = self.aof.load(self.keyspace, Command(keyspace=self.keyspace))
+            print(f'DB loaded from append only file: {size} bytes in {time.monotonic() - started:.3f} seconds')
+        else:
+            # AOF just turned on, its base is what the RDB file has
+            self.keyspace.load_db()
+            self.aof.create(self.write_rdb)
+
+    def start(self, loop):
+        if self.aof is not None:
+            self.aof.start(loop)
+
+    def holds_replies(self):
+        return self.aof is not None and self.aof.holds_replies()
+
+    def written(self, cmd_arr: list[bytes], db: int):
+        '''Called after every write command that changed the keyspace, with
+        the db it ran in.'''
+        self.dirty += 1
+        if self.aof is not None:
+            self.aof.feed(cmd_arr, db)
+
+    def bgsave_in_progress(self):
+        # a full sync's snapshot is an RDB child too, as in Redis
+        return self.child_type in ('rdb', 'sync')
+
+    def aof_rewrite_in_progress(self):
+        return self.child_type == 'aof'
+
+    def write_rdb(self, path: Path):
+        tmp_path = path.with_name(f'temp-{os.getpid()}.rdb')
+        with open(tmp_path, 'wb') as f:
+            RDBWriter(self.keyspace).write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def save(self):
+        '''SAVE, blocking the server until the snapshot is on disk.'''
+        try:
+            self.write_rdb(self.rdb_path)
+        except OSError as e:
+            print(f'Failed saving the DB: {e}')
+            return False
+        self.dirty = 0
+        self.lastsave = int(time.time())
+        return True
+
+    def fork_child(self, child_type: str, path: Path):
+        '''Forks a child that writes a snapshot to `path`, returns False if
+        it couldn't.'''
+        # move every object to the permanent generation, so that neither
+        # process's collector walks, and so copies, the pages they are on
+        gc.freeze()
+        try:
+            pid = os.fork()
+        except OSError as e:
+            gc.unfreeze()
+            print(f"Can't fork: {e}")
+            return False
+
+        if pid == 0:
+            code = 0
+            try:
+                self.write_rdb(path)
+            except BaseException as e:
+                print(f'Background {child_type} child failed: {e}', flush=True)
+                code = 1
+            # skip the parent's atexit handlers and buffered sockets
+            os._exit(code)
+
+        gc.unfreeze()
+        self.child_pid = pid
+        self.child_type = child_type
+        self.child_started = time.monotonic()
+        return True
+
+    def bgsave(self):
+        '''Forks a child that writes the snapshot, returns False if it
+        couldn't.'''
+        if not self.fork_child('rdb', self.rdb_path):
+            self.last_bgsave_status = 'err'
+            return False
+        self.dirty_before_bgsave = self.dirty
+        print(f'Background saving started by pid {self.child_pid}')
+        return True
+
+    def rewrite_aof(self):
+        '''BGREWRITEAOF: a child writes the keyspace as the new AOF base
+        while writes go on to a new incremental file.'''
+        self.aof_rewrite_scheduled = False
+        self.aof_rewrite_base = self.aof.start_rewrite()
+        if not self.fork_child('aof', self.aof_rewrite_base):
+            self.last_aof_rewrite_status = 'err'
+            self.aof.finish_rewrite(self.aof_rewrite_base, False)
+            return False
+        print(f'Background append only file rewriting started by pid {self.child_pid}')
+        return True
+
+    def sync_snapshot(self, path: Path, done) -> bool:
+        '''Forks a child that writes the snapshot a full sync sends to
+        replicas, returns False if it couldn't. done(ok) is called once the
+        child exited.'''
+        if not self.fork_child('sync', path):
+            return False
+        self.sync_done = done
+        return True
+
+    def check_child(self):
+        '''Reaps a finished child without blocking.'''
+        if self.child_pid is None:
+            return
+        pid, status = os.waitpid(self.child_pid, os.WNOHANG)
+        if pid == 0:
+            return
+        ok = os.waitstatus_to_exitcode(status) == 0
+        elapsed = int(time.monotonic() - self.child_started)
+        child_type = self.child_type
+        self.child_pid = None
+        self.child_type = None
+        self.child_started = None
+        if child_type == 'sync':
+            done, self.sync_done = self.sync_done, None
+            done(ok)
+            return
+        if child_type == 'aof':
+            self.aof.finish_rewrite(self.aof_rewrite_base, ok)
+            self.aof_rewrite_base = None
+            self.last_aof_rewrite_status = 'ok' if ok else 'err'
+            print(f'Background AOF rewrite {"finished successfully" if ok else "failed"}')
+            return
+        self.last_bgsave_time = elapsed
+        if ok:
+            self.last_bgsave_status = 'ok'
+            # writes made while the child ran aren't in the snapshot
+            self.dirty -= self.dirty_before_bgsave
+            self.lastsave = int(time.time())
+            print('Background saving terminated with success')
+        else:
+            self.last_bgsave_status = 'err'
+            print('Background saving error')
+
+    def cron(self):
+        self.check_child()
+        if self.child_pid is not None:
+            return
+        if self.aof_rewrite_scheduled:
+            self.rewrite_aof()
+            return
+        if self.aof is not None and self.aof.size >= ConfigNamespace.auto_aof_rewrite_min_size \
+                and ConfigNamespace.auto_aof_rewrite_percentage \
+                and self.aof.growth() >= ConfigNamespace.auto_aof_rewrite_percentage:
+            print(f'Starting automatic rewriting of AOF on {self.aof.growth()}% growth')
+            self.rewrite_aof()
+            return
+        elapsed = int(time.time()) - self.lastsave
+        for seconds, changes in ConfigNamespace.save:
+            if self.dirty >= changes and elapsed >= seconds:
+                print(f'{changes} changes in {seconds} seconds. Saving...')
+                self.bgsave()
+                return
+
+    def info(self):
+        current = int(time.monotonic() - self.child_started) if self.child_started is not None else -1
+        return [
+            'loading:0',
+            f'rdb_changes_since_last_save:{self.dirty}',
+            f'rdb_bgsave_in_progress:{int(self.bgsave_in_progress())}',
+            f'rdb_last_save_time:{self.lastsave}',
+            f'rdb_last_bgsave_status:{self.last_bgsave_status}',
+            f'rdb_last_bgsave_time_sec:{self.last_bgsave_time}',
+            f'rdb_current_bgsave_time_sec:{current if self.bgsave_in_progress() else -1}',
+            f'aof_enabled:{int(self.aof is not None)}',
+            f'aof_rewrite_in_progress:{int(self.aof_rewrite_in_progress())}',
+            f'aof_rewrite_scheduled:{int(self.aof_rewrite_scheduled)}',
+            f'aof_last_bgrewrite_status:{self.last_aof_rewrite_status}',
+            *(self.aof.info() if self.aof is not None else []),
+        ]
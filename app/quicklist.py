@@ -0,0 +1,108 @@
+'''Lists, as a deque of chunks, like Redis' quicklist of listpacks.
+
+Each chunk is a Python list of up to CHUNK_SIZE elements, so an element
+costs one reference in a chunk instead of a linked list node. Pushes and
+pops only touch the chunk at that end, adding or dropping a chunk when it
+fills up or runs out, which keeps them O(1).
+
+Every chunk but the first and the last is full. The position of an element
+then gives its chunk by division rather than by adding up chunk lengths.
+Getting that chunk out of the deque still walks its blocks of 64 chunks
+from the nearer end, so LINDEX and the start of an LRANGE are O(n /
+CHUNK_SIZE / 64) instead of the O(n) walk of a linked list.'''
+from collections import deque
+
+CHUNK_SIZE = 128
+
+
+class QuickList:
+    __slots__ = ('chunks', 'len')
+
+    def __init__(self, elements=()) -> None:
+        elements = list(elements)
+        self.chunks: deque[list] = deque(elements[idx:idx + CHUNK_SIZE] for idx in range(0, len(elements), CHUNK_SIZE))
+        self.len = len(elements)
+
+    def __len__(self):
+        return self.len
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            yield from chunk
+
+    def push_left(self, element: bytes):
+        chunks = self.chunks
+        if chunks and len(chunks[0]) < CHUNK_SIZE:
+            chunks[0].insert(0, element)
+        else:
+            chunks.appendleft([element])
+        self.len += 1
+
+    def push_right(self, element: bytes):
+        chunks = self.chunks
+        if chunks and len(chunks[-1]) < CHUNK_SIZE:
+            chunks[-1].append(element)
+        else:
+            chunks.append([element])
+        self.len += 1
+
+    def pop_left(self) -> bytes | None:
+        chunks = self.chunks
+        if not chunks:
+            return None
+        chunk = chunks[0]
+        element = chunk.pop(0)
+        if not chunk:
+            chunks.popleft()
+        self.len -= 1
+        return element
+
+    def pop_right(self) -> bytes | None:
+        chunks = self.chunks
+        if not chunks:
+            return None
+        chunk = chunks[-1]
+        element = chunk.pop()
+        if not chunk:
+            chunks.pop()
+        self.len -= 1
+        return element
+
+    def locate(self, idx: int) -> tuple[int, int]:
+        '''(chunk, position in it) of the element at position `idx`.'''
+        head = len(self.chunks[0])
+        if idx < head:
+            return 0, idx
+        chunk, pos = divmod(idx - head, CHUNK_SIZE)
+        return chunk + 1, pos
+
+    def index(self, idx: int) -> bytes | None:
+        '''LINDEX: the element at `idx`, negative ones counting from the end.'''
+        if idx < 0:
+            idx += self.len
+        if not 0 <= idx < self.len:
+            return None
+        chunk, pos = self.locate(idx)
+        return self.chunks[chunk][pos]
+
+    def range(self, start: int, stop: int) -> list[bytes]:
+        '''LRANGE: the elements from `start` to `stop`, both included,
+        negative ones counting from the end.'''
+        n = self.len
+        if start < 0:
+            start += n
+        if stop < 0:
+            stop += n
+        start, stop = max(start, 0), min(stop, n - 1)
+        if start > stop:
+            return []
+        chunk, pos = self.locate(start)
+        chunks = self.chunks
+        remaining = stop - start + 1
+        elements = []
+        while remaining > 0:
+            part = chunks[chunk][pos:pos + remaining]
+            elements += part
+            remaining -= len(part)
+            chunk, pos = chunk + 1, 0
+        return elements
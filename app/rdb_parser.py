@@ -1,150 +1,691 @@
+import mmap
 import os
-import io
+import struct
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
 
+from app import listpack, lzf, ziplist
 from app.constants import MAGIC_STR
+from app.crc64 import crc64
+from app.hash import RedisHash
+from app.quicklist import QuickList
+from app.stream import RedisStream
+from app.util import int_encoding
+from app.zset import SortedSet
+
+RDB_MAX_VERSION = 12
+
+# opcodes and value types, as in Redis' rdb.h
+RDB_OPCODE_SLOT_INFO = 0xF4
+RDB_OPCODE_FUNCTION2 = 0xF5
+RDB_OPCODE_FUNCTION_PRE_GA = 0xF6
+RDB_OPCODE_MODULE_AUX = 0xF7
+RDB_OPCODE_IDLE = 0xF8
+RDB_OPCODE_FREQ = 0xF9
+RDB_OPCODE_AUX = 0xFA
+RDB_OPCODE_RESIZEDB = 0xFB
+RDB_OPCODE_EXPIRETIME_MS = 0xFC
+RDB_OPCODE_EXPIRETIME = 0xFD
+RDB_OPCODE_SELECTDB = 0xFE
+RDB_OPCODE_EOF = 0xFF
+RDB_TYPE_STRING = 0
+RDB_TYPE_LIST = 1
+RDB_TYPE_SET = 2
+RDB_TYPE_ZSET = 3
+RDB_TYPE_HASH = 4
+RDB_TYPE_ZSET_2 = 5
+RDB_TYPE_MODULE = 6
+RDB_TYPE_MODULE_2 = 7
+RDB_TYPE_HASH_ZIPMAP = 9
+RDB_TYPE_LIST_ZIPLIST = 10
+RDB_TYPE_SET_INTSET = 11
+RDB_TYPE_ZSET_ZIPLIST = 12
+RDB_TYPE_HASH_ZIPLIST = 13
+RDB_TYPE_LIST_QUICKLIST = 14
+RDB_TYPE_STREAM_LISTPACKS = 15
+RDB_TYPE_HASH_LISTPACK = 16
+RDB_TYPE_ZSET_LISTPACK = 17
+RDB_TYPE_LIST_QUICKLIST_2 = 18
+RDB_TYPE_STREAM_LISTPACKS_2 = 19
+RDB_TYPE_SET_LISTPACK = 20
+RDB_TYPE_STREAM_LISTPACKS_3 = 21
+
+# the special string encodings, after a length byte of 0b11xxxxxx
+RDB_ENC_INT8 = 0
+RDB_ENC_INT16 = 1
+RDB_ENC_INT32 = 2
+RDB_ENC_LZF = 3
+
+# quicklist 2 node containers
+QUICKLIST_NODE_CONTAINER_PLAIN = 1
+QUICKLIST_NODE_CONTAINER_PACKED = 2
+
+STREAM_ITEM_FLAG_DELETED = 1
+STREAM_ITEM_FLAG_SAMEFIELDS = 2
+
+U32_BE = struct.Struct('>I')
+U64_BE = struct.Struct('>Q')
+U32_LE = struct.Struct('<I')
+U64_LE = struct.Struct('<Q')
+F64_LE = struct.Struct('<d')
+INT_ENCODINGS = {0xC0: struct.Struct('<b'), 0xC1: struct.Struct('<h'), 0xC2: struct.Struct('<i')}
+
+# value type -> the kind of value it holds
+TYPE_KINDS = {
+    RDB_TYPE_STRING: 'string',
+    RDB_TYPE_LIST: 'list', RDB_TYPE_LIST_ZIPLIST: 'list', RDB_TYPE_LIST_QUICKLIST: 'list',
+    RDB_TYPE_LIST_QUICKLIST_2: 'list',
+    RDB_TYPE_SET: 'set', RDB_TYPE_SET_INTSET: 'set', RDB_TYPE_SET_LISTPACK: 'set',
+    RDB_TYPE_ZSET: 'zset', RDB_TYPE_ZSET_2: 'zset', RDB_TYPE_ZSET_ZIPLIST: 'zset', RDB_TYPE_ZSET_LISTPACK: 'zset',
+    RDB_TYPE_HASH: 'hash', RDB_TYPE_HASH_ZIPMAP: 'hash', RDB_TYPE_HASH_ZIPLIST: 'hash',
+    RDB_TYPE_HASH_LISTPACK: 'hash',
+    RDB_TYPE_STREAM_LISTPACKS: 'stream', RDB_TYPE_STREAM_LISTPACKS_2: 'stream',
+    RDB_TYPE_STREAM_LISTPACKS_3: 'stream',
+}
+
+
+def load_chunk(path: Path, start: int, end: int, db: int):
+    '''Runs in a pool worker: decodes the records between offsets `start`
+    and `end` of the RDB file at `path`, the first of them in database `db`.'''
+    parser = RDBParser(path)
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        parser.data, parser.view = mapped, memoryview(mapped)
+        parser.pos = start
+        parser.select_db(db)
+        parser.parse_records(end)
+    finally:
+        parser.view.release()
+        mapped.close()
+    return parser.databases, parser.skipped
+
+
+def file_checksum(path: Path, end: int) -> int:
+    '''Runs in a pool worker: the CRC64 of the first `end` bytes of `path`.'''
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                return crc64(view[:end])
+
+
+def as_bytes(element: int | bytes) -> bytes:
+    '''Listpacks store strings that look like integers as integers.'''
+    return b'%d' % element if isinstance(element, int) else element
 
 class WrongFile(Exception):
     pass
 
 class RDBParser:
+    '''Decodes an RDB file or snapshot, every database in it, into
+    `databases`.
+
+    Files are mmapped rather than read, so loading never holds a copy of
+    the dump, and the decoder walks the map with a cursor, dropping the pages
+    behind it. Fixed size fields are read with struct.unpack_from() and
+    strings are copied out of the map once, as the bytes that end up in the
+    keyspace. With `progress` on a load reports how far it got every second.
+
+    Every value type Redis writes is decoded, but only kinds in LOADED_KINDS
+    are kept, the server has nowhere to put the others. They are counted in
+    `skipped` instead. Lists decode to QuickLists, sets to sets, hashes to
+    RedisHashes and sorted sets to SortedSets.'''
+    # keys decoded between checkpoints, which drop the pages decoded so far
+    # and report progress, so that neither happens per key
+    CHECKPOINT_EVERY = 1 << 16
+    PROGRESS_INTERVAL = 1.0
+    # chunks of a parallel load per worker, so that one slow chunk doesn't
+    # leave the other workers idle
+    CHUNKS_PER_WORKER = 4
+    LOADED_KINDS = frozenset(('string', 'stream', 'list', 'hash', 'zset'))
+    # files from this size on have their checksum computed by a worker
+    # process alongside the decoding, when there is a CPU to spare
+    CONCURRENT_CRC_SIZE = 16 << 20
 
-    def __init__(self, path: Path) -> None:
+    def __init__(self, path: Path, progress: bool = False, check_crc: bool = True) -> None:
         self.rdb_path = path
-        self.buffer: io.BytesIO = None
+        self.progress = progress
+        self.check_crc = check_crc
+        # the CRC64 of the file a worker is computing, up to where EOF should be
+        self.checksum: Future | None = None
+        # the map or bytes being decoded, slicing either copies out bytes in
+        # one step, and a memoryview of it for blobs that are only read
+        self.data: mmap.mmap | bytes = None
+        self.view: memoryview = None
+        self.pos = 0
+        self.version = 0
         self.metadata = {}
+        # db number -> the RESIZEDB hints of its keys and of its keys with a TTL
         self.hash_table_sizes = {}
-        self.database = {}
+        # db number -> (key -> value, key -> expiry in unix ms)
+        self.databases = {}
+        self.db_number = 0
+        self.database, self.expires = self.select_db(0)
+        # kind -> keys of it that weren't loaded
+        self.skipped = {}
 
-    def get_database(self):
-        return self.database
-    
-    def create_rdb_file(self):
-        with open(self.rdb_path, 'wb') as f:
-            f.write(MAGIC_STR)
+    def get_database(self, db: int = 0):
+        return self.databases.get(db, ({}, {}))[0]
+
+    def get_expires(self, db: int = 0):
+        return self.databases.get(db, ({}, {}))[1]
+
+    def select_db(self, db: int):
+        self.db_number = db
+        self.database, self.expires = self.databases.setdefault(db, ({}, {}))
+        return self.database, self.expires
 
     def read_file(self):
         with open(self.rdb_path, 'rb') as f:
-            self.buffer = io.BytesIO(f.read())
+            try:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise WrongFile(f'{self.rdb_path} is empty.')
+        try:
+            # the dump is read front to back once
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+            if self.check_crc and len(mapped) >= self.CONCURRENT_CRC_SIZE and (os.cpu_count() or 1) > 1:
+                # a file ends with EOF and the checksum, a worker computes
+                # it while the records are decoded
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    self.checksum = pool.submit(file_checksum, self.rdb_path, len(mapped) - 8)
+                    try:
+                        self.read_bytes(mapped)
+                    finally:
+                        self.checksum.cancel()
+                        self.checksum = None
+            else:
+                self.read_bytes(mapped)
+        finally:
+            mapped.close()
 
-        redis_mgc = self.buffer.read(5)
+    def read_file_parallel(self, workers: int):
+        '''Loads the file with a pool of `workers` processes. A first pass
+        indexes where records start, skipping over strings rather than
+        decoding them, and cuts the file into chunks of about equal size that
+        the workers decode. Their keyspaces are merged in file order. The
+        checksum is computed by the pool as well.'''
+        started = time.monotonic()
+        with open(self.rdb_path, 'rb') as f:
+            try:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise WrongFile(f'{self.rdb_path} is empty.')
+        try:
+            self.data, self.view = mapped, memoryview(mapped)
+            self.read_header()
+            chunks = self.index_records(workers * self.CHUNKS_PER_WORKER)
+            eof = self.pos
+            expected = U64_LE.unpack_from(mapped, eof)[0] if self.version >= 5 else 0
+            mapped.madvise(mmap.MADV_DONTNEED)
+        finally:
+            self.view.release()
+            mapped.close()
+            self.data = self.view = None
 
-        if redis_mgc != MAGIC_STR:
-            raise WrongFile(f'{self.rdb_path} is not in redis format.')
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            checksum = pool.submit(file_checksum, self.rdb_path, eof) if expected and self.check_crc else None
+            results = pool.map(load_chunk, [self.rdb_path] * len(chunks), *zip(*chunks))
+            keys = 0
+            for done, (databases, skipped) in enumerate(results, 1):
+                for db, (store, expires) in databases.items():
+                    database, db_expires = self.databases.setdefault(db, ({}, {}))
+                    database.update(store)
+                    db_expires.update(expires)
+                    keys += len(store)
+                for kind, n in skipped.items():
+                    self.skipped[kind] = self.skipped.get(kind, 0) + n
+                if self.progress:
+                    print(f'Loading RDB: {done}/{len(chunks)} chunks {keys:,} keys')
+            if checksum is not None and checksum.result() != expected:
+                raise WrongFile(f'{self.rdb_path} has a wrong checksum, the file is corrupt.')
+        self.select_db(0)
 
-        # read verion and discard
-        self.buffer.seek(4, os.SEEK_CUR)
+        self.report_skipped()
+        if self.progress:
+            elapsed = time.monotonic() - started
+            rate = keys / elapsed if elapsed else 0
+            print(f'DB loaded from disk by {workers} workers: {keys:,} keys in {elapsed:.3f} seconds, '
+                  f'{rate:,.0f} keys/sec')
 
-        # read magic \xFA
-        while self.buffer.read(1) == b'\xFA':
-            self.read_metadata()
+    def index_records(self, chunks: int) -> list[tuple[int, int, int]]:
+        '''The first pass of a parallel load: (start, end, db) of about
+        `chunks` runs of whole records, leaving the cursor after EOF.
+        Strings are skipped by their length, other values are decoded.'''
+        data = self.data
+        step = max((len(data) - self.pos) // chunks, 1)
+        bounds = []
+        chunk_start, chunk_db = self.pos, self.db_number
+        # whether the cursor is past the prefix opcodes of a key, like its
+        # expiry, which must stay in the same chunk as the key
+        in_record = False
+        while True:
+            if not in_record and self.pos - chunk_start >= step:
+                bounds.append((chunk_start, self.pos, chunk_db))
+                chunk_start, chunk_db = self.pos, self.db_number
+            op = data[self.pos]
+            self.pos += 1
+            if op == RDB_TYPE_STRING and data[self.pos] < 0x40:
+                # a short key, and a short string or an int as the value
+                value_pos = self.pos + 1 + data[self.pos]
+                value_len = data[value_pos]
+                if value_len < 0x40 or value_len in INT_ENCODINGS:
+                    self.pos = value_pos + 1 + (value_len if value_len < 0x40 else 1 << (value_len & 0x3F))
+                    in_record = False
+                    continue
+            if op == RDB_OPCODE_EOF:
+                break
+            elif op == RDB_OPCODE_SELECTDB:
+                self.db_number = self.read_length()
+            elif op in (RDB_OPCODE_EXPIRETIME_MS, RDB_OPCODE_EXPIRETIME):
+                self.pos += 8 if op == RDB_OPCODE_EXPIRETIME_MS else 4
+                in_record = True
+            elif op == RDB_OPCODE_IDLE:
+                self.read_length()
+                in_record = True
+            elif op == RDB_OPCODE_FREQ:
+                self.pos += 1
+                in_record = True
+            elif op == RDB_OPCODE_AUX:
+                self.read_metadata()
+            elif op == RDB_OPCODE_RESIZEDB:
+                self.read_hash_tables_sizes()
+            elif op in (RDB_OPCODE_FUNCTION2, RDB_OPCODE_FUNCTION_PRE_GA):
+                self.skip_string()
+            elif op == RDB_OPCODE_SLOT_INFO:
+                for _ in range(3):
+                    self.read_length()
+            elif op == RDB_OPCODE_MODULE_AUX:
+                raise WrongFile(f'{self.rdb_path} has module data, which is not supported.')
+            else:
+                self.skip_string()
+                if op == RDB_TYPE_STRING:
+                    self.skip_string()
+                else:
+                    self.get_value_by_t(op)
+                in_record = False
+        bounds.append((chunk_start, self.pos - 1, chunk_db))
+        # what isn't loaded is counted by the workers
+        self.skipped.clear()
+        return bounds
 
-        # we need to go back once, because the while loop overshoots
-        # read magic '\xFE', database no and resizedb field
-        # intentionally discarded some fields, might look into later
-        # also handling single database, should be easy to extend to handle
-        # multiple. go forward 3 times, backwards once
-        self.buffer.seek(2, os.SEEK_CUR)
+    def skip_string(self):
+        length, encoded = self.len_encode_read_bytes()
+        if not encoded:
+            self.pos += length
+        elif length == RDB_ENC_LZF:
+            compressed_len = self.read_length()
+            self.read_length()
+            self.pos += compressed_len
+        else:
+            self.pos += 1 << length
 
-        # read size of hash tables
-        self.read_hash_tables_sizes()
+    def read_bytes(self, data: bytes):
+        '''Parses an RDB held in memory, like the snapshot a master sends.'''
+        self.data = data
+        self.view = memoryview(data)
+        self.pos = 0
+        try:
+            self.parse()
+        finally:
+            # a map can't be closed while a view of it is alive
+            self.view.release()
+            self.data = self.view = None
 
-        # read hash tables
-        self.read_hash_table()
+    def parse(self):
+        self.read_header()
+        started = time.monotonic()
+        keys = self.parse_records()
+        self.check_checksum()
+        self.report_skipped()
+        if self.progress:
+            elapsed = time.monotonic() - started
+            rate = keys / elapsed if elapsed else 0
+            print(f'DB loaded from disk: {keys:,} keys in {elapsed:.3f} seconds, {rate:,.0f} keys/sec')
 
+    def read_header(self):
+        data = self.data
+        if data[:5] != MAGIC_STR:
+            raise WrongFile(f'{self.rdb_path} is not in redis format.')
+        self.version = int(data[5:9])
+        if self.version > RDB_MAX_VERSION:
+            raise WrongFile(f'{self.rdb_path} is RDB version {self.version}, which is not supported.')
+        self.pos = 9
 
-    def read_hash_table(self):
-        maps_read = 0
+    def parse_records(self, end: int | None = None) -> int:
+        '''Decodes records from the cursor up to EOF, or up to offset `end`
+        for a chunk of a parallel load. Returns the number of keys loaded.'''
+        data = self.data
+        database, expires = self.database, self.expires
+        total = len(data) if end is None else end
+        started = last_report = time.monotonic()
+        keys = 0
+        next_checkpoint = self.CHECKPOINT_EVERY
+        mapped = isinstance(self.data, mmap.mmap)
+        expire = None
         while True:
-            if maps_read >= self.hash_table_sizes['hash-table-size']:
+            if self.pos >= total:
+                if end is not None:
+                    break
+                raise WrongFile(f'{self.rdb_path} ends without an EOF marker.')
+            op = data[self.pos]
+            self.pos += 1
+            if op == RDB_OPCODE_AUX:
+                self.read_metadata()
+            elif op == RDB_OPCODE_SELECTDB:
+                database, expires = self.select_db(self.read_length())
+            elif op == RDB_OPCODE_RESIZEDB:
+                self.read_hash_tables_sizes()
+            elif op == RDB_OPCODE_EXPIRETIME_MS:
+                expire = U64_LE.unpack_from(data, self.pos)[0]
+                self.pos += 8
+            elif op == RDB_OPCODE_EXPIRETIME:
+                expire = U32_LE.unpack_from(data, self.pos)[0] * 1000
+                self.pos += 4
+            elif op == RDB_OPCODE_IDLE:
+                # LRU and LFU hints, there is no eviction to use them
+                self.read_length()
+            elif op == RDB_OPCODE_FREQ:
+                self.pos += 1
+            elif op == RDB_OPCODE_SLOT_INFO:
+                # slot id, keys in it and keys with a TTL in it
+                for _ in range(3):
+                    self.read_length()
+            elif op in (RDB_OPCODE_FUNCTION2, RDB_OPCODE_FUNCTION_PRE_GA):
+                self.read_string()
+                self.skipped['function library'] = self.skipped.get('function library', 0) + 1
+            elif op == RDB_OPCODE_MODULE_AUX:
+                raise WrongFile(f'{self.rdb_path} has module data, which is not supported.')
+            elif op == RDB_OPCODE_EOF:
                 break
-            obj_to_store = {}
-            has_expiriy = self.buffer.read(1)
-            value_t = has_expiriy
-            if has_expiriy == b'\xFD':
-                ttl = int.from_bytes(self.buffer.read(4), 'little')
-                obj_to_store['expires'] = ttl
-                value_t = self.buffer.read(1)
-            elif has_expiriy == b'\xFC':
-                ttl = int.from_bytes(self.buffer.read(8), 'little')
-                obj_to_store['expires'] = ttl // 1000
-                value_t = self.buffer.read(1)
-
-            # read key
-            key_bytes_to_read, as_int = self.len_encode_read_bytes(self.buffer.read(1))
-            key = self.buffer.read(key_bytes_to_read)
-            if not as_int:
-                key = key.decode()
-            else:
-                key = int.from_bytes(key, 'big')
-
-            # read value
-            value_read = self.get_value_by_t(value_t)
-            obj_to_store['value'] = value_read
-
-            self.database[key] = obj_to_store
-            maps_read += 1
-            
-    def get_value_by_t(self, value_t: bytes):
-        if value_t == b'\x00':
-            v2r, as_int = self.len_encode_read_bytes(self.buffer.read(1))
-            key = self.buffer.read(v2r)
-            if not as_int:
-                key = key.decode()
             else:
-                key = int.from_bytes(key, 'big')
-            return key
-        
-    def read_hash_tables_sizes(self):
-        # read hash-table size
-        bytes_read, _ = self.len_encode_read_bytes(self.buffer.read(1))
-        # self.database['hash-table-size'] = int.from_bytes(bytes_read, 'big')
-        self.hash_table_sizes['hash-table-size'] = bytes_read
+                pos = self.pos
+                key_len = data[pos]
+                value_pos = pos + 1 + key_len
+                if op == RDB_TYPE_STRING and key_len < 0x40 and (data[value_pos] < 0x40 or data[value_pos] in INT_ENCODINGS):
+                    # the bulk of most dumps, a string or int with a key
+                    # under 64 bytes, decoded here without calls
+                    key = data[pos + 1:value_pos].decode()
+                    value_len = data[value_pos]
+                    if value_len < 0x40:
+                        self.pos = value_pos + 1 + value_len
+                        database[key] = int_encoding(data[value_pos + 1:self.pos])
+                    else:
+                        int_struct = INT_ENCODINGS[value_len]
+                        database[key] = int_struct.unpack_from(data, value_pos + 1)[0]
+                        self.pos = value_pos + 1 + int_struct.size
+                else:
+                    key = self.read_string().decode()
+                    value = self.get_value_by_t(op)
+                    kind = TYPE_KINDS[op]
+                    if kind not in self.LOADED_KINDS:
+                        self.skipped[kind] = self.skipped.get(kind, 0) + 1
+                        expire = None
+                        continue
+                    database[key] = value
+                if expire is not None:
+                    expires[key] = expire
+                    expire = None
+                keys += 1
+                if keys >= next_checkpoint:
+                    next_checkpoint += self.CHECKPOINT_EVERY
+                    if mapped:
+                        # mapped pages count towards RSS until they are dropped
+                        self.data.madvise(mmap.MADV_DONTNEED, 0, self.pos - self.pos % mmap.PAGESIZE)
+                    now = time.monotonic()
+                    if self.progress and now - last_report >= self.PROGRESS_INTERVAL:
+                        last_report = now
+                        print(f'Loading RDB: {self.pos * 100 // total}% {keys:,} keys '
+                              f'{keys / (now - started):,.0f} keys/sec')
 
-        # read expire hash-table size
-        bytes_read, _ = self.len_encode_read_bytes(self.buffer.read(1))
-        # self.database['hash-table-expire-size'] = int.from_bytes(bytes_read, 'big')
-        self.hash_table_sizes['hash-table-expire-size'] = bytes_read
+        return keys
 
-    def read_metadata(self):
-        # read key
-        key_len, key_as_int = self.len_encode_read_bytes(self.buffer.read(1))
-        key = self.buffer.read(key_len)
-        if not key_as_int:
-            key = key.decode()
+    def report_skipped(self):
+        if self.skipped:
+            skipped = ', '.join(f'{n} {kind}' for kind, n in self.skipped.items())
+            print(f'Skipped what the server does not support in {self.rdb_path or "the snapshot"}: {skipped}')
+
+    def check_checksum(self):
+        '''The CRC64 of everything up to and including EOF. Files written
+        with `rdbchecksum no`, like the ones RDBWriter writes, have zeros.'''
+        if self.version < 5:
+            return
+        expected = U64_LE.unpack_from(self.data, self.pos)[0]
+        if not expected or not self.check_crc:
+            return
+        if self.checksum is not None and self.pos == len(self.data) - 8:
+            actual = self.checksum.result()
         else:
-            key = int.from_bytes(key, 'big')
+            actual = crc64(self.view[:self.pos])
+        if actual != expected:
+            raise WrongFile(f'{self.rdb_path} has a wrong checksum, the file is corrupt.')
 
-        # read value
-        val_len, val_as_int = self.len_encode_read_bytes(self.buffer.read(1))
+    def get_value_by_t(self, value_t: int):
+        if value_t == RDB_TYPE_STRING:
+            value = self.read_string_object()
+            return value if isinstance(value, int) else int_encoding(value)
+        if value_t in (RDB_TYPE_STREAM_LISTPACKS, RDB_TYPE_STREAM_LISTPACKS_2, RDB_TYPE_STREAM_LISTPACKS_3):
+            return self.read_stream(value_t)
+        if value_t in (RDB_TYPE_LIST, RDB_TYPE_SET):
+            elements = [self.read_string() for _ in range(self.read_length())]
+            return QuickList(elements) if value_t == RDB_TYPE_LIST else set(elements)
+        if value_t == RDB_TYPE_HASH:
+            return RedisHash({self.read_string(): self.read_string() for _ in range(self.read_length())})
+        if value_t in (RDB_TYPE_ZSET, RDB_TYPE_ZSET_2):
+            read_score = self.read_double if value_t == RDB_TYPE_ZSET else self.read_binary_double
+            return SortedSet({self.read_string(): read_score() for _ in range(self.read_length())})
+        if value_t == RDB_TYPE_LIST_QUICKLIST:
+            return QuickList([as_bytes(x) for _ in range(self.read_length()) for x in ziplist.decode(self.read_blob())])
+        if value_t == RDB_TYPE_LIST_QUICKLIST_2:
+            elements = []
+            for _ in range(self.read_length()):
+                if self.read_length() == QUICKLIST_NODE_CONTAINER_PLAIN:
+                    elements.append(self.read_string())
+                else:
+                    elements += [as_bytes(x) for x in listpack.decode(self.read_blob())]
+            return QuickList(elements)
+        if value_t == RDB_TYPE_HASH_ZIPMAP:
+            return RedisHash(self.read_zipmap(self.read_blob()))
+        if value_t == RDB_TYPE_SET_INTSET:
+            return self.read_intset(self.read_blob())
+        if value_t in (RDB_TYPE_LIST_ZIPLIST, RDB_TYPE_ZSET_ZIPLIST, RDB_TYPE_HASH_ZIPLIST):
+            return self.collection(value_t, [as_bytes(x) for x in ziplist.decode(self.read_blob())])
+        if value_t in (RDB_TYPE_HASH_LISTPACK, RDB_TYPE_ZSET_LISTPACK, RDB_TYPE_SET_LISTPACK):
+            return self.collection(value_t, [as_bytes(x) for x in listpack.decode(self.read_blob())])
+        if value_t in (RDB_TYPE_MODULE, RDB_TYPE_MODULE_2):
+            raise WrongFile(f'{self.rdb_path} has module values, which are not supported.')
+        raise WrongFile(f'{self.rdb_path} has a value of type {value_t}, which is not supported.')
 
-        val = self.buffer.read(val_len)
-        if not val_as_int:
-            val = val.decode()
-        else:
-            val = int.from_bytes(val, 'big')
+    @staticmethod
+    def collection(value_t: int, elements: list[bytes]):
+        '''A list, set, hash or sorted set from the flat elements of a
+        ziplist or listpack.'''
+        kind = TYPE_KINDS[value_t]
+        if kind == 'list':
+            return QuickList(elements)
+        if kind == 'set':
+            return set(elements)
+        if kind == 'hash':
+            return RedisHash(dict(zip(elements[0::2], elements[1::2])))
+        return SortedSet({member: float(score) for member, score in zip(elements[0::2], elements[1::2])})
 
-        # store metadata
-        self.metadata[key] = val
+    def read_string_object(self) -> bytes | int:
+        '''The string at the cursor, int encoded ones as ints.'''
+        length, encoded = self.len_encode_read_bytes()
+        start = self.pos
+        if not encoded:
+            self.pos += length
+            return self.data[start:self.pos]
+        if length == RDB_ENC_LZF:
+            return self.read_lzf()
+        int_struct = INT_ENCODINGS[0xC0 | length]
+        self.pos += int_struct.size
+        return int_struct.unpack_from(self.data, start)[0]
+
+    def read_string(self) -> bytes:
+        value = self.read_string_object()
+        return b'%d' % value if isinstance(value, int) else value
+
+    def read_blob(self) -> memoryview | bytes:
+        '''A ziplist, listpack or intset, which is only read: a view into the
+        map unless it is compressed.'''
+        length, encoded = self.len_encode_read_bytes()
+        if encoded:
+            if length != RDB_ENC_LZF:
+                raise WrongFile(f'{self.rdb_path} has an int encoded blob.')
+            return self.read_lzf()
+        self.pos += length
+        return self.view[self.pos - length:self.pos]
+
+    def read_lzf(self) -> bytes:
+        compressed_len = self.read_length()
+        length = self.read_length()
+        start = self.pos
+        self.pos += compressed_len
+        try:
+            return lzf.decompress(self.view[start:self.pos], length)
+        except (ValueError, IndexError) as e:
+            raise WrongFile(f'{self.rdb_path} has a corrupt compressed string: {e}')
 
-    def len_encode_read_bytes(self, _byte: bytes):
-        """Returns a tuple of values. First value determines the lenght of bytes to read
-        . Second value tells us if we interprete as integer."""
+    def read_length(self) -> int:
+        return self.len_encode_read_bytes()[0]
+
+    def read_double(self) -> float:
+        '''The string doubles of RDB_TYPE_ZSET, a length byte or one of 253,
+        254 and 255 for nan, inf and -inf.'''
+        length = self.data[self.pos]
+        self.pos += 1
+        if length >= 253:
+            return (float('nan'), float('inf'), float('-inf'))[length - 253]
+        self.pos += length
+        return float(self.data[self.pos - length:self.pos])
+
+    def read_binary_double(self) -> float:
+        self.pos += 8
+        return F64_LE.unpack_from(self.data, self.pos - 8)[0]
+
+    @staticmethod
+    def read_intset(blob) -> set[bytes]:
+        '''<encoding:u32> <length:u32> <integers>, little endian integers of
+        the encoding's width.'''
+        width = U32_LE.unpack_from(blob, 0)[0]
+        length = U32_LE.unpack_from(blob, 4)[0]
+        return {b'%d' % int.from_bytes(blob[8 + i * width:8 + (i + 1) * width], 'little', signed=True)
+                for i in range(length)}
+
+    @staticmethod
+    def read_zipmap(blob) -> dict[bytes, bytes]:
+        '''<zmlen> then <len>key<len><free>value<free bytes> pairs until
+        0xFF, lengths 1 byte or 254 and 4 bytes.'''
+        def read_len(pos):
+            if blob[pos] < 254:
+                return blob[pos], pos + 1
+            return U32_LE.unpack_from(blob, pos + 1)[0], pos + 5
+        pairs = {}
+        pos = 1
+        while blob[pos] != 0xFF:
+            length, pos = read_len(pos)
+            field = bytes(blob[pos:pos + length])
+            length, pos = read_len(pos + length)
+            free = blob[pos]
+            pairs[field] = bytes(blob[pos + 1:pos + 1 + length])
+            pos += 1 + length + free
+        return pairs
+
+    def read_stream(self, value_t: int):
+        '''RDB_TYPE_STREAM_LISTPACKS and its later versions: listpack nodes
+        keyed by their master id, then the length and last id. Consumer
+        groups aren't supported, they are read past and dropped.'''
+        stream = RedisStream(None)
+        for _ in range(self.read_length()):
+            master_id = self.read_string()
+            master_ms = int.from_bytes(master_id[:8], 'big')
+            master_seq = int.from_bytes(master_id[8:], 'big')
+            elements = listpack.decode(self.read_blob())
+            # master entry: count, deleted, number of fields, fields, 0
+            count, deleted, no_of_fields = elements[0], elements[1], elements[2]
+            master_fields = [as_bytes(x) for x in elements[3:3 + no_of_fields]]
+            pos = 3 + no_of_fields + 1
+            for _ in range(count + deleted):
+                flags, ms_diff, seq_diff = elements[pos], elements[pos + 1], elements[pos + 2]
+                pos += 3
+                if flags & STREAM_ITEM_FLAG_SAMEFIELDS:
+                    values = elements[pos:pos + no_of_fields]
+                    pos += no_of_fields
+                    fields = [as_bytes(x) for pair in zip(master_fields, values) for x in pair]
+                else:
+                    n = elements[pos]
+                    fields = [as_bytes(x) for x in elements[pos + 1:pos + 1 + 2 * n]]
+                    pos += 1 + 2 * n
+                # lp-count
+                pos += 1
+                if not flags & STREAM_ITEM_FLAG_DELETED:
+                    stream.append((master_ms + ms_diff, master_seq + seq_diff), fields)
+        # length, then the last id, which can be past the last entry
+        self.read_length()
+        stream.last_id = (self.read_length(), self.read_length())
+        if value_t >= RDB_TYPE_STREAM_LISTPACKS_2:
+            # first id, max deleted id and entries added
+            for _ in range(5):
+                self.read_length()
+        groups = self.read_length()
+        for _ in range(groups):
+            self.skip_consumer_group(value_t)
+        if groups:
+            self.skipped['consumer group'] = self.skipped.get('consumer group', 0) + groups
+        return stream
+
+    def skip_consumer_group(self, value_t: int):
+        # name, last delivered id and, from version 2, entries read
+        self.read_string()
+        for _ in range(3 if value_t >= RDB_TYPE_STREAM_LISTPACKS_2 else 2):
+            self.read_length()
+        # pending entries: raw id, delivery time and count
+        for _ in range(self.read_length()):
+            self.pos += 16 + 8
+            self.read_length()
+        # consumers: name, seen time, from version 3 active time, and the
+        # raw ids of their pending entries
+        for _ in range(self.read_length()):
+            self.read_string()
+            self.pos += 8 if value_t < RDB_TYPE_STREAM_LISTPACKS_3 else 16
+            pending = self.read_length()
+            self.pos += 16 * pending
+
+    def read_hash_tables_sizes(self):
+        self.hash_table_sizes[self.db_number] = {
+            'hash-table-size': self.read_length(),
+            'hash-table-expire-size': self.read_length(),
+        }
+
+    def read_metadata(self):
+        key = self.read_string_object()
+        key = key if isinstance(key, int) else key.decode()
+        val = self.read_string_object()
+        val = val if isinstance(val, int) else val.decode()
+        self.metadata[key] = val
 
-        first_two_bits = (_byte[0] & 0xC0) >> 6
-        last_6_bits = _byte[0] & 0x3F
+    def len_encode_read_bytes(self):
+        """Reads a length encoding at the cursor. Returns the length, or for
+        the special string encodings the encoding, and whether it is one."""
+        data = self.data
+        first = data[self.pos]
+        self.pos += 1
+        first_two_bits = first >> 6
+        last_6_bits = first & 0x3F
         if first_two_bits == 0x00:
             return last_6_bits, False
         elif first_two_bits == 0x01:
-            another_byte = self.buffer.read(1)[0]
-            last_6_bits <<= 8
-            return last_6_bits | another_byte, False
+            self.pos += 1
+            return last_6_bits << 8 | data[self.pos - 1], False
         elif first_two_bits == 0x02:
-            return int.from_bytes(self.buffer.read(4)), False
-        elif first_two_bits == 0x03:
-            if last_6_bits == 0x00:
-                return 1, True
-            if last_6_bits == 0x01:
-                return 2, True
-            if last_6_bits == 0x00:
-                return 4, True
+            # 0x80 is followed by a 32 bit length, 0x81 by a 64 bit one
+            if last_6_bits:
+                self.pos += 8
+                return U64_BE.unpack_from(data, self.pos - 8)[0], False
+            self.pos += 4
+            return U32_BE.unpack_from(data, self.pos - 4)[0], False
+        if last_6_bits > RDB_ENC_LZF:
+            raise WrongFile(f'{self.rdb_path} has a string encoding {first:#x}, which is not supported.')
+        return last_6_bits, True
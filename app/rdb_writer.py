@@ -0,0 +1,178 @@
+import struct
+import time
+from typing import BinaryIO
+
+from app import listpack
+from app.constants import MAGIC_STR
+from app.rdb_parser import (RDB_OPCODE_AUX, RDB_OPCODE_RESIZEDB, RDB_OPCODE_EXPIRETIME_MS, RDB_OPCODE_SELECTDB,
+                            RDB_OPCODE_EOF, RDB_TYPE_HASH, RDB_TYPE_HASH_LISTPACK, RDB_TYPE_LIST_QUICKLIST_2,
+                            RDB_TYPE_STRING, RDB_TYPE_STREAM_LISTPACKS, RDB_TYPE_ZSET_2,
+                            QUICKLIST_NODE_CONTAINER_PACKED)
+from app.storage import Keyspace, QuickList, RedisHash, RedisStream, SortedSet
+
+RDB_VERSION = b'0011'
+
+# stream entry flags and node size, like Redis' stream-node-max-entries
+STREAM_ITEM_FLAG_NONE = 0
+STREAM_ITEM_FLAG_SAMEFIELDS = 2
+STREAM_NODE_MAX_ENTRIES = 100
+
+F64_LE = struct.Struct('<d')
+
+
+def encode_length(n: int) -> bytes:
+    if n < 1 << 6:
+        return bytes((n,))
+    if n < 1 << 14:
+        return bytes((0x40 | n >> 8, n & 0xFF))
+    if n < 1 << 32:
+        return b'\x80' + n.to_bytes(4, 'big')
+    return b'\x81' + n.to_bytes(8, 'big')
+
+
+def encode_string(value: bytes) -> bytes:
+    return encode_length(len(value)) + value
+
+
+def encode_int(value: int) -> bytes:
+    '''An int in the smallest of the int8, int16 and int32 string encodings,
+    or as its decimal string if it needs more than 32 bits.'''
+    if -(1 << 7) <= value < 1 << 7:
+        return b'\xC0' + value.to_bytes(1, 'little', signed=True)
+    if -(1 << 15) <= value < 1 << 15:
+        return b'\xC1' + value.to_bytes(2, 'little', signed=True)
+    if -(1 << 31) <= value < 1 << 31:
+        return b'\xC2' + value.to_bytes(4, 'little', signed=True)
+    return encode_string(b'%d' % value)
+
+
+class RDBWriter:
+    '''Serializes a Keyspace in the RDB format read by RDBParser: strings,
+    TTLs, streams, lists, hashes and sorted sets, each db that has keys
+    after a SELECTDB of it. Output goes through `f` in chunks of FLUSH_SIZE,
+    so a snapshot never sits in memory as a whole.
+
+    Ints are written in the int string encodings, like Redis does, those
+    over 32 bits as their decimal strings. The checksum is left as zeros,
+    which readers take as "not computed".'''
+    FLUSH_SIZE = 64 * 1024
+
+    def __init__(self, keyspace: Keyspace) -> None:
+        self.keyspace = keyspace
+
+    def write(self, f: BinaryIO):
+        '''Writes the snapshot to `f` and returns the number of bytes.'''
+        buf = bytearray()
+        written = 0
+        buf += MAGIC_STR + RDB_VERSION
+        for key, value in (('redis-ver', '7.2.0'), ('redis-bits', '64'), ('ctime', str(int(time.time())))):
+            buf.append(RDB_OPCODE_AUX)
+            buf += encode_string(key.encode()) + encode_string(value.encode())
+
+        for db in self.keyspace.dbs:
+            if not db.store:
+                continue
+            store, expires = db.store, db.expires
+            buf.append(RDB_OPCODE_SELECTDB)
+            buf += encode_length(db.id)
+            buf.append(RDB_OPCODE_RESIZEDB)
+            buf += encode_length(len(store)) + encode_length(len(expires))
+
+            for key, value in store.items():
+                expire = expires.get(key) if expires else None
+                if expire is not None:
+                    buf.append(RDB_OPCODE_EXPIRETIME_MS)
+                    buf += expire.to_bytes(8, 'little')
+                key = key.encode()
+                if isinstance(value, bytes):
+                    buf.append(RDB_TYPE_STRING)
+                    buf += encode_length(len(key)) + key + encode_length(len(value)) + value
+                elif isinstance(value, int):
+                    buf.append(RDB_TYPE_STRING)
+                    buf += encode_length(len(key)) + key + encode_int(value)
+                elif isinstance(value, RedisStream):
+                    buf.append(RDB_TYPE_STREAM_LISTPACKS)
+                    buf += encode_string(key)
+                    buf += self.encode_stream(value)
+                elif isinstance(value, QuickList):
+                    buf.append(RDB_TYPE_LIST_QUICKLIST_2)
+                    buf += encode_string(key)
+                    buf += self.encode_list(value)
+                elif isinstance(value, RedisHash):
+                    if value.encoding == 'listpack':
+                        buf.append(RDB_TYPE_HASH_LISTPACK)
+                        buf += encode_string(key)
+                        buf += encode_string(listpack.encode(value.entries))
+                    else:
+                        buf.append(RDB_TYPE_HASH)
+                        buf += encode_string(key)
+                        buf += self.encode_hash(value)
+                elif isinstance(value, SortedSet):
+                    buf.append(RDB_TYPE_ZSET_2)
+                    buf += encode_string(key)
+                    buf += self.encode_zset(value)
+                if len(buf) >= self.FLUSH_SIZE:
+                    f.write(buf)
+                    written += len(buf)
+                    buf.clear()
+
+        buf.append(RDB_OPCODE_EOF)
+        buf += bytes(8)
+        f.write(buf)
+        return written + len(buf)
+
+    def encode_list(self, quicklist: QuickList) -> bytes:
+        '''Each chunk as a listpack node, like Redis' quicklist.'''
+        out = bytearray(encode_length(len(quicklist.chunks)))
+        for chunk in quicklist.chunks:
+            out += encode_length(QUICKLIST_NODE_CONTAINER_PACKED)
+            out += encode_string(listpack.encode(chunk))
+        return bytes(out)
+
+    def encode_hash(self, hash: RedisHash) -> bytes:
+        out = bytearray(encode_length(len(hash)))
+        for field, value in hash.items():
+            out += encode_string(field)
+            out += encode_int(value) if isinstance(value, int) else encode_string(value)
+        return bytes(out)
+
+    def encode_zset(self, zset: SortedSet) -> bytes:
+        '''Members with their scores as binary doubles, lowest score first.'''
+        out = bytearray(encode_length(len(zset)))
+        pack = F64_LE.pack
+        for score, member in zset:
+            out += encode_length(len(member))
+            out += member
+            out += pack(score)
+        return bytes(out)
+
+    def encode_stream(self, stream: RedisStream) -> bytes:
+        '''A stream as listpack nodes of up to STREAM_NODE_MAX_ENTRIES entries,
+        each keyed by the id of its first entry, its master entry.'''
+        out = bytearray()
+        ids, entries = stream.ids, stream.entries
+        nodes = range(0, len(ids), STREAM_NODE_MAX_ENTRIES)
+        out += encode_length(len(nodes))
+        for start in nodes:
+            end = min(start + STREAM_NODE_MAX_ENTRIES, len(ids))
+            master_ms, master_seq = ids[start]
+            master_fields = entries[start][0::2]
+            elements = [end - start, 0, len(master_fields), *master_fields, 0]
+            for idx in range(start, end):
+                ms, seq = ids[idx]
+                fields = entries[idx]
+                if fields[0::2] == master_fields:
+                    elements += [STREAM_ITEM_FLAG_SAMEFIELDS, ms - master_ms, seq - master_seq, *fields[1::2]]
+                    lp_count = 3 + len(master_fields)
+                else:
+                    elements += [STREAM_ITEM_FLAG_NONE, ms - master_ms, seq - master_seq, len(fields) // 2, *fields]
+                    lp_count = 3 + 1 + len(fields)
+                elements.append(lp_count)
+            out += encode_string(master_ms.to_bytes(8, 'big') + master_seq.to_bytes(8, 'big'))
+            out += encode_string(listpack.encode(elements))
+
+        last_ms, last_seq = stream.last_id
+        out += encode_length(len(ids)) + encode_length(last_ms) + encode_length(last_seq)
+        # consumer groups
+        out += encode_length(0)
+        return bytes(out)
@@ -1,17 +1,192 @@
+import os
 import socket
+import tempfile
+from pathlib import Path
+
+from app import clock
+from app.backlog import ReplicationBacklog
+from app.blocking import BlockingRegistry
+from app.encoder import ENCODER, EncodedMessageType
+from app.namespace import ConfigNamespace, server_config
+from app.persistence import Persistence
+
+# the key WAIT blocks on, signalled by every REPLCONF ACK
+REPLICA_ACK = 'replica-ack'
 
 class Replicas:
+    '''The replicas of a master and the replication stream sent to them.
 
-    def __init__(self) -> None:
+    A full sync snapshots the keyspace in a forked child, like BGSAVE, so
+    the master keeps serving clients while it is written. Replicas that ask
+    for one while another child runs wait for it to exit. The FULLRESYNC
+    reply, with the offset the snapshot is at, goes out when the child is
+    forked, and the stream from there on is held back until the snapshot
+    has been sent.'''
+
+    def __init__(self, persistence: Persistence | None = None) -> None:
+        self.persistence = persistence
         self.replicas: list[socket.socket] = []
+        # clients in WAIT, woken as acks come in
+        self.ack_waiters = BlockingRegistry()
+        # created with the first replica, like Redis
+        self.backlog: ReplicationBacklog | None = None
+        # replica -> writes propagated while its snapshot is being sent
+        self.syncing: dict[socket.socket, bytearray] = {}
+        # replicas that asked for a full sync and wait for a snapshot child
+        self.waiting_sync: list[socket.socket] = []
+        # the replicas the running snapshot child writes for, and its file
+        self.sync_batch: list[socket.socket] = []
+        self.sync_path: Path | None = None
+        # replica -> when it went over the soft output buffer limit, in ms
+        self.soft_limit_since: dict[socket.socket, int] = {}
+        self.disconnected_for_output = 0
+        # the db of the last SELECT in the stream, -1 to send one before the
+        # next write whatever its db
+        self.selected_db = -1
 
     def __len__(self):
-        return len(self.replicas)
+        return sum(1 for _ in self.get_all_replicas())
 
     def add_replica(self, sock: socket.socket):
+        self.create_backlog()
         self.replicas.append(sock)
 
+    def create_backlog(self):
+        if self.backlog is None:
+            self.backlog = ReplicationBacklog(ConfigNamespace.repl_backlog_size, server_config.acked_commands)
+
     def get_all_replicas(self):
+        if any(replica.closed for replica in self.replicas):
+            for replica in self.replicas:
+                if replica.closed:
+                    server_config.acked_replicas.pop(replica.getpeername(), None)
+            self.replicas = [replica for replica in self.replicas if not replica.closed]
+            self.syncing = {replica: buffered for replica, buffered in self.syncing.items() if not replica.closed}
+            self.soft_limit_since = {replica: ms for replica, ms in self.soft_limit_since.items() if not replica.closed}
         for replica in self.replicas:
             yield replica
 
+    def feed(self, encoded: bytes, db: int | None = None):
+        '''Appends `encoded` to the replication stream: every replica, the
+        backlog and the master offset. Until a replica shows up there is no
+        stream to keep. A write in `db` is preceded by a SELECT of it if the
+        stream was in another db.'''
+        if self.backlog is None and not self.replicas:
+            return
+        if db is not None and db != self.selected_db:
+            encoded = ENCODER.encode_array([b'SELECT', b'%d' % db]) + encoded
+            self.selected_db = db
+        now = clock.now_ms()
+        for replica in self.get_all_replicas():
+            buffered = self.syncing.get(replica)
+            if buffered is not None:
+                buffered += encoded
+            else:
+                replica.sendall(encoded)
+            self.check_output_limit(replica, now)
+        if self.backlog is not None:
+            self.backlog.append(encoded)
+        server_config.acked_commands += len(encoded)
+
+    def check_output_limit(self, replica, now: int):
+        '''Disconnects a replica whose output, including writes held back
+        during its sync, is over the hard limit, or has stayed over the soft
+        limit for the configured seconds, like Redis'
+        client-output-buffer-limit replica. Otherwise one replica that stops
+        reading makes the master buffer the whole write stream for it.'''
+        hard, soft, soft_seconds = ConfigNamespace.replica_output_buffer_limit
+        size = replica.output_size() + len(self.syncing.get(replica, b''))
+        over = bool(hard) and size > hard
+        if not over and soft and size > soft:
+            since = self.soft_limit_since.setdefault(replica, now)
+            over = now - since >= soft_seconds * 1000
+        elif replica in self.soft_limit_since:
+            del self.soft_limit_since[replica]
+
+        if over:
+            print(f'Replica {replica.getpeername()} closed for overcoming of output buffer limits ({size} bytes)')
+            self.disconnected_for_output += 1
+            replica.close()
+
+    def full_sync(self, replica):
+        '''Queues `replica` for a snapshot, started right away unless a
+        child is running already.'''
+        self.create_backlog()
+        self.waiting_sync.append(replica)
+        self.start_pending_sync()
+
+    def start_pending_sync(self):
+        '''Forks the snapshot child for the replicas waiting for one, if no
+        other child runs. Called by the cron too.'''
+        waiting = [replica for replica in self.waiting_sync if not replica.closed]
+        if not waiting or self.persistence.child_pid is not None:
+            self.waiting_sync = waiting
+            return
+        self.waiting_sync = []
+        directory = ConfigNamespace.dir or tempfile.gettempdir()
+        self.sync_path = Path(directory) / f'temp-sync-{os.getpid()}.rdb'
+        if not self.persistence.sync_snapshot(self.sync_path, self.snapshot_done):
+            for replica in waiting:
+                replica.close()
+            return
+        print(f'Starting BGSAVE for SYNC with target: disk, {len(waiting)} replicas')
+        reply = ENCODER.encode(f'FULLRESYNC {server_config.replid} {server_config.acked_commands}',
+                               EncodedMessageType.SIMPLE_STRING)
+        # the replica starts in db 0 after loading the snapshot
+        self.selected_db = -1
+        for replica in waiting:
+            replica.sendall(reply)
+            self.replicas.append(replica)
+            self.syncing[replica] = bytearray()
+        self.sync_batch = waiting
+
+    def snapshot_done(self, ok: bool):
+        '''Starts sending the snapshot to each replica it was written for,
+        or drops them if the child failed.'''
+        batch, self.sync_batch = self.sync_batch, []
+        path, self.sync_path = self.sync_path, None
+        if not ok:
+            print('Background saving for SYNC failed, closing replicas')
+        for replica in batch:
+            if not ok:
+                replica.close()
+            elif not replica.closed:
+                snapshot = open(path, 'rb')
+                RdbTransfer(self, replica, snapshot, os.fstat(snapshot.fileno()).st_size).start()
+        # the files opened above keep it until they are closed
+        path.unlink(missing_ok=True)
+
+    def sync_done(self, replica):
+        buffered = self.syncing.pop(replica, None)
+        if buffered and not replica.closed:
+            replica.sendall(bytes(buffered))
+
+
+class RdbTransfer:
+    '''Streams a snapshot file to a replica as a bulk string without the
+    trailing CRLF, one chunk each time the previous one has been taken.'''
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, replicas: Replicas, replica, snapshot, size: int) -> None:
+        self.replicas = replicas
+        self.replica = replica
+        self.snapshot = snapshot
+        self.size = size
+
+    def start(self):
+        self.replica.sendall(b'$%d\r\n' % self.size)
+        self.send_chunk()
+
+    def send_chunk(self):
+        if self.replica.closed:
+            self.snapshot.close()
+            self.replicas.syncing.pop(self.replica, None)
+            return
+        chunk = self.snapshot.read(self.CHUNK_SIZE)
+        if not chunk:
+            self.snapshot.close()
+            self.replicas.sync_done(self.replica)
+            return
+        self.replica.sendall(chunk)
+        self.replica.flush()
+        self.replica.when_drained(self.send_chunk)
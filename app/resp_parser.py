@@ -1,9 +1,13 @@
 from enum import IntEnum
-from socket import socket
-from selectors import BaseSelector
 
 from app.constants import BOUNDARY, STRING, BULK_STRING, ARRAY, MAGIC_STR, INTEGER
 
+# type bytes as ints, indexing a bytearray doesn't allocate like slicing does
+_STRING, _BULK_STRING, _ARRAY, _INTEGER = STRING[0], BULK_STRING[0], ARRAY[0], INTEGER[0]
+
+# returned by the command fast path for messages it doesn't handle
+FALLBACK = object()
+
 class WrongMessage(Exception):
     pass
 
@@ -21,182 +25,206 @@ class States(IntEnum):
     READ_INTEGER = 6
 
 class RespParser:
-    def __init__(self, *, debug=False) -> None:
+    '''Incremental RESP parser meant to live as long as the connection.
+
+    Received bytes are appended to `buffer`, `pos` is the read cursor and
+    `msg_start` where the message being parsed began. A frame split across
+    reads leaves the state machine where it stopped, it simply resumes once
+    more bytes are fed. Consumed prefixes are dropped from the front of the
+    bytearray, which CPython does by moving its start pointer, not by copying.'''
+    RECV_SIZE = 65536
+
+    def __init__(self, *, debug=False, fast_path=True) -> None:
         self.debug = debug
-        self.running_idx = 0
+        self.fast_path = fast_path
+        self.buffer = bytearray()
         self.pos = 0
+        # length in bytes of the last complete message, replicas count these
+        self.last_msg_len = 0
         self.init()
-    
+
     def incr(self):
         self.pos +=1
-    
-    def consume_boundary(self):
-        if self.buffer[self.pos:self.pos+1] == b'\r' and self.buffer[self.pos + 1:self.pos+2] == b'\n':
-            self.pos += 2
 
     def init(self):
-        self.buffer = b''
-        self.buffer_type: bytes = None
-        self.running_idx += self.pos
-        self.pos = 0
+        self.msg_start = self.pos
         self.current_state = States.READ_TYPE
         self.misc = {}
         self.arr_stack = []
 
-    def consume_until_boundary(self, len_to_consume = None):
-        if len_to_consume is None:
-            end_idx = self.buffer.find(BOUNDARY, self.pos)
-            if end_idx == -1:
-                return
-            val = self.buffer[self.pos:end_idx]
-        else:
-            val = self.buffer[self.pos:self.pos+len_to_consume]
-        self.pos += len(val)
+    def feed(self, data: bytes):
+        self.buffer += data
+
+    def compact(self):
+        '''Drop the bytes of every message already returned.'''
+        if self.msg_start:
+            del self.buffer[:self.msg_start]
+            self.pos -= self.msg_start
+            self.msg_start = 0
+
+    def consume_line(self):
+        '''Returns the bytes up to the next boundary and moves past it, or None
+        if the boundary hasn't arrived yet.'''
+        end_idx = self.buffer.find(BOUNDARY, self.pos)
+        if end_idx == -1:
+            return
+        val = self.take(self.pos, end_idx)
+        self.pos = end_idx + len(BOUNDARY)
         return val
-            
+
+    def take(self, start: int, end: int):
+        '''Copies buffer[start:end] into bytes once, slicing the bytearray
+        itself would copy twice.'''
+        with memoryview(self.buffer) as view:
+            return bytes(view[start:end])
+
+    def parse_command(self):
+        '''Fast path for a flat array of bulk strings, the shape of every client
+        command. Length lines are located with find() and every argument is
+        copied exactly once out of a memoryview. Returns the argument list,
+        None if the command hasn't fully arrived yet, or FALLBACK when the
+        message has some other shape and the state machine has to parse it.'''
+        buffer = self.buffer
+        buffer_len = len(buffer)
+        end_idx = buffer.find(BOUNDARY, self.pos)
+        if end_idx == -1:
+            return None
+        no_of_items = int(buffer[self.pos+1:end_idx])
+        if no_of_items <= 0:
+            return FALLBACK
+        pos = end_idx + 2
+        args = []
+        with memoryview(buffer) as view:
+            for _ in range(no_of_items):
+                if pos >= buffer_len:
+                    return None
+                if buffer[pos] != _BULK_STRING:
+                    return FALLBACK
+                end_idx = buffer.find(BOUNDARY, pos)
+                if end_idx == -1:
+                    return None
+                length = int(buffer[pos+1:end_idx])
+                if length < 0:
+                    return FALLBACK
+                pos = end_idx + 2 + length
+                if pos + 2 > buffer_len:
+                    return None
+                args.append(bytes(view[end_idx+2:pos]))
+                pos += 2
+        self.pos = pos
+        return args
 
     def add_ele_to_arr(self, ele):
         top_arr = self.arr_stack[-1]
         top_arr['items'].append(ele)
         self.current_state = States.READ_ARR_ELE
 
-    def parse_all(self, sock: socket, selector: BaseSelector | None = None):
-        buffer = b''
-        while True:
-            try:
-                chunk = sock.recv(1024)
-                if not chunk:
-                    if selector:
-                        selector.unregister(sock)
-                    sock.close()
-                    return
-                buffer += chunk
-            except BlockingIOError:
-                break
-        return self.parse_multiple(buffer)
-
-    def parse_multiple(self, data: bytes):
+    def parse_multiple(self, data: bytes = b''):
+        self.feed(data)
         all_msg = []
-        while msg := self.parse(data[self.running_idx:]):
+        while (msg := self.parse()) is not None:
             all_msg.append(msg)
-
-        self.running_idx = 0
+        self.compact()
         return all_msg
 
-    def parse(self, data: bytes):
-        if self.buffer_type is None:
-            self.buffer_type = data[:1]
-        self.buffer += data
+    def parse(self, data: bytes = b''):
+        '''Returns the next complete message, None when the buffer holds only
+        part of one.'''
+        if data:
+            self.feed(data)
+
+        if (self.fast_path and self.current_state == States.READ_TYPE and not self.arr_stack
+                and self.pos < len(self.buffer) and self.buffer[self.pos] == _ARRAY):
+            cmd = self.parse_command()
+            if cmd is None:
+                return None
+            if cmd is not FALLBACK:
+                self.last_msg_len = self.pos - self.msg_start
+                self.init()
+                return cmd
 
         while True:
-            
             if self.current_state == States.READ_TYPE:
-                if self.pos < len(self.buffer):
-                    data_type = self.buffer[self.pos:self.pos+1]
-                    self.incr()
-                    if data_type == BULK_STRING:
-                        self.current_state = States.READ_STR_LEN
-                    elif data_type == STRING:
-                        self.current_state = States.READ_SMPL_STR
-                    elif data_type == ARRAY:
-                        self.current_state = States.READ_ARR_LEN
-                    elif data_type == INTEGER:
-                        self.current_state = States.READ_INTEGER
-                else:
-                    # validate data here
-                    break
-            elif self.current_state == States.READ_STR_LEN:
-                length = self.consume_until_boundary()
+                if self.pos >= len(self.buffer):
+                    return None
+                data_type = self.buffer[self.pos]
+                self.incr()
+                if data_type == _BULK_STRING:
+                    self.current_state = States.READ_STR_LEN
+                elif data_type == _STRING:
+                    self.current_state = States.READ_SMPL_STR
+                elif data_type == _ARRAY:
+                    self.current_state = States.READ_ARR_LEN
+                elif data_type == _INTEGER:
+                    self.current_state = States.READ_INTEGER
+                continue
+
+            if self.current_state == States.READ_STR_LEN:
+                length = self.consume_line()
                 if length is None:
-                    break
+                    return None
                 length = int(length)
-                self.consume_boundary()
-                # check if bulk_string plus boundary is in buffer
-                if self.buffer[self.pos + length: self.pos + length + 2] == BOUNDARY:
-                    self.misc['bulk_consume_boundary'] = True
-                elif self.buffer[self.pos : self.pos + len(MAGIC_STR)] == MAGIC_STR:
-                    self.misc['bulk_consume_boundary'] = False
+                if length < 0:
+                    value = None
                 else:
-                    break
-                self.misc['bulk_len'] = length
-                self.current_state = States.READ_STR
+                    self.misc['bulk_len'] = length
+                    self.current_state = States.READ_STR
+                    continue
             elif self.current_state == States.READ_STR:
                 bulk_str_len = self.misc['bulk_len']
-                bulk_str = self.consume_until_boundary(bulk_str_len)
-                if bulk_str is None:
-                    break
+                end_idx = self.pos + bulk_str_len
+                if len(self.buffer) < end_idx:
+                    return None
+                # the RDB file a master sends after FULLRESYNC is the only
+                # bulk string that isn't followed by a boundary
+                has_boundary = bool(self.arr_stack) or self.buffer[self.pos:self.pos + len(MAGIC_STR)] != MAGIC_STR
+                if has_boundary and len(self.buffer) < end_idx + len(BOUNDARY):
+                    return None
+                value = self.take(self.pos, end_idx)
+                self.pos = end_idx + (len(BOUNDARY) if has_boundary else 0)
                 del self.misc['bulk_len']
-                self.debug and print(f'Bulk string {bulk_str}')
-                if self.misc['bulk_consume_boundary']:
-                    self.consume_boundary()
-                del self.misc['bulk_consume_boundary']
-                self.current_state = States.READ_TYPE
-                # if in array
-                if self.arr_stack:
-                    self.add_ele_to_arr(bulk_str)
-                # initial type is string, we can return
-                elif self.buffer_type == BULK_STRING:
-                    self.init()
-                    return bulk_str
+                self.debug and print(f'Bulk string {value}')
             elif self.current_state == States.READ_INTEGER:
-                value = self.consume_until_boundary()
+                value = self.consume_line()
                 if value is None:
-                    break
-                else:
-                    value = int(value)
-                    self.debug and print(f'Simple string {value}')
-                    # self.incr()
-                    self.consume_boundary()
-                    self.current_state = States.READ_TYPE
-                    if self.arr_stack:
-                        self.add_ele_to_arr(value)
-                    elif self.buffer_type == INTEGER:
-                        self.init()
-                        return value
+                    return None
+                value = int(value)
+                self.debug and print(f'Integer {value}')
             elif self.current_state == States.READ_SMPL_STR:
-                value = self.consume_until_boundary()
+                value = self.consume_line()
                 if value is None:
-                    break
-                else:
-                    self.debug and print(f'Simple string {value}')
-                    # self.incr()
-                    self.consume_boundary()
-                    self.current_state = States.READ_TYPE
-                    if self.arr_stack:
-                        self.add_ele_to_arr(value)
-                    elif self.buffer_type == STRING:
-                        self.init()
-                        return value
+                    return None
+                self.debug and print(f'Simple string {value}')
             elif self.current_state == States.READ_ARR_LEN:
-                no_of_items = self.consume_until_boundary()
+                no_of_items = self.consume_line()
                 if no_of_items is None:
-                    break
+                    return None
                 no_of_items = int(no_of_items)
-                self.consume_boundary()
-                self.arr_stack.append({'length' : no_of_items, 'items': []})
-                self.current_state = States.READ_ARR_ELE
-                # self.in_array = True
-            elif self.current_state == States.READ_ARR_ELE:
-                if self.arr_stack:
-                    # check if topmost array is complete
-                    top_ele = self.arr_stack[-1]
-                    if top_ele['length'] == len(top_ele['items']):
-                        # nested array
-                        if len(self.arr_stack) > 1:
-                            self.arr_stack[-2]['items'].append(top_ele['items'])
-                            self.arr_stack.pop()
-                            # we dont change state here, because we want to handle the last array
-                            self.current_state = States.READ_ARR_ELE
-                        else:
-                            arr = self.arr_stack.pop()
-                            if self.buffer_type == ARRAY:
-                                self.init()
-                                return arr['items']
-                    else:
-                        self.current_state = States.READ_TYPE
+                if no_of_items < 0:
+                    value = None
                 else:
+                    self.arr_stack.append({'length' : no_of_items, 'items': []})
+                    self.current_state = States.READ_ARR_ELE
+                    continue
+            elif self.current_state == States.READ_ARR_ELE:
+                # check if topmost array is complete
+                top_ele = self.arr_stack[-1]
+                if top_ele['length'] != len(top_ele['items']):
                     self.current_state = States.READ_TYPE
-        return None
+                    continue
+                self.arr_stack.pop()
+                value = top_ele['items']
+
+            # a value is complete, either it belongs to an enclosing array
+            # or it is a whole message
+            if self.arr_stack:
+                self.add_ele_to_arr(value)
+                continue
+            self.last_msg_len = self.pos - self.msg_start
+            self.init()
+            # a bare null can't be told apart from an incomplete message
+            if value is not None:
+                return value
     
 
 # parser = Parser('*')
@@ -214,5 +242,6 @@ class RespParser:
 if __name__ == "__main__":
     st = "*5\r\n$4\r\nXADD\r\n$6\r\nbanana\r\n$3\r\n0-1\r\n$3\r\nfoo\r\n$3\r\nbar\r\n"
     parser = RespParser()
-    parser.set_type(st[0])
-    print(parser.parse())
\ No newline at end of file
+    # a command split across two reads
+    print(parser.parse_multiple(st[:20].encode()))
+    print(parser.parse_multiple(st[20:].encode()))
\ No newline at end of file
@@ -0,0 +1,112 @@
+'''The order SCAN walks the keys of a db in.
+
+Redis' dictScan() walks hash table buckets with a reverse binary cursor.
+Python dicts don't expose their buckets, so each db keeps its keys in an
+array in the order they were added instead, and a cursor is a position in
+it. New keys are appended and deleted keys are left in place and skipped, so
+a key that exists for the whole scan is returned whatever is added or
+deleted meanwhile. A key deleted and added again is appended again, and a
+map of each key to its last position skips the stale entry, so the scan
+returns it once.
+
+A cursor also carries the length of the array when the scan started, and
+the scan ends there: keys appended later may not be returned, which SCAN
+allows, and keys deleted and added again as fast as the scan goes can't
+keep it from ending.
+
+Once most of the array is stale it is compacted, which moves the keys. A
+cursor carries the generation of the array it points into, and cursors of
+the last few generations are mapped to where their position moved. Cursors
+of older generations end the scan, which then misses keys, rather than
+return keys it already did from the start.'''
+from array import array
+from bisect import bisect_left
+
+# a cursor is end << POSITION_BITS | pos, shifted left by GENERATION_BITS
+# for the generation, so arrays of up to 2**26 keys keep it in 64 bits.
+# A generation is only mistaken for one 4096 compactions older or newer.
+GENERATION_BITS = 12
+GENERATION_MASK = (1 << GENERATION_BITS) - 1
+POSITION_BITS = 26
+POSITION_MASK = (1 << POSITION_BITS) - 1
+
+
+class ScanOrder:
+    # generations whose cursors are still mapped, cursors of older ones
+    # end the scan
+    REMAPS_KEPT = 4
+    # array entries a SCAN looks at per key it is asked for, like Redis
+    # visiting at most 10 times COUNT empty buckets
+    MAX_VISITS_PER_KEY = 10
+
+    def __init__(self, keys=()) -> None:
+        self.keys = list(keys)
+        # key -> its last position in `keys`, earlier ones are stale
+        self.positions = {key: pos for pos, key in enumerate(self.keys)}
+        self.generation = 0
+        # generation -> positions, in that generation's array, of the keys
+        # the compaction that ended it kept
+        self.remaps: dict[int, array] = {}
+
+    def add(self, key: str):
+        self.positions[key] = len(self.keys)
+        self.keys.append(key)
+
+    def stale(self, live: int):
+        '''Whether the array is mostly deleted keys, `live` being how many
+        the db has.'''
+        return len(self.keys) > 2 * live + 1024
+
+    def compact(self, store: dict):
+        kept = array('Q')
+        keys = []
+        positions = self.positions
+        for pos, key in enumerate(self.keys):
+            if key in store and positions[key] == pos:
+                keys.append(key)
+                kept.append(pos)
+        self.remaps[self.generation & GENERATION_MASK] = kept
+        self.remaps.pop((self.generation - self.REMAPS_KEPT) & GENERATION_MASK, None)
+        self.generation += 1
+        self.keys = keys
+        self.positions = {key: pos for pos, key in enumerate(keys)}
+
+    def position(self, cursor: int) -> tuple[int, int] | None:
+        '''Where in the current array `cursor` resumes and where its scan
+        ends, None for a cursor of a forgotten generation.'''
+        if cursor == 0:
+            return 0, len(self.keys)
+        generation = cursor & GENERATION_MASK
+        cursor >>= GENERATION_BITS
+        pos, end = cursor & POSITION_MASK, cursor >> POSITION_BITS
+        while generation != self.generation & GENERATION_MASK:
+            kept = self.remaps.get(generation)
+            if kept is None:
+                return None
+            # keys before the cursor that survived are before it still, the
+            # same goes for the end
+            pos, end = bisect_left(kept, pos), bisect_left(kept, end)
+            generation = (generation + 1) & GENERATION_MASK
+        if not pos < end <= len(self.keys):
+            return None
+        return pos, end
+
+    def scan(self, cursor: int, count: int, store: dict) -> tuple[int, list[str]]:
+        '''Up to `count` keys of `store` from `cursor` on, and the cursor to
+        continue from, 0 once the scan is complete. A page may be empty
+        while the cursor isn't, when it only came across stale entries.'''
+        keys, positions = self.keys, self.positions
+        located = self.position(cursor)
+        if located is None:
+            return 0, []
+        pos, end = located
+        stop = min(end, pos + count * self.MAX_VISITS_PER_KEY)
+        found = []
+        while pos < stop and len(found) < count:
+            key = keys[pos]
+            if key in store and positions[key] == pos:
+                found.append(key)
+            pos += 1
+        if pos >= end:
+            return 0, found
+        return (end << POSITION_BITS | pos) << GENERATION_BITS | self.generation & GENERATION_MASK, found
@@ -0,0 +1,120 @@
+import socket
+
+from app.commands import MasterCommand, ReplicaCommand
+from app.connection import Connection, MasterLink
+from app.cron import ServerCron
+from app.persistence import Persistence
+from app.event_loop import SelectorLoop
+from app.resp_parser import RespParser
+from app.namespace import ConfigNamespace
+from app.storage import Keyspace
+from app.replicas import Replicas
+
+
+class SocketConnection(Connection):
+    '''A client connection served by the SelectorLoop. Output the kernel
+    doesn't take right away is written when the socket becomes writable
+    instead of blocking the loop in sendall.'''
+
+    def __init__(self, sock: socket.socket, loop: SelectorLoop, cmd_parser: MasterCommand) -> None:
+        super().__init__(cmd_parser)
+        self.sock = sock
+        self.peername = sock.getpeername()
+        self.writing = False
+        self.attach(loop)
+        loop.add_reader(sock, self.on_readable)
+
+    def on_readable(self):
+        while True:
+            try:
+                chunk = self.sock.recv(RespParser.RECV_SIZE)
+            except BlockingIOError:
+                break
+            except OSError:
+                chunk = b''
+            if not chunk:
+                self.close()
+                return
+            self.parser.feed(chunk)
+        self.messages_received(self.parser.parse_multiple())
+
+    def close(self):
+        if self.closed:
+            return
+        self.connection_closed()
+        self.loop.remove_reader(self.sock)
+        self.loop.remove_writer(self.sock)
+        self.sock.close()
+
+    def flush(self):
+        self.flush_scheduled = False
+        if self.closed:
+            return
+        if self.out:
+            try:
+                sent = self.sock.send(self.out)
+            except BlockingIOError:
+                sent = 0
+            except OSError:
+                self.close()
+                return
+            del self.out[:sent]
+
+        if self.out and not self.writing:
+            self.writing = True
+            self.loop.add_writer(self.sock, self.flush)
+            if len(self.out) > self.OUT_HIGH_WATER:
+                self.loop.remove_reader(self.sock)
+        elif not self.out and self.writing:
+            self.writing = False
+            self.loop.remove_writer(self.sock)
+            self.loop.add_reader(self.sock, self.on_readable)
+            self.drained()
+
+    def write_backed_up(self):
+        return self.writing
+
+    def output_size(self):
+        return len(self.out)
+
+    def getpeername(self):
+        return self.peername
+
+
+class MasterLinkConnection(MasterLink, SocketConnection):
+
+    def reconnect(self):
+        connect_to_master(self.loop, self.cmd_parser.keyspace, self.cmd_parser.persistence)
+
+
+def connect_to_master(loop: SelectorLoop, keyspace: Keyspace, persistence: Persistence):
+    host, port = ConfigNamespace.replicaof.split()
+    try:
+        conn = socket.create_connection((host, int(port)), timeout=MasterLink.RECONNECT_DELAY)
+    except OSError as e:
+        print(f"Couldn't connect to master {host}:{port}: {e}")
+        loop.call_later(MasterLink.RECONNECT_DELAY, connect_to_master, loop, keyspace, persistence)
+        return
+    conn.setblocking(False)
+    link = MasterLinkConnection(conn, loop, ReplicaCommand(keyspace=keyspace, persistence=persistence))
+    link.start_handshake()
+
+
+def serve(keyspace: Keyspace, replicas: Replicas, persistence: Persistence):
+    loop = SelectorLoop()
+    ServerCron(keyspace, persistence, replicas).start(loop)
+
+    def accept(server: socket.socket):
+        conn, _ = server.accept()
+        conn.setblocking(False)
+        SocketConnection(conn, loop, MasterCommand(keyspace=keyspace, replicas=replicas, persistence=persistence))
+
+    with socket.create_server(("localhost", ConfigNamespace.port), reuse_port=True) as server:
+        server.listen(100)
+        server.setblocking(False)
+        loop.add_reader(server, accept, server)
+
+        if ConfigNamespace.is_replica():
+            connect_to_master(loop, keyspace, persistence)
+
+        loop.run_forever()
@@ -0,0 +1,182 @@
+'''A sorted list of values that stays sorted as values are added and
+removed, like sortedcontainers' SortedList.
+
+The values are kept in sublists of LOAD to 2 * LOAD values, along with the
+largest value of each. Adding or removing a value bisects the maxes, then
+inserts into or deletes from a single sublist, so it moves at most 2 * LOAD
+references instead of shifting a list as long as the whole.
+
+Positions, for ranks and ranges by index, come from a Fenwick tree of the
+sublist lengths. It is built the first time a position is asked for, kept
+up to date as values come and go, and dropped when sublists are split or
+removed, so lists that are never indexed don't pay for it.'''
+from bisect import bisect_left, bisect_right, insort
+
+
+class SortedList:
+    LOAD = 1000
+
+    def __init__(self, values=()) -> None:
+        values = sorted(values)
+        load = self.LOAD
+        self.lists = [values[idx:idx + load] for idx in range(0, len(values), load)]
+        self.maxes = [sublist[-1] for sublist in self.lists]
+        self.len = len(values)
+        # Fenwick tree of the sublist lengths, built on demand
+        self.index = None
+
+    def __len__(self):
+        return self.len
+
+    def __iter__(self):
+        for sublist in self.lists:
+            yield from sublist
+
+    def __contains__(self, value):
+        pos = bisect_left(self.maxes, value)
+        if pos == len(self.maxes):
+            return False
+        sublist = self.lists[pos]
+        idx = bisect_left(sublist, value)
+        return sublist[idx] == value
+
+    def add(self, value):
+        lists, maxes = self.lists, self.maxes
+        self.len += 1
+        if not maxes:
+            lists.append([value])
+            maxes.append(value)
+            self.index = None
+            return
+        pos = bisect_left(maxes, value)
+        if pos == len(maxes):
+            pos -= 1
+            lists[pos].append(value)
+            maxes[pos] = value
+        else:
+            insort(lists[pos], value)
+        if len(lists[pos]) > 2 * self.LOAD:
+            sublist = lists[pos]
+            half = sublist[self.LOAD:]
+            del sublist[self.LOAD:]
+            maxes[pos] = sublist[-1]
+            lists.insert(pos + 1, half)
+            maxes.insert(pos + 1, half[-1])
+            self.index = None
+        elif self.index is not None:
+            self.update_index(pos, 1)
+
+    def discard(self, value):
+        lists, maxes = self.lists, self.maxes
+        pos = bisect_left(maxes, value)
+        if pos == len(maxes):
+            return
+        sublist = lists[pos]
+        idx = bisect_left(sublist, value)
+        if sublist[idx] != value:
+            return
+        del sublist[idx]
+        self.len -= 1
+        if not sublist:
+            del lists[pos]
+            del maxes[pos]
+            self.index = None
+            return
+        if idx == len(sublist):
+            maxes[pos] = sublist[-1]
+        if self.index is not None:
+            self.update_index(pos, -1)
+
+    def irange(self, minimum):
+        '''The values from `minimum` on, in order. The list must not change
+        while this is iterated.'''
+        pos = bisect_left(self.maxes, minimum)
+        if pos == len(self.maxes):
+            return
+        sublist = self.lists[pos]
+        yield from sublist[bisect_left(sublist, minimum):]
+        for sublist in self.lists[pos + 1:]:
+            yield from sublist
+
+    def bisect_left(self, value) -> int:
+        '''Position of the first value not less than `value`.'''
+        pos = bisect_left(self.maxes, value)
+        if pos == len(self.maxes):
+            return self.len
+        return self.offset(pos) + bisect_left(self.lists[pos], value)
+
+    def bisect_right(self, value) -> int:
+        '''Position of the first value greater than `value`.'''
+        pos = bisect_right(self.maxes, value)
+        if pos == len(self.maxes):
+            return self.len
+        return self.offset(pos) + bisect_right(self.lists[pos], value)
+
+    def __getitem__(self, idx: int):
+        if idx < 0:
+            idx += self.len
+        if not 0 <= idx < self.len:
+            raise IndexError('SortedList index out of range')
+        pos, idx = self.locate(idx)
+        return self.lists[pos][idx]
+
+    def islice(self, start: int, stop: int):
+        '''The values at positions `start` to `stop`, exclusive.'''
+        start, stop = max(start, 0), min(stop, self.len)
+        if start >= stop:
+            return []
+        pos, idx = self.locate(start)
+        values = []
+        remaining = stop - start
+        lists = self.lists
+        while remaining > 0:
+            chunk = lists[pos][idx:idx + remaining]
+            values += chunk
+            remaining -= len(chunk)
+            pos, idx = pos + 1, 0
+        return values
+
+    def build_index(self):
+        lists = self.lists
+        tree = [0] * (len(lists) + 1)
+        for node, sublist in enumerate(lists, 1):
+            tree[node] += len(sublist)
+            parent = node + (node & -node)
+            if parent < len(tree):
+                tree[parent] += tree[node]
+        self.index = tree
+
+    def update_index(self, pos: int, delta: int):
+        tree = self.index
+        node = pos + 1
+        while node < len(tree):
+            tree[node] += delta
+            node += node & -node
+
+    def offset(self, pos: int) -> int:
+        '''Number of values in the sublists before `pos`.'''
+        if not pos:
+            return 0
+        if self.index is None:
+            self.build_index()
+        tree = self.index
+        total = 0
+        while pos:
+            total += tree[pos]
+            pos -= pos & -pos
+        return total
+
+    def locate(self, idx: int) -> tuple[int, int]:
+        '''(sublist, position in it) of the value at position `idx`.'''
+        if self.index is None:
+            self.build_index()
+        tree = self.index
+        pos = 0
+        bit = 1 << (len(tree) - 1).bit_length()
+        while bit:
+            node = pos + bit
+            if node < len(tree) and tree[node] <= idx:
+                idx -= tree[node]
+                pos = node
+            bit >>= 1
+        return pos, idx
@@ -1,257 +1,560 @@
+import heapq
+import math
 import pathlib
-import threading
-from time import time, sleep
-from itertools import zip_longest
+from itertools import takewhile
+from time import perf_counter
 
-from datetime import datetime, timedelta
+from app import clock
+from app.blocking import BlockingRegistry
+from app.globmatch import compile_glob
+from app.hash import RedisHash
+from app.lazyfree import LazyFree
 from app.namespace import ConfigNamespace
+from app.quicklist import QuickList
 from app.rdb_parser import RDBParser
+from app.scan import ScanOrder
+from app.sortedlist import SortedList
+from app.stream import RedisStream, InvalidStreamId
+from app.util import int_encoding, INT64_MIN, INT64_MAX
+from app.zset import SortedSet
 
-event = threading.Event()
-condition = threading.Condition()
-
-class RedisStream:
-    SEP = '-'
-    FORBIDDEN = '0-0'
-    ANY = '*'
-    ERR_MSG = 'ERR The ID specified in XADD is equal or smaller than the target stream top item'
-    ERR_MSG_1 = 'ERR The ID specified in XADD must be greater than 0-0'
-
-    def __init__(self, name: str) -> None:
-        self.id = name
-        self.items = []
-        
-    def append(self, **kwargs):
-        obj = {
-            'key': kwargs['key'],
-            'value': kwargs['value']
-        }
-        self.items.append({'id': kwargs['id'], 'item': obj})
-        
-    @staticmethod
-    def stream_is_empty(stream: 'RedisStream'):
-        return not bool(len(stream.items))
-    
-    @staticmethod
-    def get_last_id(stream: 'RedisStream'):
-        if not RedisStream.stream_is_empty(stream):
-            return stream.items[-1]['id']
-                
-    @staticmethod
-    def is_between_range(low, high, id_, exclusive):
-        id_ = str(id_)
-        high = str(high)
-        low = str(low)
-        
-        if low == '-':
-            low = '0-0'
-        else:
-            low = low + '-0' if low.find(RedisStream.SEP) == -1 else low
-
-        higher_than_low = id_ > low if exclusive else id_ >= low
-        lower_than_high = id_ <= high
-        
-        if high == '+':
-            lower_than_high = True
-        elif high.find(RedisStream.SEP) == -1:
-            lower_than_high = id_.split(RedisStream.SEP)[0] <= high
-        
-        return lower_than_high and higher_than_low
-    
-    @staticmethod
-    def build_obj(obj):
-        response = [obj['id']]
-        kv_pairs = []
-        for _, v in obj['item'].items():
-            kv_pairs.append(v)
-        response.append(kv_pairs)
-        return response
-
-    def get_items_in_range(self, low, high, exclusive=False):
-        response = []
-        if RedisStream.stream_is_empty(self):
-            return response
-        
-        for item in self.items:
-            in_range = RedisStream.is_between_range(low, high, item['id'], exclusive)
-            if in_range:
-                response.append(RedisStream.build_obj(item))
-        return response
+WRONGTYPE_MSG = 'WRONGTYPE Operation against a key holding the wrong kind of value'
+
+
+class WrongTypeError(Exception):
+    pass
 
 
 class RedisDB:
+    '''One logical database, the keys a client sees after SELECT.'''
 
-    def __init__(self) -> None:
+    def __init__(self, id: int = 0, key_index: bool = False, signalled: dict | None = None) -> None:
+        self.id = id
+        # key -> value, with no per key wrapper
         self.store = {}
+        # key -> expiry in unix ms, only for keys that have a TTL
+        self.expires: dict[str, int] = {}
+        # (expires, key) for every key set with a TTL, ordered by expiry. Keys
+        # that were deleted or got another TTL leave stale entries behind,
+        # they are skipped when popped.
+        self.ttl_index = []
+        # every key in the order it was added, what SCAN walks
+        self.scan_order = ScanOrder()
+        # the keys sorted, with --key-index, for KEYS patterns with a literal
+        # prefix to only visit the keys that start with it
+        self.key_index = SortedList() if key_index else None
+        # clients blocked on keys of this db, woken by writes to those keys
+        self.blocking = BlockingRegistry(signalled)
+        # called with the db and key of every key deleted because its TTL
+        # passed, what passes a DEL of it on to replicas and the AOF
+        self.expired_hook = None
+        self.expired_keys = 0
+        self.expire_cycle_cpu = 0.0
 
-    def load_db(self):
-        if ConfigNamespace.dir is None or ConfigNamespace.dbfilename is None:
-            return
-        rdb_path = pathlib.Path(ConfigNamespace.dir + '/' + ConfigNamespace.dbfilename)
-        rdb_parser = RDBParser(rdb_path)
-        if rdb_path.exists():
-            rdb_parser.read_file()
-            self.store = rdb_parser.get_database()
-        else:
-            rdb_parser.create_rdb_file()
+    def dbsize(self):
+        return len(self.store)
+
+    def empty(self):
+        '''Drops every key, returns the containers that held them.'''
+        old = self.store, self.expires, self.ttl_index, self.scan_order.keys, self.scan_order.positions
+        self.store, self.expires, self.ttl_index = {}, {}, []
+        self.scan_order = ScanOrder()
+        if self.key_index is not None:
+            old += (self.key_index.lists,)
+            self.key_index = SortedList()
+        return old
+
+    def swap(self, other: 'RedisDB'):
+        '''Exchanges keys with `other`. Clients and the waiters blocked on
+        either db stay where they are and see the other db's keys.'''
+        self.store, other.store = other.store, self.store
+        self.expires, other.expires = other.expires, self.expires
+        self.ttl_index, other.ttl_index = other.ttl_index, self.ttl_index
+        self.scan_order, other.scan_order = other.scan_order, self.scan_order
+        self.key_index, other.key_index = other.key_index, self.key_index
+
+    def load(self, store: dict, expires: dict):
+        self.store = store
+        self.expires = expires
+        self.rebuild_ttl_index()
+        self.scan_order = ScanOrder(store)
+        if self.key_index is not None:
+            self.key_index = SortedList(store)
+
+    def signal_waited_keys(self):
+        '''Marks the keys clients wait on that exist as changed, after the
+        whole keyspace of the db was replaced.'''
+        for key in self.blocking.waiters:
+            if key in self.store:
+                self.blocking.signal(key)
 
     def get(self, key):
-        obj = self.store.get(key)
-        if not obj:
+        value = self.store.get(key)
+        if value is None:
             return None
-        expired = 'expires' in obj and obj['expires'] < datetime.now().timestamp()
+        if self.expires:
+            expires = self.expires.get(key)
+            if expires is not None and expires < clock.now_ms():
+                self.expire(key)
+                return None
+        return value
+
+    def expire(self, key):
+        '''Deletes `key` because its TTL passed.'''
+        self.delete(key)
+        self.expired_keys += 1
+        if self.expired_hook is not None:
+            self.expired_hook(self.id, key)
+
+    def delete(self, key):
+        self.expires.pop(key, None)
+        if self.store.pop(key, None) is None:
+            return False
+        if self.key_index is not None:
+            self.key_index.discard(key)
+        return True
+
+    def key_added(self, key):
+        '''Called when `key` is stored and didn't exist.'''
+        self.scan_order.add(key)
+        if self.key_index is not None:
+            self.key_index.add(key)
 
-        if not expired:
-            return obj['value']
-        else:
-            del self.store[key]
-    
     def set(self, key, value, **kwargs):
+        '''Strings are stored as the bytes received, or as an int when they are
+        the canonical form of one.'''
         if isinstance(key, bytes):
             key = key.decode('utf-8')
         if isinstance(value, bytes):
-            value = value.decode('utf-8')
-        obj = {
-            'value': value
-        }
+            value = int_encoding(value)
 
-        if 'px' in kwargs:
-            expires_in = datetime.now() + timedelta(milliseconds=int(kwargs['px']))
-            obj['expires'] = expires_in.timestamp()
+        if 'px' in kwargs or 'pxat' in kwargs:
+            expires = clock.now_ms() + int(kwargs['px']) if 'px' in kwargs else int(kwargs['pxat'])
+            self.expires[key] = expires
+            heapq.heappush(self.ttl_index, (expires, key))
+        else:
+            # SET without PX or PXAT drops any previous TTL
+            self.expires.pop(key, None)
 
-        self.store[key] = obj
+        store = self.store
+        if key not in store:
+            self.key_added(key)
+        store[key] = value
         return 'OK'
+
+    def incr(self, key, by=1):
+        '''Works on the int encoding in place and keeps the key's TTL.'''
+        value = self.get(key)
+        if value is None:
+            self.key_added(key)
+            value = 0
+        elif not isinstance(value, int):
+            if isinstance(value, bytes):
+                return False, 'ERR value is not an integer or out of range'
+            return False, WRONGTYPE_MSG
+        value += by
+        if not INT64_MIN <= value <= INT64_MAX:
+            return False, 'ERR increment or decrement would overflow'
+        self.store[key] = value
+        return True, value
+
+    def rebuild_ttl_index(self):
+        self.ttl_index = [(expires, key) for key, expires in self.expires.items()]
+        heapq.heapify(self.ttl_index)
+
+    def active_expire_cycle(self, time_budget: float):
+        '''Deletes keys whose TTL has passed, soonest first, until there are no
+        more or `time_budget` seconds are spent. Keys that are written once and
+        never read again would otherwise stay in the store forever. Returns
+        True if it stopped because of the budget, i.e. there is more to do.'''
+        started = perf_counter()
+        deadline = started + time_budget
+        now = clock.now_ms()
+        index = self.ttl_index
+        out_of_time = False
+        checked = 0
+
+        while index and index[0][0] <= now:
+            expires, key = heapq.heappop(index)
+            if self.expires.get(key) == expires:
+                self.expire(key)
+            checked += 1
+            # reading the clock costs about as much as expiring a key
+            if checked % 32 == 0 and perf_counter() > deadline:
+                out_of_time = True
+                break
+
+        # overwritten and deleted keys leave stale entries, rebuild once
+        # they make up most of the index
+        if len(index) > 2 * len(self.expires) + 1024:
+            self.rebuild_ttl_index()
+
+        self.expire_cycle_cpu += perf_counter() - started
+        return out_of_time
     
     def get_type(self, key):
         val = self.get(key)
         if val is None:
             return 'none'
-        if isinstance(val, str):
+        if isinstance(val, (bytes, int)):
             return 'string'
         if isinstance(val, RedisStream):
             return 'stream'
+        if isinstance(val, QuickList):
+            return 'list'
+        if isinstance(val, RedisHash):
+            return 'hash'
+        if isinstance(val, SortedSet):
+            return 'zset'
         return'none'
 
-    def get_all_keys(self):
-        return list(self.store.keys())
+    def keys(self, pattern: str) -> list[str]:
+        '''KEYS: every key matching the glob `pattern`.'''
+        matcher = compile_glob(pattern)
+        if self.key_index is not None and matcher.prefix:
+            prefix = matcher.prefix
+            candidates = takewhile(lambda key: key.startswith(prefix), self.key_index.irange(prefix))
+        else:
+            candidates = self.store
+        keys = [key for key in candidates if matcher.match(key)]
+        if self.expires:
+            # get() deletes expired keys, not while the index is iterated
+            keys = [key for key in keys if self.get(key) is not None]
+        return keys
+
+    def scan(self, cursor: int, count: int):
+        '''SCAN's walk of the keys: up to `count` of them from `cursor` on,
+        expired ones left out, and the cursor to continue from.'''
+        cursor, keys = self.scan_order.scan(cursor, count, self.store)
+        if self.expires:
+            keys = [key for key in keys if self.get(key) is not None]
+        return cursor, keys
 
-    def xadd(self, stream_name, id, key, value):
-        with condition:
-            item_id = id
-            stream = self.get(stream_name)
+    def compact_scan_order(self):
+        if self.scan_order.stale(len(self.store)):
+            self.scan_order.compact(self.store)
 
-            if not stream or not isinstance(stream, RedisStream):
-                stream = RedisStream(stream_name)
-            
-            # constant id
-            if item_id.find(RedisStream.ANY) == -1:
-                success = self.validate_entry_id(item_id, stream)
-                if not success:
-                    to_ret = False
-                    if item_id == RedisStream.FORBIDDEN:
-                        return to_ret, RedisStream.ERR_MSG_1
-                    return to_ret, RedisStream.ERR_MSG
-            # generated id
-            else:
-                item_id = self.generate_id(item_id, stream)
-            stream.append(key=key, value=value, id=item_id)
-            self.store[stream_name] = {'value': stream }
-            condition.notify_all()
-            return True, item_id
-    
-    def validate_entry_id(self, id: str, stream: RedisStream):
-        if id == RedisStream.FORBIDDEN:
-            return False
-        ms_latest, seq_latest = id.split(RedisStream.SEP)
-        ms_latest, seq_latest = int(ms_latest), int(seq_latest)
-        last_id = RedisStream.get_last_id(stream)
-        if last_id is None:
-            if ms_latest == 0:
-                return seq_latest > 0
-        else:
-            ms_earlier, seq_earlier = last_id.split(RedisStream.SEP)
-            ms_earlier, seq_earlier = int(ms_earlier), int(seq_earlier)
-            if ms_latest < ms_earlier:
-                return False
-            if ms_latest == ms_earlier:
-                return seq_latest > seq_earlier
-        return True
-    
-    def xrange(self, stream_name, start_id, end_id):
+    def get_stream(self, stream_name) -> RedisStream | None:
         stream = self.get(stream_name)
-        return stream.get_items_in_range(start_id, end_id)
-    
-    def _get_latest_keys(self, streams: list[str], keys: list[str]):
-        oldest_keys_mapping = {}
-        for name, _ in zip_longest(streams, keys, fillvalue=keys[-1]): 
-            stream = self.get(name)
-            if stream:
-                id = RedisStream.get_last_id(stream)
-                oldest_keys_mapping[name] = id if id else ''
-        return oldest_keys_mapping
-
-
-    def xread(self, **kwargs):
-        block_for_ms = kwargs.get('block')
-        streams, keys = kwargs['streams'], kwargs['keys']
-        latest_mapping = None
-        if block_for_ms is not None:
-            block_for_ms = int(block_for_ms)
-            if not block_for_ms:
-                latest_mapping = self._get_latest_keys(streams, keys)
-                with condition:
-                    condition.wait()
-            else:
-                sleep(block_for_ms // 1000)
+        if stream is not None and not isinstance(stream, RedisStream):
+            raise WrongTypeError(WRONGTYPE_MSG)
+        return stream
 
+    def xadd(self, stream_name, id: str, fields: list[bytes]):
+        try:
+            stream = self.get_stream(stream_name)
+            new_stream = stream is None
+            if new_stream:
+                stream = RedisStream(stream_name)
+            item_id = stream.next_id(id, clock.now_ms())
+        except (InvalidStreamId, WrongTypeError) as e:
+            return False, str(e)
+
+        if item_id == RedisStream.MIN_ID:
+            return False, RedisStream.ERR_MSG_1
+        if stream.ids and item_id <= stream.last_id:
+            return False, RedisStream.ERR_MSG
+
+        stream.append(item_id, fields)
+        if new_stream:
+            self.key_added(stream_name)
+            self.store[stream_name] = stream
+        self.blocking.signal(stream_name)
+        return True, RedisStream.format_id(item_id)
+
+    def xrange(self, stream_name, start_id: str, end_id: str, count: int | None = None):
+        try:
+            start = RedisStream.parse_range_start(start_id)
+            end = RedisStream.parse_range_end(end_id)
+            stream = self.get_stream(stream_name)
+        except (InvalidStreamId, WrongTypeError) as e:
+            return False, str(e)
+        if stream is None or (count is not None and count <= 0):
+            return True, []
+        return True, stream.range(start, end, count)
+
+    def xread_ids(self, streams: list[str], ids: list[str]):
+        '''Turns XREAD's ids into (ms, seq), `$` being the last id the stream
+        has right now, so that a blocked XREAD only gets entries added after.'''
+        resolved = []
+        try:
+            for name, id in zip(streams, ids):
+                if id == RedisStream.LAST:
+                    stream = self.get_stream(name)
+                    resolved.append(stream.last_id if stream is not None else RedisStream.MIN_ID)
+                else:
+                    resolved.append(RedisStream.parse_id(id))
+        except (InvalidStreamId, WrongTypeError) as e:
+            return False, str(e)
+        return True, resolved
+
+    def xread(self, streams: list[str], ids: list[tuple[int, int]], count: int | None = None):
+        '''Entries after each of `ids`, None if there are none in any stream.'''
         response = []
-        for name, key in zip_longest(streams, keys, fillvalue=keys[-1]): 
-            stream = self.get(name)
-            if latest_mapping:
-                key = latest_mapping[name]
-            result = stream.get_items_in_range(key, '+', True)
-            response.append([name, result])
-        if len(response) == 1 and len(response[0][1]) == 0:
-            return None
-        return response
-        
-    def generate_fresh_id(self, last_id: None | str):
-        auto_gen_id = [int(time() * 1000), 0]
-        if last_id is None:
-            return auto_gen_id
-        ms_no, _ = last_id.split(RedisStream.SEP)
-        ms_no = int(ms_no)
-        if ms_no == auto_gen_id[0]:
-            auto_gen_id[-1] += 1
-            return auto_gen_id
-        return auto_gen_id 
-
-    def generate_id(self, id: str, stream: RedisStream):
-        def join_parts(*args):
-            return f'{RedisStream.SEP}'.join([str(x) for x in args])
-        
-        last_id = RedisStream.get_last_id(stream)
-
-        if id == RedisStream.ANY:
-            return join_parts(*self.generate_fresh_id(last_id))
-
-        ms_curr, _ = id.split(RedisStream.SEP)
-        ms_curr = int(ms_curr)
-        
-
-        # No elements in stream
-        if last_id is None:
-            if ms_curr == 0:
-                return join_parts(ms_curr, 1)
-            else:
-                return join_parts(ms_curr, 0)
+        try:
+            for name, id in zip(streams, ids):
+                stream = self.get_stream(name)
+                if stream is None:
+                    continue
+                entries = stream.after(id, count)
+                if entries:
+                    response.append([name, entries])
+        except WrongTypeError as e:
+            return False, str(e)
+        return True, response or None
+
+    def get_list(self, key) -> QuickList | None:
+        elements = self.get(key)
+        if elements is not None and not isinstance(elements, QuickList):
+            raise WrongTypeError(WRONGTYPE_MSG)
+        return elements
+
+    def push(self, key, elements: list[bytes], left: bool):
+        '''LPUSH and RPUSH, returns the length of the list after.'''
+        try:
+            quicklist = self.get_list(key)
+        except WrongTypeError as e:
+            return False, str(e)
+        if quicklist is None:
+            quicklist = QuickList()
+            self.key_added(key)
+            self.store[key] = quicklist
+        push = quicklist.push_left if left else quicklist.push_right
+        for element in elements:
+            push(element)
+        self.blocking.signal(key)
+        return True, len(quicklist)
+
+    def pop(self, key, left: bool, count: int | None = None):
+        '''LPOP and RPOP: an element, or a list of up to `count` of them.
+        None if there is no list. Deletes the key once it is empty.'''
+        try:
+            quicklist = self.get_list(key)
+        except WrongTypeError as e:
+            return False, str(e)
+        if quicklist is None:
+            return True, None
+        pop = quicklist.pop_left if left else quicklist.pop_right
+        if count is None:
+            response = pop()
         else:
-            ms_no, seq_no = last_id.split(RedisStream.SEP)
-            ms_no, seq_no = int(ms_no), int(seq_no)
-            
-            if ms_no == ms_curr:
-                return join_parts(ms_curr, seq_no + 1)
+            response = [pop() for _ in range(min(count, len(quicklist)))]
+        if not quicklist:
+            self.delete(key)
+        return True, response
+
+    def get_hash(self, key) -> RedisHash | None:
+        hash = self.get(key)
+        if hash is not None and not isinstance(hash, RedisHash):
+            raise WrongTypeError(WRONGTYPE_MSG)
+        return hash
+
+    def hset(self, key, pairs: list[tuple[bytes, bytes]]):
+        '''Sets the fields, returns how many were new.'''
+        try:
+            hash = self.get_hash(key)
+        except WrongTypeError as e:
+            return False, str(e)
+        if hash is None:
+            hash = RedisHash()
+            self.key_added(key)
+            self.store[key] = hash
+        return True, sum(hash.set(field, int_encoding(value)) for field, value in pairs)
+
+    def hincrby(self, key, field: bytes, by: int):
+        '''Works on the int encoding of the value, like incr().'''
+        try:
+            hash = self.get_hash(key)
+        except WrongTypeError as e:
+            return False, str(e)
+        value = hash.get(field) if hash is not None else None
+        if value is None:
+            value = 0
+        elif not isinstance(value, int):
+            return False, 'ERR hash value is not an integer'
+        value += by
+        if not INT64_MIN <= value <= INT64_MAX:
+            return False, 'ERR increment or decrement would overflow'
+        if hash is None:
+            hash = RedisHash()
+            self.key_added(key)
+            self.store[key] = hash
+        hash.set(field, value)
+        return True, value
+
+    def hdel(self, key, fields: list[bytes]):
+        '''Deletes the fields, and the key once none are left.'''
+        try:
+            hash = self.get_hash(key)
+        except WrongTypeError as e:
+            return False, str(e)
+        if hash is None:
+            return True, 0
+        deleted = sum(hash.delete(field) for field in fields)
+        if not hash:
+            self.delete(key)
+        return True, deleted
+
+    def get_zset(self, key) -> SortedSet | None:
+        zset = self.get(key)
+        if zset is not None and not isinstance(zset, SortedSet):
+            raise WrongTypeError(WRONGTYPE_MSG)
+        return zset
+
+    def zadd(self, key, pairs: list[tuple[float, bytes]], nx=False, xx=False, gt=False, lt=False, incr=False):
+        '''ZADD's (score, member) pairs, with its flags. Returns the number of
+        members added, of members whose score changed, and the score the last
+        member ended up with, None if the flags kept it from being set.'''
+        try:
+            zset = self.get_zset(key)
+        except WrongTypeError as e:
+            return False, str(e)
+        new_zset = zset is None
+        if new_zset:
+            if xx:
+                return True, (0, 0, None)
+            zset = SortedSet()
+
+        added = changed = 0
+        score = None
+        for score, member in pairs:
+            old = zset.score(member)
+            if old is None:
+                if xx:
+                    score = None
+                    continue
+                zset.add(member, score)
+                added += 1
+                continue
+            if nx:
+                score = None
+                continue
+            if incr:
+                score += old
+                if math.isnan(score):
+                    return False, 'ERR resulting score is not a number (NaN)'
+            if (gt and score <= old) or (lt and score >= old):
+                score = None
+                continue
+            if score != old:
+                zset.add(member, score)
+                changed += 1
+
+        if new_zset and zset:
+            self.key_added(key)
+            self.store[key] = zset
+        return True, (added, changed, score)
+
+    def zrem(self, key, members: list[bytes]):
+        '''Removes `members`, and the key once none are left.'''
+        try:
+            zset = self.get_zset(key)
+        except WrongTypeError as e:
+            return False, str(e)
+        if zset is None:
+            return True, 0
+        removed = sum(zset.remove(member) for member in members)
+        if not zset:
+            self.delete(key)
+        return True, removed
+
+
+class Keyspace:
+    '''The server's logical databases, Redis' server.db array. Clients pick
+    one by index with SELECT, the index being kept by their Command.'''
+
+    def __init__(self, databases: int = 16, key_index: bool = False) -> None:
+        # the BlockingRegistry of every db with keys signalled since clients
+        # were last served, in the order they were, a dict as an ordered set
+        self.signalled: dict[BlockingRegistry, None] = {}
+        self.dbs = [RedisDB(id, key_index, self.signalled) for id in range(databases)]
+        # the db the next active expire cycle starts from, so that a cycle
+        # that ran out of budget resumes where it stopped
+        self.expire_db = 0
+        self.lazyfree = LazyFree()
+
+    def __len__(self):
+        return len(self.dbs)
+
+    def __getitem__(self, id: int) -> RedisDB:
+        return self.dbs[id]
+
+    @property
+    def expired_keys(self):
+        return sum(db.expired_keys for db in self.dbs)
+
+    @property
+    def expire_cycle_cpu(self):
+        return sum(db.expire_cycle_cpu for db in self.dbs)
+
+    def load_db(self):
+        if ConfigNamespace.dir is None or ConfigNamespace.dbfilename is None:
+            return
+        rdb_path = pathlib.Path(ConfigNamespace.dir + '/' + ConfigNamespace.dbfilename)
+        rdb_parser = RDBParser(rdb_path, progress=True,
+                               check_crc=getattr(ConfigNamespace, 'rdbchecksum', 'yes') == 'yes')
+        if rdb_path.exists():
+            workers = getattr(ConfigNamespace, 'rdb_load_workers', 0)
+            if workers:
+                rdb_parser.read_file_parallel(workers)
             else:
-                return join_parts(ms_curr, 0)
-            
-        
\ No newline at end of file
+                rdb_parser.read_file()
+            self.load_parsed(rdb_parser)
+
+    def load_snapshot(self, data: bytes):
+        '''Replaces the whole keyspace with an RDB snapshot, what a replica
+        does with the one its master sends on a full sync.'''
+        rdb_parser = RDBParser(None)
+        rdb_parser.read_bytes(data)
+        self.load_parsed(rdb_parser)
+
+    def load_parsed(self, rdb_parser: RDBParser):
+        ignored = [id for id, (store, _) in rdb_parser.databases.items() if id >= len(self.dbs) and store]
+        if ignored:
+            print(f'The RDB has keys in databases {ignored}, over the {len(self.dbs)} configured, they are not loaded')
+        for db in self.dbs:
+            db.load(rdb_parser.get_database(db.id), rdb_parser.get_expires(db.id))
+
+    def active_expire_cycle(self, time_budget: float):
+        '''RedisDB.active_expire_cycle() on each db in turn, with what is
+        left of `time_budget`. Returns True if it ran out of it.'''
+        deadline = perf_counter() + time_budget
+        for _ in range(len(self.dbs)):
+            db = self.dbs[self.expire_db]
+            if db.ttl_index and db.active_expire_cycle(deadline - perf_counter()):
+                return True
+            self.expire_db = (self.expire_db + 1) % len(self.dbs)
+        return False
+
+    def set_expired_hook(self, hook):
+        '''Has hook(db, key) called for every key of any db deleted because
+        its TTL passed.'''
+        for db in self.dbs:
+            db.expired_hook = hook
+
+    def serve_ready(self):
+        '''Retries the clients blocked on keys written to, in every db.'''
+        signalled = self.signalled
+        while signalled:
+            registry = next(iter(signalled))
+            del signalled[registry]
+            registry.serve_ready()
+
+    def compact_scan_orders(self):
+        for db in self.dbs:
+            db.compact_scan_order()
+
+    def swap(self, id1: int, id2: int):
+        '''SWAPDB, two pointer swaps whatever the dbs hold.'''
+        db1, db2 = self.dbs[id1], self.dbs[id2]
+        db1.swap(db2)
+        db1.signal_waited_keys()
+        db2.signal_waited_keys()
+
+    def flush(self, id: int | None = None, lazy: bool = False):
+        '''FLUSHDB of db `id`, or FLUSHALL when it is None. With `lazy` the
+        keys are freed on the lazyfree thread, otherwise right here.'''
+        dbs = self.dbs if id is None else [self.dbs[id]]
+        old = [container for db in dbs for container in db.empty()]
+        if lazy:
+            self.lazyfree.free(*old)
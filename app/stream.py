@@ -0,0 +1,110 @@
+from bisect import bisect_left, bisect_right
+
+
+class InvalidStreamId(Exception):
+    pass
+
+
+class RedisStream:
+    SEP = '-'
+    ANY = '*'
+    LAST = '$'
+    MIN_ID = (0, 0)
+    MAX_ID = (2**64 - 1, 2**64 - 1)
+    ERR_MSG = 'ERR The ID specified in XADD is equal or smaller than the target stream top item'
+    ERR_MSG_1 = 'ERR The ID specified in XADD must be greater than 0-0'
+    ERR_INVALID_ID = 'ERR Invalid stream ID specified as stream command argument'
+
+    def __init__(self, name: str) -> None:
+        self.id = name
+        # Entry ids as (ms, seq) and the flat [field, value, ...] list of each
+        # entry, at the same index. Entries are only ever appended with a
+        # greater id, so `ids` stays sorted and ranges are found with bisect.
+        self.ids: list[tuple[int, int]] = []
+        self.entries: list[list[bytes]] = []
+        self.last_id = self.MIN_ID
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def parse_id(raw: str, missing_seq: int = 0) -> tuple[int, int]:
+        '''Parses `ms-seq`, `ms` (seq is then `missing_seq`), `-` and `+`.'''
+        if raw == '-':
+            return RedisStream.MIN_ID
+        if raw == '+':
+            return RedisStream.MAX_ID
+        ms, sep, seq = raw.partition(RedisStream.SEP)
+        try:
+            id = int(ms), int(seq) if sep else missing_seq
+        except ValueError:
+            raise InvalidStreamId(RedisStream.ERR_INVALID_ID)
+        if not (0 <= id[0] <= RedisStream.MAX_ID[0] and 0 <= id[1] <= RedisStream.MAX_ID[1]):
+            raise InvalidStreamId(RedisStream.ERR_INVALID_ID)
+        return id
+
+    @staticmethod
+    def parse_range_start(raw: str) -> tuple[int, int]:
+        if raw.startswith('('):
+            ms, seq = RedisStream.parse_id(raw[1:])
+            if seq < RedisStream.MAX_ID[1]:
+                return ms, seq + 1
+            if ms < RedisStream.MAX_ID[0]:
+                return ms + 1, 0
+            raise InvalidStreamId('ERR invalid start ID for the interval')
+        return RedisStream.parse_id(raw)
+
+    @staticmethod
+    def parse_range_end(raw: str) -> tuple[int, int]:
+        if raw.startswith('('):
+            ms, seq = RedisStream.parse_id(raw[1:], RedisStream.MAX_ID[1])
+            if seq > 0:
+                return ms, seq - 1
+            if ms > 0:
+                return ms - 1, RedisStream.MAX_ID[1]
+            raise InvalidStreamId('ERR invalid end ID for the interval')
+        return RedisStream.parse_id(raw, RedisStream.MAX_ID[1])
+
+    @staticmethod
+    def format_id(id: tuple[int, int]) -> str:
+        return f'{id[0]}{RedisStream.SEP}{id[1]}'
+
+    def next_id(self, raw: str, now_ms: int) -> tuple[int, int]:
+        '''The id an XADD with `raw` (`*`, `ms-*` or `ms-seq`) gets.'''
+        last_ms, last_seq = self.last_id
+        if raw == self.ANY:
+            if now_ms > last_ms:
+                return now_ms, 0
+            return last_ms, last_seq + 1
+
+        ms, _, seq = raw.partition(self.SEP)
+        if seq == self.ANY:
+            try:
+                ms = int(ms)
+            except ValueError:
+                raise InvalidStreamId(self.ERR_INVALID_ID)
+            if ms == last_ms and self.ids:
+                return ms, last_seq + 1
+            return ms, 1 if ms == 0 else 0
+        return self.parse_id(raw)
+
+    def append(self, id: tuple[int, int], fields: list[bytes]):
+        self.ids.append(id)
+        self.entries.append(fields)
+        self.last_id = id
+
+    def _slice(self, lo: int, hi: int, count: int | None):
+        if count is not None:
+            hi = min(hi, lo + count)
+        ids, entries = self.ids, self.entries
+        return [[self.format_id(ids[i]), entries[i]] for i in range(lo, hi)]
+
+    def range(self, start: tuple[int, int], end: tuple[int, int], count: int | None = None):
+        '''Entries with start <= id <= end, in O(log n + k).'''
+        lo = bisect_left(self.ids, start)
+        hi = bisect_right(self.ids, end)
+        return self._slice(lo, hi, count)
+
+    def after(self, id: tuple[int, int], count: int | None = None):
+        '''Entries with an id greater than `id`, what XREAD returns.'''
+        return self._slice(bisect_right(self.ids, id), len(self.ids), count)
@@ -15,6 +15,22 @@ def decode(msg: bytes | None | list | int):
         return [decode(m) for m in msg]
     return msg.decode(encoding='utf-8')
 
+INT64_MIN, INT64_MAX = -2**63, 2**63 - 1
+
+def int_encoding(value: bytes):
+    '''Returns value as an int if it is the canonical form of a signed 64 bit
+    integer, like Redis' string2ll, so that it reads back byte for byte.
+    Anything else is returned unchanged.'''
+    if not value or len(value) > 20 or not (value[0] == 45 or 48 <= value[0] <= 57):
+        return value
+    try:
+        number = int(value)
+    except ValueError:
+        return value
+    if not INT64_MIN <= number <= INT64_MAX or b'%d' % number != value:
+        return value
+    return number
+
 def encode(msg: bytes | None | list | int):
     if msg is None:
         return
@@ -23,3 +39,13 @@ def encode(msg: bytes | None | list | int):
     if isinstance(msg, list):
         return [encode(m) for m in msg]
     return msg
+
+_SIZE_UNITS = {'': 1, 'b': 1, 'k': 1000, 'kb': 1024, 'm': 1000**2, 'mb': 1024**2, 'g': 1000**3, 'gb': 1024**3}
+
+def parse_size(value: str):
+    '''Memory sizes as Redis' config takes them: 1024, 1k, 1kb, 64mb, ...'''
+    number = value.rstrip('bBkKmMgG')
+    unit = value[len(number):].lower()
+    if not number.isdigit() or unit not in _SIZE_UNITS:
+        raise ValueError(f'invalid size {value!r}')
+    return int(number) * _SIZE_UNITS[unit]
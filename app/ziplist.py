@@ -0,0 +1,45 @@
+'''The ziplist format older Redis versions used for small collections, which
+RDB files written by them still hold.
+
+    <total-bytes:u32> <tail-offset:u32> <num-entries:u16> <entry> ... <0xFF>
+
+Each entry is the previous entry's length, 1 byte or 0xFE and 4 bytes, then
+an encoding with its data: strings with a 6, 14 or 32 bit length, or
+integers of 8 to 64 bits, 24 bit ones included, all little endian.'''
+ZIP_HDR_SIZE = 10
+ZIP_END = 0xFF
+ZIP_BIG_PREVLEN = 0xFE
+
+# integer encodings and their widths
+_INT_WIDTHS = {0xC0: 2, 0xD0: 4, 0xE0: 8, 0xF0: 3, 0xFE: 1}
+
+
+def decode(data: bytes) -> list[int | bytes]:
+    '''Elements in order, integers as ints and strings as bytes.'''
+    elements = []
+    pos = ZIP_HDR_SIZE
+    while data[pos] != ZIP_END:
+        pos += 5 if data[pos] == ZIP_BIG_PREVLEN else 1
+        b = data[pos]
+        kind = b >> 6
+        if kind == 0:
+            n = b & 0x3F
+            elements.append(bytes(data[pos + 1:pos + 1 + n]))
+            pos += 1 + n
+        elif kind == 1:
+            n = ((b & 0x3F) << 8) | data[pos + 1]
+            elements.append(bytes(data[pos + 2:pos + 2 + n]))
+            pos += 2 + n
+        elif kind == 2:
+            n = int.from_bytes(data[pos + 1:pos + 5], 'big')
+            elements.append(bytes(data[pos + 5:pos + 5 + n]))
+            pos += 5 + n
+        elif b in _INT_WIDTHS:
+            width = _INT_WIDTHS[b]
+            elements.append(int.from_bytes(data[pos + 1:pos + 1 + width], 'little', signed=True))
+            pos += 1 + width
+        else:
+            # 0xF1 - 0xFD, a 4 bit integer 0 - 12 in the encoding itself
+            elements.append((b & 0x0F) - 1)
+            pos += 1
+    return elements
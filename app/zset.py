@@ -0,0 +1,187 @@
+'''Sorted sets, members ordered by score and then by member.
+
+Like Redis, a sorted set starts out in a compact encoding and converts once
+it grows. Small sets are a plain list of (score, member) pairs kept sorted,
+the counterpart of the listpack encoding: finding a member scans the list,
+which for a hundred pairs is cheaper than keeping a dict next to it. Past
+ZSET_MAX_LISTPACK_ENTRIES members, or with a member longer than
+ZSET_MAX_LISTPACK_VALUE bytes, the pairs move to a SortedList and a member ->
+score dict is added, the counterpart of the skiplist encoding, so adding a
+member, its rank and the start of a range are all O(log n).'''
+import math
+from bisect import bisect_left, insort
+
+from app.sortedlist import SortedList
+
+ZSET_MAX_LISTPACK_ENTRIES = 128
+ZSET_MAX_LISTPACK_VALUE = 64
+
+INF = math.inf
+
+
+class InvalidScore(Exception):
+    pass
+
+
+def parse_score(raw: bytes) -> float:
+    '''A score as ZADD takes it, what strtod() accepts but NaN.'''
+    # float() also takes underscores and surrounding whitespace
+    if b'_' in raw or raw != raw.strip():
+        raise InvalidScore('ERR value is not a valid float')
+    try:
+        score = float(raw)
+    except ValueError:
+        raise InvalidScore('ERR value is not a valid float') from None
+    if math.isnan(score):
+        raise InvalidScore('ERR value is not a valid float')
+    return score
+
+
+def parse_score_bound(raw: bytes) -> tuple[float, bool]:
+    '''A ZRANGEBYSCORE min or max: (score, exclusive).'''
+    exclusive = raw.startswith(b'(')
+    try:
+        return parse_score(raw[1:] if exclusive else raw), exclusive
+    except InvalidScore:
+        raise InvalidScore('ERR min or max is not a float') from None
+
+
+def format_score(score: float) -> bytes:
+    '''Scores as Redis replies with them: integers without a fraction, other
+    values in the shortest form that reads back the same.'''
+    if score.is_integer() and abs(score) < 1e17:
+        return b'%d' % score
+    return repr(score).encode()
+
+
+class SortedSet:
+    __slots__ = ('pairs', 'scores')
+
+    def __init__(self, scores: dict | None = None) -> None:
+        # (score, member) in order, a list or a SortedList
+        self.pairs = []
+        # member -> score, only once converted to the skiplist encoding
+        self.scores = None
+        if scores:
+            pairs = [(score, member) for member, score in scores.items()]
+            if len(pairs) > ZSET_MAX_LISTPACK_ENTRIES or any(len(member) > ZSET_MAX_LISTPACK_VALUE for member in scores):
+                self.pairs = SortedList(pairs)
+                self.scores = dict(scores)
+            else:
+                pairs.sort()
+                self.pairs = pairs
+
+    @property
+    def encoding(self):
+        return 'listpack' if self.scores is None else 'skiplist'
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def __iter__(self):
+        return iter(self.pairs)
+
+    def convert(self):
+        self.pairs = SortedList(self.pairs)
+        self.scores = {member: score for score, member in self.pairs}
+
+    def score(self, member: bytes) -> float | None:
+        if self.scores is not None:
+            return self.scores.get(member)
+        for score, candidate in self.pairs:
+            if candidate == member:
+                return score
+        return None
+
+    def add(self, member: bytes, score: float) -> bool:
+        '''Sets the score of `member`, returns whether it is new.'''
+        old = self.score(member)
+        if old == score:
+            return False
+        if self.scores is None:
+            if old is not None:
+                self.pairs.remove((old, member))
+            insort(self.pairs, (score, member))
+            if len(self.pairs) > ZSET_MAX_LISTPACK_ENTRIES or len(member) > ZSET_MAX_LISTPACK_VALUE:
+                self.convert()
+        else:
+            if old is not None:
+                self.pairs.discard((old, member))
+            self.pairs.add((score, member))
+            self.scores[member] = score
+        return old is None
+
+    def remove(self, member: bytes) -> bool:
+        score = self.score(member)
+        if score is None:
+            return False
+        if self.scores is None:
+            self.pairs.remove((score, member))
+        else:
+            self.pairs.discard((score, member))
+            del self.scores[member]
+        return True
+
+    def rank(self, member: bytes) -> int | None:
+        '''0 based position of `member` from the lowest score.'''
+        score = self.score(member)
+        if score is None:
+            return None
+        if self.scores is None:
+            return bisect_left(self.pairs, (score, member))
+        return self.pairs.bisect_left((score, member))
+
+    def range(self, start: int, stop: int) -> list[tuple[float, bytes]]:
+        '''The pairs at ranks `start` to `stop`, exclusive.'''
+        if self.scores is None:
+            return self.pairs[max(start, 0):max(stop, 0)]
+        return self.pairs.islice(start, stop)
+
+    def score_span(self, minimum: float, min_exclusive: bool, maximum: float, max_exclusive: bool) -> tuple[int, int]:
+        '''The ranks, `stop` exclusive, of the members scored within the
+        bounds. A pair with only a score sorts before every member with that
+        score, so the bounds are bisected as such.'''
+        pairs = self.pairs
+        bisect = (lambda value: bisect_left(pairs, value)) if self.scores is None else pairs.bisect_left
+        if min_exclusive:
+            start = len(pairs) if minimum == INF else bisect((math.nextafter(minimum, INF),))
+        else:
+            start = bisect((minimum,))
+        if max_exclusive:
+            stop = bisect((maximum,))
+        else:
+            stop = len(pairs) if maximum == INF else bisect((math.nextafter(maximum, INF),))
+        return start, max(start, stop)
+
+    def range_by_rank(self, start: int, stop: int, reverse: bool = False) -> list[tuple[float, bytes]]:
+        '''ZRANGE's inclusive ranks, negative ones counting from the end,
+        from the highest score down when `reverse`.'''
+        n = len(self.pairs)
+        if start < 0:
+            start += n
+        if stop < 0:
+            stop += n
+        start, stop = max(start, 0), min(stop, n - 1)
+        if start > stop:
+            return []
+        if reverse:
+            return self.range(n - 1 - stop, n - start)[::-1]
+        return self.range(start, stop + 1)
+
+    def range_by_score(self, minimum: float, min_exclusive: bool, maximum: float, max_exclusive: bool,
+                       offset: int = 0, count: int = -1, reverse: bool = False) -> list[tuple[float, bytes]]:
+        '''The members scored within the bounds, LIMIT `offset` and `count`
+        applied from the end the range is read from. A negative count means
+        all of them.'''
+        if offset < 0:
+            return []
+        start, stop = self.score_span(minimum, min_exclusive, maximum, max_exclusive)
+        if reverse:
+            stop = max(start, stop - offset)
+            if count >= 0:
+                start = max(start, stop - count)
+            return self.range(start, stop)[::-1]
+        start += offset
+        if count >= 0:
+            stop = min(stop, start + count)
+        return self.range(start, stop)
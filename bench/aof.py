@@ -0,0 +1,85 @@
+'''Write throughput with the AOF off and under each appendfsync policy.
+
+Starts a server per policy on a scratch directory and drives it with SETs:
+
+    python -m bench.aof --clients 50 --pipeline 1 --seconds 5
+
+Replies under `always` wait for the fsync, so its numbers depend on the
+disk; group commit is what keeps them above one write per fsync.'''
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+from app.encoder import ENCODER, EncodedMessageType
+from bench.latency import count_replies, percentile
+
+POLICIES = ['off', 'no', 'everysec', 'always']
+
+
+async def client(idx: int, args, latencies: list[float], deadline: float):
+    reader, writer = await asyncio.open_connection('localhost', args.port)
+    payload = b''.join(ENCODER.encode(['SET', f'bench:{idx}:{i}', 'x' * args.size], EncodedMessageType.ARRAY)
+                       for i in range(args.pipeline))
+    ops = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        writer.write(payload)
+        buffer = b''
+        while count_replies(buffer) < args.pipeline:
+            buffer += await reader.read(65536)
+        latencies.append(time.perf_counter() - start)
+        ops += args.pipeline
+    writer.close()
+    await writer.wait_closed()
+    return ops
+
+
+async def drive(args):
+    latencies = []
+    deadline = time.perf_counter() + args.seconds
+    started = time.perf_counter()
+    ops = await asyncio.gather(*[client(i, args, latencies, deadline) for i in range(args.clients)])
+    return sum(ops) / (time.perf_counter() - started), percentile(latencies, 99)
+
+
+def start_server(policy: str, directory: str, args):
+    cmd = [sys.executable, '-m', 'app.main', '--port', str(args.port), '--dir', directory,
+           '--save', '', '--io', args.io]
+    if policy != 'off':
+        cmd += ['--appendonly', 'yes', '--appendfsync', policy]
+    server = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(('localhost', args.port)).close()
+            return server
+        except ConnectionRefusedError:
+            time.sleep(0.05)
+    server.kill()
+    raise RuntimeError('server did not start')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('bench.aof')
+    parser.add_argument('-p', '--port', default=6399, type=int)
+    parser.add_argument('--clients', default=50, type=int)
+    parser.add_argument('--pipeline', default=1, type=int)
+    parser.add_argument('--size', default=16, type=int, help='SET value size in bytes')
+    parser.add_argument('--seconds', default=5, type=float)
+    parser.add_argument('--io', choices=['asyncio', 'selectors'], default='asyncio')
+    parser.add_argument('--policies', nargs='+', choices=POLICIES, default=POLICIES)
+    args = parser.parse_args()
+
+    print(f'clients={args.clients} pipeline={args.pipeline} value_size={args.size} io={args.io}')
+    for policy in args.policies:
+        with tempfile.TemporaryDirectory() as directory:
+            server = start_server(policy, directory, args)
+            try:
+                ops, p99 = asyncio.run(drive(args))
+            finally:
+                server.terminate()
+                server.wait()
+        print(f'{policy:>9}: {ops:10,.0f} ops/sec  p99 {p99 * 1000:7.3f} ms')
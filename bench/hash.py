@@ -0,0 +1,63 @@
+'''Bytes per field of records, like user profiles, stored as a string key per
+field, as one hash per record in the listpack encoding, and as one hash per
+record converted to a dict.
+
+    python -m bench.hash --records 200000 --fields 8'''
+import argparse
+import tracemalloc
+
+from app import hash as redis_hash
+from app.storage import RedisDB
+
+
+def build_records(no_of_records: int, no_of_fields: int):
+    fields = [b'field%d' % idx for idx in range(no_of_fields)]
+    return [(f'user:{i}', [(field, b'value:%d:%d' % (i, idx)) for idx, field in enumerate(fields)])
+            for i in range(no_of_records)]
+
+
+def measure(fill, no_of_fields: int):
+    '''Returns bytes allocated per field by fill(), which must return the
+    container it filled so that it is still alive when measured.'''
+    tracemalloc.start()
+    container = fill()
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del container
+    return used / no_of_fields
+
+
+def fill_string_keys(records):
+    db = RedisDB()
+    for key, pairs in records:
+        for field, value in pairs:
+            db.set(f'{key}:{field.decode()}', value)
+    return db
+
+
+def fill_hashes(records):
+    db = RedisDB()
+    for key, pairs in records:
+        db.hset(key, pairs)
+    return db
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('bench.hash')
+    parser.add_argument('--records', default=200_000, type=int)
+    parser.add_argument('--fields', default=8, type=int, help='fields per record')
+    args = parser.parse_args()
+
+    # fields and values are shared by every run, only the keyspace is measured
+    records = build_records(args.records, args.fields)
+    no_of_fields = args.records * args.fields
+
+    strings = measure(lambda: fill_string_keys(records), no_of_fields)
+    listpack = measure(lambda: fill_hashes(records), no_of_fields)
+    redis_hash.HASH_MAX_LISTPACK_ENTRIES = 0
+    hashtable = measure(lambda: fill_hashes(records), no_of_fields)
+
+    print(f'records={args.records:,} fields={args.fields}')
+    print(f'string key per field: {strings:8.1f} bytes/field')
+    print(f'hash, listpack:       {listpack:8.1f} bytes/field ({strings / listpack:.1f}x smaller)')
+    print(f'hash, hashtable:      {hashtable:8.1f} bytes/field ({strings / hashtable:.1f}x smaller)')
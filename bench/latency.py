@@ -0,0 +1,88 @@
+'''Load generator used to compare the server's io modes.
+
+Start the server with `--io asyncio` or `--io selectors`, then run
+
+    python -m bench.latency --clients 50 --pipeline 16 --seconds 10
+
+It reports ops/sec and the latency percentiles of each pipelined round trip.'''
+import time
+import asyncio
+import argparse
+
+from app.encoder import ENCODER, EncodedMessageType
+
+
+def percentile(samples: list[float], pct: float):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    idx = min(len(samples) - 1, int(len(samples) * pct / 100))
+    return samples[idx]
+
+
+async def client(idx: int, args, latencies: list[float], deadline: float):
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    cmds = []
+    for i in range(args.pipeline):
+        key = f'bench:{idx}:{i}'
+        if i % 2:
+            cmds.append(ENCODER.encode(['GET', key], EncodedMessageType.ARRAY))
+        else:
+            cmds.append(ENCODER.encode(['SET', key, 'x' * args.size], EncodedMessageType.ARRAY))
+    payload = b''.join(cmds)
+    ops = 0
+
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        writer.write(payload)
+        replies = 0
+        buffer = b''
+        while replies < args.pipeline:
+            buffer += await reader.read(65536)
+            replies = count_replies(buffer)
+        latencies.append(time.perf_counter() - start)
+        ops += args.pipeline
+
+    writer.close()
+    await writer.wait_closed()
+    return ops
+
+
+def count_replies(buffer: bytes):
+    count, pos = 0, 0
+    while pos < len(buffer):
+        end = buffer.find(b'\r\n', pos)
+        if end == -1:
+            break
+        if buffer[pos:pos+1] == b'$' and buffer[pos+1:pos+2] != b'-':
+            length = int(buffer[pos+1:end])
+            if len(buffer) < end + 2 + length + 2:
+                break
+            end = end + 2 + length
+        pos = end + 2
+        count += 1
+    return count
+
+
+async def run(args):
+    latencies = []
+    deadline = time.perf_counter() + args.seconds
+    started = time.perf_counter()
+    ops = await asyncio.gather(*[client(i, args, latencies, deadline) for i in range(args.clients)])
+    elapsed = time.perf_counter() - started
+
+    print(f'clients={args.clients} pipeline={args.pipeline} value_size={args.size}')
+    print(f'ops/sec: {sum(ops) / elapsed:,.0f}')
+    for pct in (50, 99, 99.9):
+        print(f'p{pct}: {percentile(latencies, pct) * 1000:.3f} ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('bench.latency')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('-p', '--port', default=6379, type=int)
+    parser.add_argument('--clients', default=50, type=int)
+    parser.add_argument('--pipeline', default=16, type=int)
+    parser.add_argument('--size', default=16, type=int, help='SET value size in bytes')
+    parser.add_argument('--seconds', default=10, type=float)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,62 @@
+'''Bytes per key of the keyspace, comparing the old layout that wrapped every
+value in a {'value': ..., 'expires': ...} dict with RedisDB's current one.
+
+    python -m bench.memory --keys 1000000 --ttl-ratio 0.1'''
+import argparse
+import tracemalloc
+
+from app import clock
+from app.storage import RedisDB
+
+
+def build_keys(no_of_keys: int):
+    return [(f'key:{i}', f'value:{i}'.encode()) for i in range(no_of_keys)]
+
+
+def measure(fill, no_of_keys: int):
+    '''Returns bytes allocated per key by fill(), which must return the
+    container it filled so that it is still alive when measured.'''
+    tracemalloc.start()
+    container = fill()
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del container
+    return used / no_of_keys
+
+
+def fill_dict_per_key(items, ttl_every: int):
+    store = {}
+    now = clock.now_ms() / 1000
+    for idx, (key, value) in enumerate(items):
+        obj = {'value': value}
+        if ttl_every and idx % ttl_every == 0:
+            obj['expires'] = now + 3600
+        store[key] = obj
+    return store
+
+
+def fill_redis_db(items, ttl_every: int):
+    db = RedisDB()
+    for idx, (key, value) in enumerate(items):
+        if ttl_every and idx % ttl_every == 0:
+            db.set(key, value, px=3_600_000)
+        else:
+            db.set(key, value)
+    return db
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('bench.memory')
+    parser.add_argument('--keys', default=1_000_000, type=int)
+    parser.add_argument('--ttl-ratio', default=0.1, type=float, help='share of keys set with a TTL')
+    args = parser.parse_args()
+
+    # keys and values are shared by both runs, only the keyspace is measured
+    items = build_keys(args.keys)
+    ttl_every = int(1 / args.ttl_ratio) if args.ttl_ratio else 0
+
+    before = measure(lambda: fill_dict_per_key(items, ttl_every), args.keys)
+    after = measure(lambda: fill_redis_db(items, ttl_every), args.keys)
+    print(f'keys={args.keys:,} ttl_ratio={args.ttl_ratio}')
+    print(f'dict per key: {before:8.1f} bytes/key')
+    print(f'RedisDB:      {after:8.1f} bytes/key ({before / after:.1f}x smaller)')
@@ -0,0 +1,61 @@
+'''Sequential against parallel loading of an RDB file.
+
+Generates a dump of --keys string keys like bench.startup does and loads it
+with RDBParser.read_file, then with read_file_parallel at each --workers
+count, checking every load ends up with the same keys:
+
+    python -m bench.parallel_load --keys 2000000 --workers 1 2 4 8
+
+Worker processes only pay off with as many free cores, the keys they decode
+are pickled back to the server process, which merges them on its own.'''
+import os
+import time
+import argparse
+import tempfile
+
+from app.rdb_parser import RDBParser
+from bench.startup import write_dump
+
+
+def time_load(path: str, workers: int):
+    rdb_parser = RDBParser(path)
+    started = time.perf_counter()
+    if workers:
+        rdb_parser.read_file_parallel(workers)
+    else:
+        rdb_parser.read_file()
+    return time.perf_counter() - started, rdb_parser
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('bench.parallel_load')
+    parser.add_argument('--keys', default=2_000_000, type=int)
+    parser.add_argument('--size', default=32, type=int, help='value size in bytes')
+    parser.add_argument('--ttl-ratio', default=0.1, type=float, help='share of keys with a TTL')
+    parser.add_argument('--workers', default=[1, 2, 4, 8], nargs='+', type=int)
+    parser.add_argument('--file', help='dump to use, generated if it does not exist')
+    args = parser.parse_args()
+
+    path = args.file
+    if path is None:
+        fd, path = tempfile.mkstemp(suffix='.rdb')
+        os.close(fd)
+        os.unlink(path)
+    try:
+        if not os.path.exists(path):
+            write_dump(path, args.keys, args.size, int(1 / args.ttl_ratio) if args.ttl_ratio else 0)
+        mb = os.path.getsize(path) / 1024 / 1024
+        print(f'keys={args.keys:,} dump={mb:.1f} MB cpus={os.cpu_count()}')
+
+        baseline, expected = time_load(path, 0)
+        keys = len(expected.get_database())
+        print(f'sequential: {baseline:.2f} s {keys / baseline:,.0f} keys/s')
+        for workers in args.workers:
+            elapsed, loaded = time_load(path, workers)
+            if loaded.get_database() != expected.get_database() or loaded.get_expires() != expected.get_expires():
+                raise AssertionError(f'{workers} workers loaded different keys')
+            print(f'{workers} workers: {elapsed:.2f} s {keys / elapsed:,.0f} keys/s '
+                  f'{baseline / elapsed:.2f}x sequential')
+    finally:
+        if args.file is None:
+            os.unlink(path)
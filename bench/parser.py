@@ -0,0 +1,39 @@
+'''Micro-benchmark of RespParser.parse_multiple on pipelined SET/GET commands,
+comparing the state machine with the flat array fast path.
+
+    python -m bench.parser'''
+import timeit
+import argparse
+
+from app.resp_parser import RespParser
+from app.encoder import ENCODER, EncodedMessageType
+
+
+def build_pipeline(no_of_cmds: int, value_size: int):
+    cmds = []
+    for i in range(no_of_cmds):
+        if i % 2:
+            cmds.append(ENCODER.encode(['GET', f'key:{i}'], EncodedMessageType.ARRAY))
+        else:
+            cmds.append(ENCODER.encode(['SET', f'key:{i}', 'v' * value_size], EncodedMessageType.ARRAY))
+    return b''.join(cmds)
+
+
+def time_parser(data: bytes, fast_path: bool, number: int):
+    parser = RespParser(fast_path=fast_path)
+    return min(timeit.repeat(lambda: parser.parse_multiple(data), number=number, repeat=5)) / number
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser('bench.parser')
+    arg_parser.add_argument('--size', default=16, type=int, help='SET value size in bytes')
+    arg_parser.add_argument('--pipelines', default=[1, 16, 256], type=int, nargs='+')
+    args = arg_parser.parse_args()
+
+    print(f'{"cmds":>6} {"state machine":>16} {"fast path":>16} {"speedup":>8}')
+    for no_of_cmds in args.pipelines:
+        data = build_pipeline(no_of_cmds, args.size)
+        number = max(10, 20000 // no_of_cmds)
+        slow = time_parser(data, False, number)
+        fast = time_parser(data, True, number)
+        print(f'{no_of_cmds:>6} {slow / no_of_cmds * 1e6:>13.2f} us {fast / no_of_cmds * 1e6:>13.2f} us {slow / fast:>7.1f}x')
@@ -0,0 +1,112 @@
+'''Job queue throughput on a list: producers RPUSH batches of jobs while
+consumers take them, either blocked in BLPOP or polling with LPOP and a
+count. Starts a server on a scratch directory for each pattern:
+
+    python -m bench.queue --producers 4 --consumers 8 --seconds 5
+
+Reported are jobs pushed and popped per second, and the p99 of a BLPOP's
+or an LPOP's round trip.'''
+import time
+import asyncio
+import argparse
+import tempfile
+
+from app.encoder import ENCODER, EncodedMessageType
+from bench.aof import start_server
+from bench.latency import percentile
+
+PATTERNS = ['blpop', 'lpop']
+
+
+async def request(reader: asyncio.StreamReader, writer, payload: bytes):
+    '''Sends one command, returns its reply: an int, a list of bulk strings,
+    or None for a null array.'''
+    writer.write(payload)
+    line = await reader.readline()
+    if line.startswith(b':'):
+        return int(line[1:])
+    length = int(line[1:])
+    if length < 0:
+        return None
+    elements = []
+    for _ in range(length):
+        size = int((await reader.readline())[1:])
+        elements.append((await reader.readexactly(size + 2))[:-2])
+    return elements
+
+
+async def producer(idx: int, args, deadline: float):
+    reader, writer = await asyncio.open_connection('localhost', args.port)
+    jobs = [b'job:%d:%s' % (idx, b'x' * args.size)] * args.batch
+    payload = ENCODER.encode(['RPUSH', 'queue', *jobs], EncodedMessageType.ARRAY)
+    pushed = 0
+    while time.perf_counter() < deadline:
+        length = await request(reader, writer, payload)
+        pushed += args.batch
+        if length > args.max_backlog:
+            # consumers fell behind, don't let the list grow without bound
+            await asyncio.sleep(0.001)
+    writer.close()
+    await writer.wait_closed()
+    return pushed
+
+
+async def consumer(args, deadline: float, latencies: list[float]):
+    reader, writer = await asyncio.open_connection('localhost', args.port)
+    if args.pattern == 'blpop':
+        payload = ENCODER.encode(['BLPOP', 'queue', '0.1'], EncodedMessageType.ARRAY)
+    else:
+        payload = ENCODER.encode(['LPOP', 'queue', str(args.batch)], EncodedMessageType.ARRAY)
+    popped = 0
+    # runs past the deadline until the queue is drained
+    while True:
+        start = time.perf_counter()
+        reply = await request(reader, writer, payload)
+        latencies.append(time.perf_counter() - start)
+        if reply:
+            popped += 1 if args.pattern == 'blpop' else len(reply)
+        elif time.perf_counter() >= deadline:
+            break
+        elif args.pattern == 'lpop':
+            # nothing to poll, back off like a polling worker would
+            await asyncio.sleep(0.001)
+    writer.close()
+    await writer.wait_closed()
+    return popped
+
+
+async def drive(args):
+    latencies = []
+    deadline = time.perf_counter() + args.seconds
+    started = time.perf_counter()
+    results = await asyncio.gather(*[producer(i, args, deadline) for i in range(args.producers)],
+                                   *[consumer(args, deadline, latencies) for _ in range(args.consumers)])
+    elapsed = time.perf_counter() - started
+    pushed, popped = sum(results[:args.producers]), sum(results[args.producers:])
+    return pushed / elapsed, popped / elapsed, percentile(latencies, 99)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('bench.queue')
+    parser.add_argument('-p', '--port', default=6399, type=int)
+    parser.add_argument('--producers', default=4, type=int)
+    parser.add_argument('--consumers', default=8, type=int)
+    parser.add_argument('--batch', default=10, type=int, help='jobs per RPUSH, and per LPOP when polling')
+    parser.add_argument('--size', default=32, type=int, help='job payload size in bytes')
+    parser.add_argument('--max-backlog', default=100_000, type=int, help='queue length producers slow down at')
+    parser.add_argument('--seconds', default=5, type=float)
+    parser.add_argument('--io', choices=['asyncio', 'selectors'], default='asyncio')
+    parser.add_argument('--patterns', nargs='+', choices=PATTERNS, default=PATTERNS)
+    args = parser.parse_args()
+
+    print(f'producers={args.producers} consumers={args.consumers} batch={args.batch} job_size={args.size} io={args.io}')
+    for pattern in args.patterns:
+        args.pattern = pattern
+        with tempfile.TemporaryDirectory() as directory:
+            server = start_server('off', directory, args)
+            try:
+                pushed, popped, p99 = asyncio.run(drive(args))
+            finally:
+                server.terminate()
+                server.wait()
+        print(f'{pattern:>6}: pushed {pushed:10,.0f} jobs/sec  popped {popped:10,.0f} jobs/sec  p99 {p99 * 1000:7.3f} ms')
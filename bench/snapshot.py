@@ -0,0 +1,59 @@
+'''Throughput of RDB snapshots: RDBWriter writing a keyspace to a file, the
+way a full sync does, and RDBParser reading it back, the replica's side.
+
+    python -m bench.snapshot --keys 1000000'''
+import os
+import argparse
+import tempfile
+from time import perf_counter
+
+from app.rdb_parser import RDBParser
+from app.rdb_writer import RDBWriter
+from app.storage import Keyspace
+
+
+def build_keyspace(no_of_keys: int, value_size: int, ttl_every: int):
+    keyspace = Keyspace(1)
+    db = keyspace[0]
+    value = b'v' * value_size
+    for i in range(no_of_keys):
+        if i % 4 == 0:
+            # a share of int encoded values
+            db.set(f'key:{i}', i)
+        elif ttl_every and i % ttl_every == 0:
+            db.set(f'key:{i}', value, px=3_600_000)
+        else:
+            db.set(f'key:{i}', value)
+    for i in range(1, 10_001):
+        db.xadd('stream', f'{i}-0', [b'field', b'%d' % i])
+    return keyspace
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('bench.snapshot')
+    parser.add_argument('--keys', default=1_000_000, type=int)
+    parser.add_argument('--size', default=32, type=int, help='value size in bytes')
+    parser.add_argument('--ttl-ratio', default=0.1, type=float, help='share of keys set with a TTL')
+    args = parser.parse_args()
+
+    keyspace = build_keyspace(args.keys, args.size, int(1 / args.ttl_ratio) if args.ttl_ratio else 0)
+    fd, path = tempfile.mkstemp(suffix='.rdb')
+    os.close(fd)
+    try:
+        started = perf_counter()
+        with open(path, 'wb') as f:
+            size = RDBWriter(keyspace).write(f)
+        write_time = perf_counter() - started
+
+        started = perf_counter()
+        rdb_parser = RDBParser(path)
+        rdb_parser.read_file()
+        read_time = perf_counter() - started
+        assert len(rdb_parser.get_database()) == keyspace[0].dbsize()
+    finally:
+        os.unlink(path)
+
+    mb = size / 1024 / 1024
+    print(f'keys={args.keys:,} value_size={args.size} snapshot={mb:.1f} MB')
+    print(f'write: {write_time:6.2f} s {mb / write_time:8.1f} MB/s {args.keys / write_time:12,.0f} keys/s')
+    print(f'load:  {read_time:6.2f} s {mb / read_time:8.1f} MB/s {args.keys / read_time:12,.0f} keys/s')
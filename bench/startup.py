@@ -0,0 +1,105 @@
+'''Startup time of a server loading a large RDB file.
+
+Generates a dump of --keys string keys, starts the server on it and times
+how long it takes to accept connections, along with the server's peak RSS:
+
+    python -m bench.startup --keys 5000000
+
+The dump is written straight to disk rather than built in memory first. Pass
+--file to keep it and reuse it on the next run.'''
+import os
+import sys
+import time
+import socket
+import argparse
+import resource
+import tempfile
+import subprocess
+
+from app.constants import MAGIC_STR
+from app.crc64 import crc64
+from app.rdb_parser import (RDB_OPCODE_AUX, RDB_OPCODE_EOF, RDB_OPCODE_EXPIRETIME_MS, RDB_OPCODE_RESIZEDB,
+                            RDB_OPCODE_SELECTDB, RDB_TYPE_STRING)
+from app.rdb_writer import RDB_VERSION, encode_int, encode_length, encode_string
+
+
+def write_dump(path: str, no_of_keys: int, value_size: int, ttl_every: int):
+    value = encode_string(b'v' * value_size)
+    expire = int(time.time() * 1000) + 24 * 3600 * 1000
+    buf = bytearray(MAGIC_STR + RDB_VERSION)
+    buf.append(RDB_OPCODE_AUX)
+    buf += encode_string(b'redis-ver') + encode_string(b'7.2.0')
+    buf.append(RDB_OPCODE_SELECTDB)
+    buf += encode_length(0)
+    buf.append(RDB_OPCODE_RESIZEDB)
+    buf += encode_length(no_of_keys) + encode_length(no_of_keys // ttl_every if ttl_every else 0)
+    # a real checksum, so that startup times include checking it
+    crc = 0
+    with open(path, 'wb') as f:
+        for i in range(no_of_keys):
+            if ttl_every and i % ttl_every == 0:
+                buf.append(RDB_OPCODE_EXPIRETIME_MS)
+                buf += expire.to_bytes(8, 'little')
+            buf.append(RDB_TYPE_STRING)
+            buf += encode_string(b'key:%d' % i)
+            # a share of values that load as ints
+            buf += encode_int(i) if i % 4 == 0 else value
+            if len(buf) >= 1 << 20:
+                crc = crc64(buf, crc)
+                f.write(buf)
+                buf.clear()
+        buf.append(RDB_OPCODE_EOF)
+        crc = crc64(buf, crc)
+        buf += crc.to_bytes(8, 'little')
+        f.write(buf)
+
+
+def time_startup(path: str, port: int, io: str):
+    directory, filename = os.path.split(os.path.abspath(path))
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, '-m', 'app.main', '--port', str(port), '--dir', directory,
+                               '--dbfilename', filename, '--save', '', '--io', io])
+    try:
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError(f'server exited with {server.returncode}')
+            try:
+                socket.create_connection(('localhost', port)).close()
+                break
+            except ConnectionRefusedError:
+                time.sleep(0.01)
+        return time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('bench.startup')
+    parser.add_argument('--keys', default=5_000_000, type=int)
+    parser.add_argument('--size', default=32, type=int, help='value size in bytes')
+    parser.add_argument('--ttl-ratio', default=0.1, type=float, help='share of keys with a TTL')
+    parser.add_argument('--file', help='dump to use, generated if it does not exist')
+    parser.add_argument('-p', '--port', default=6398, type=int)
+    parser.add_argument('--io', choices=['asyncio', 'selectors'], default='asyncio')
+    args = parser.parse_args()
+
+    path = args.file
+    if path is None:
+        fd, path = tempfile.mkstemp(suffix='.rdb')
+        os.close(fd)
+        os.unlink(path)
+    try:
+        if not os.path.exists(path):
+            started = time.perf_counter()
+            write_dump(path, args.keys, args.size, int(1 / args.ttl_ratio) if args.ttl_ratio else 0)
+            print(f'generated {path} in {time.perf_counter() - started:.1f} s')
+        mb = os.path.getsize(path) / 1024 / 1024
+        elapsed = time_startup(path, args.port, args.io)
+    finally:
+        if args.file is None:
+            os.unlink(path)
+
+    peak_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(f'keys={args.keys:,} dump={mb:.1f} MB')
+    print(f'startup: {elapsed:.2f} s {mb / elapsed:.1f} MB/s {args.keys / elapsed:,.0f} keys/s, peak RSS {peak_mb:.0f} MB')
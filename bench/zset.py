@@ -0,0 +1,59 @@
+'''Sorted set operations on one big sorted set, through the command handlers:
+ZADD filling it with random scores, then ZRANGEBYSCORE windows, ZRANK and
+ZRANGE by rank at random places in it, a leaderboard's and a delay queue's
+reads.
+
+    python -m bench.zset --members 1000000 --queries 100000'''
+import argparse
+import random
+from time import perf_counter
+
+from app.commands import Command
+from app.storage import Keyspace
+
+
+def timed(command: Command, cmds: list[list[bytes]]):
+    handle = command.handle_cmd
+    started = perf_counter()
+    for cmd_arr in cmds:
+        handle(cmd_arr, None, send_to_sock=False)
+    return perf_counter() - started
+
+
+def report(name: str, ops: int, elapsed: float):
+    print(f'{name:<28} {elapsed:7.2f} s {ops / elapsed:12,.0f} ops/s {elapsed / ops * 1e6:8.2f} us/op')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('bench.zset')
+    parser.add_argument('--members', default=1_000_000, type=int)
+    parser.add_argument('--queries', default=100_000, type=int)
+    parser.add_argument('--window', default=10, type=int, help='members a ZRANGEBYSCORE returns')
+    parser.add_argument('--seed', default=1, type=int)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    command = Command(keyspace=Keyspace(1))
+    scores = [rng.random() * args.members for _ in range(args.members)]
+    members = [b'member:%d' % i for i in range(args.members)]
+
+    elapsed = timed(command, [[b'ZADD', b'zset', b'%r' % score, member] for score, member in zip(scores, members)])
+    report('ZADD', args.members, elapsed)
+    assert command.storage.get_zset('zset').encoding == 'skiplist'
+
+    updates = rng.sample(range(args.members), min(args.queries, args.members))
+    elapsed = timed(command, [[b'ZADD', b'zset', b'%r' % (rng.random() * args.members), members[i]] for i in updates])
+    report('ZADD (update score)', len(updates), elapsed)
+
+    # bounds about `window` members apart, the scores being uniform
+    starts = [rng.random() * args.members for _ in range(args.queries)]
+    cmds = [[b'ZRANGEBYSCORE', b'zset', b'%r' % start, b'(%r' % (start + args.window)] for start in starts]
+    report(f'ZRANGEBYSCORE ~{args.window} members', args.queries, timed(command, cmds))
+    cmds = [[b'ZRANGEBYSCORE', b'zset', b'-inf', b'+inf', b'LIMIT', b'0', b'%d' % args.window] for _ in range(args.queries)]
+    report(f'ZRANGEBYSCORE LIMIT 0 {args.window}', args.queries, timed(command, cmds))
+
+    cmds = [[b'ZRANK', b'zset', members[rng.randrange(args.members)]] for _ in range(args.queries)]
+    report('ZRANK', args.queries, timed(command, cmds))
+    ranks = [rng.randrange(args.members) for _ in range(args.queries)]
+    cmds = [[b'ZRANGE', b'zset', b'%d' % rank, b'%d' % (rank + args.window - 1), b'WITHSCORES'] for rank in ranks]
+    report(f'ZRANGE {args.window} by rank', args.queries, timed(command, cmds))
@@ -0,0 +1,72 @@
+'''Runs commands against a Command the way a connection would, without a
+server: replies are returned instead of sent.'''
+from app.commands import Command
+
+
+class FakeTimer:
+
+    def __init__(self, callback) -> None:
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeLoop:
+    '''Keeps the timers blocked clients set, fired by hand.'''
+
+    def __init__(self) -> None:
+        self.timers: list[FakeTimer] = []
+
+    def call_later(self, delay: float, callback):
+        timer = FakeTimer(callback)
+        self.timers.append(timer)
+        return timer
+
+    def fire(self):
+        for timer in self.timers:
+            if not timer.cancelled:
+                timer.callback()
+        self.timers = []
+
+
+class FakeSocket:
+    '''Stands in for a client connection, collecting what is sent to it.'''
+
+    def __init__(self) -> None:
+        self.sent = []
+        self.waiter = None
+        self.loop = FakeLoop()
+
+    def sendall(self, data: bytes):
+        self.sent.append(data)
+
+    def block(self, waiter):
+        self.waiter = waiter
+
+    def unblock(self):
+        self.waiter = None
+
+
+def run(command: Command, *args, socket=None) -> bytes:
+    '''Runs one command, returns its encoded reply.'''
+    cmd_arr = [arg if isinstance(arg, bytes) else str(arg).encode() for arg in args]
+    return command.handle_cmd(cmd_arr, socket or FakeSocket(), False)
+
+
+def bulk_array(*elements) -> bytes:
+    '''The encoding of an array of bulk strings, to compare replies with.'''
+    encoded = [b'$%d\r\n%s\r\n' % (len(e), e) for e in (str(e).encode() for e in elements)]
+    return b'*%d\r\n' % len(encoded) + b''.join(encoded)
+
+
+class Recorder(Command):
+    '''Keeps what would be passed on to replicas, as (command, db).'''
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.propagated = []
+
+    def propagate(self, cmd_arr: list[bytes], db: int | None = None):
+        self.propagated.append((cmd_arr, db))
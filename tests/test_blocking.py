@@ -0,0 +1,111 @@
+from app.commands import Command
+from app.storage import Keyspace
+from tests.helpers import FakeSocket, run, bulk_array
+
+
+def blocked_client(keyspace: Keyspace, *args, db: int = 0):
+    command, socket = Command(keyspace=keyspace), FakeSocket()
+    if db:
+        run(command, 'SELECT', db)
+    assert run(command, *args, socket=socket) is None
+    assert socket.waiter is not None
+    return socket
+
+
+def entries(keyspace: Keyspace, key: str, db: int = 0):
+    '''The reply of an XREAD of every entry of `key`, what a client blocked
+    on it before the first XADD gets.'''
+    command = Command(keyspace=keyspace)
+    run(command, 'SELECT', db)
+    return run(command, 'XREAD', 'STREAMS', key, '0-0')
+
+
+def test_xread_served_by_xadd():
+    keyspace = Keyspace()
+    socket = blocked_client(keyspace, 'XREAD', 'BLOCK', '0', 'STREAMS', 's', '$')
+    run(Command(keyspace=keyspace), 'XADD', 's', '1-1', 'f', 'v')
+    assert socket.sent == [entries(keyspace, 's')]
+    assert socket.waiter is None
+    assert not keyspace[0].blocking.waiters
+
+
+def test_xread_times_out():
+    keyspace = Keyspace()
+    socket = blocked_client(keyspace, 'XREAD', 'BLOCK', '100', 'STREAMS', 's', '$')
+    socket.loop.fire()
+    assert socket.sent == [b'$-1\r\n']
+    assert not keyspace[0].blocking.waiters
+
+
+def test_xread_woken_after_exec_that_selects_another_db():
+    keyspace = Keyspace()
+    socket = blocked_client(keyspace, 'XREAD', 'BLOCK', '0', 'STREAMS', 's', '$')
+    writer = Command(keyspace=keyspace)
+    for args in (['MULTI'], ['XADD', 's', '1-1', 'f', 'v'], ['SELECT', '1']):
+        run(writer, *args)
+    # not served while the transaction is only queued
+    assert socket.sent == []
+    run(writer, 'EXEC')
+    assert socket.sent == [entries(keyspace, 's')]
+    assert writer.db == 1
+
+
+def test_exec_serves_every_db_it_wrote_to():
+    keyspace = Keyspace()
+    in_db0 = blocked_client(keyspace, 'XREAD', 'BLOCK', '0', 'STREAMS', 's', '$')
+    in_db2 = blocked_client(keyspace, 'XREAD', 'BLOCK', '0', 'STREAMS', 's', '$', db=2)
+    writer = Command(keyspace=keyspace)
+    for args in (['MULTI'], ['SELECT', '2'], ['XADD', 's', '1-1', 'a', 'b'], ['SELECT', '0'],
+                 ['XADD', 's', '2-1', 'c', 'd'], ['EXEC']):
+        run(writer, *args)
+    assert in_db0.sent == [entries(keyspace, 's')]
+    assert in_db2.sent == [entries(keyspace, 's', db=2)]
+
+
+def test_swapdb_wakes_clients_of_both_dbs():
+    keyspace = Keyspace()
+    in_db0 = blocked_client(keyspace, 'XREAD', 'BLOCK', '0', 'STREAMS', 's', '0-0')
+    in_db1 = blocked_client(keyspace, 'XREAD', 'BLOCK', '0', 'STREAMS', 't', '0-0', db=1)
+    writer = Command(keyspace=keyspace)
+    run(writer, 'XADD', 't', '1-1', 'f', 'x')
+    run(writer, 'SELECT', '1')
+    run(writer, 'XADD', 's', '1-1', 'f', 'y')
+    # each entry went to the db its waiter isn't in
+    assert in_db0.sent == in_db1.sent == []
+    run(writer, 'SWAPDB', '0', '1')
+    assert in_db0.sent == [entries(keyspace, 's')]
+    assert in_db1.sent == [entries(keyspace, 't', db=1)]
+
+
+def test_write_to_another_db_does_not_wake():
+    keyspace = Keyspace()
+    socket = blocked_client(keyspace, 'XREAD', 'BLOCK', '0', 'STREAMS', 's', '$', db=1)
+    run(Command(keyspace=keyspace), 'XADD', 's', '1-1', 'f', 'v')
+    assert socket.sent == [] and socket.waiter is not None
+    assert keyspace.signalled == {}
+
+
+def test_blpop_served_by_push():
+    keyspace = Keyspace()
+    socket = blocked_client(keyspace, 'BLPOP', 'q', '0')
+    run(Command(keyspace=keyspace), 'RPUSH', 'q', 'a', 'b')
+    assert socket.sent == [bulk_array('q', 'a')]
+    assert socket.waiter is None
+    assert keyspace[0].get_list('q').range(0, -1) == [b'b']
+
+
+def test_blpop_times_out():
+    keyspace = Keyspace()
+    socket = blocked_client(keyspace, 'BRPOP', 'q', '0.1')
+    socket.loop.fire()
+    assert socket.sent == [b'*-1\r\n']
+    assert not keyspace[0].blocking.waiters
+
+
+def test_blpop_waiters_served_in_order():
+    keyspace = Keyspace()
+    first = blocked_client(keyspace, 'BLPOP', 'q', '0')
+    second = blocked_client(keyspace, 'BLPOP', 'q', '0')
+    run(Command(keyspace=keyspace), 'RPUSH', 'q', 'a')
+    assert first.sent == [bulk_array('q', 'a')]
+    assert second.sent == [] and second.waiter is not None
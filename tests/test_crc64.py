@@ -0,0 +1,55 @@
+import os
+import random
+
+import pytest
+
+from app import crc64 as crc64_module
+from app.commands import Command
+from app.crc64 import crc64, _crc64_bytewise
+from app.rdb_parser import RDBParser, WrongFile
+from app.rdb_writer import RDBWriter
+from tests.helpers import run
+
+
+def test_check_value():
+    assert crc64(b'123456789') == 0xE9C6D914C4B8D9CA
+
+
+@pytest.mark.parametrize('size', [crc64_module.MIN_LANES_SIZE - 1, crc64_module.MIN_LANES_SIZE,
+                                  crc64_module.MIN_LANES_SIZE + 8 * crc64_module.LANES + 13, 1_000_003])
+def test_lanes_match_bytewise(size):
+    data = random.Random(size).randbytes(size)
+    assert crc64(data) == _crc64_bytewise(data, 0)
+    # in parts, and from a view
+    assert crc64(data[777:], crc64(data[:777])) == crc64(data)
+    assert crc64(memoryview(bytearray(data))[:size - 5]) == _crc64_bytewise(data[:size - 5], 0)
+
+
+def dump_with_checksum(path):
+    command = Command()
+    for idx in range(20000):
+        run(command, 'SET', 'key:%d' % idx, 'value:%d' % idx)
+    with open(path, 'wb') as f:
+        RDBWriter(command.keyspace).write(f)
+    data = bytearray(path.read_bytes())
+    data[-8:] = crc64(data[:-8]).to_bytes(8, 'little')
+    path.write_bytes(data)
+    return data
+
+
+@pytest.mark.parametrize('concurrent', [False, True])
+def test_file_checksum_verified(tmp_path, monkeypatch, concurrent):
+    monkeypatch.setattr(RDBParser, 'CONCURRENT_CRC_SIZE', 0 if concurrent else 1 << 62)
+    monkeypatch.setattr(os, 'cpu_count', lambda: 2)
+    path = tmp_path / 'dump.rdb'
+    data = dump_with_checksum(path)
+    parser = RDBParser(path)
+    parser.read_file()
+    assert parser.get_database()['key:7'] == b'value:7'
+
+    data[len(data) // 2] ^= 1
+    path.write_bytes(data)
+    with pytest.raises(WrongFile):
+        RDBParser(path).read_file()
+    # unless checking is off
+    RDBParser(path, check_crc=False).read_file()
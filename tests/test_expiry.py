@@ -0,0 +1,54 @@
+import pytest
+
+from app import clock
+from tests.helpers import Recorder, run
+
+
+@pytest.fixture
+def command():
+    command = Recorder()
+    command.keyspace.set_expired_hook(lambda db, key: command.written([b'DEL', key.encode()], db))
+    return command
+
+
+def later(monkeypatch, ms: int):
+    monkeypatch.setattr(clock, '_now_ms', clock.now_ms() + ms)
+
+
+def test_px_propagated_as_pxat(command):
+    run(command, 'SET', 'k', 'v', 'PX', '100')
+    expires = b'%d' % (clock.now_ms() + 100)
+    assert command.propagated == [([b'SET', b'k', b'v', b'PXAT', expires], 0)]
+    assert command.storage.expires['k'] == int(expires)
+
+
+def test_lazy_expiry_propagates_del(command, monkeypatch):
+    run(command, 'SELECT', '2')
+    run(command, 'SET', 'k', 'v', 'PX', '100')
+    later(monkeypatch, 101)
+    assert run(command, 'GET', 'k') == b'$-1\r\n'
+    assert command.propagated[1:] == [([b'DEL', b'k'], 2)]
+    assert command.keyspace.expired_keys == 1
+
+
+def test_active_expiry_propagates_del(command, monkeypatch):
+    run(command, 'SELECT', '3')
+    run(command, 'SET', 'a', '1', 'PX', '10')
+    run(command, 'SET', 'b', '1', 'PX', '1000')
+    later(monkeypatch, 11)
+    command.keyspace.active_expire_cycle(1.0)
+    assert command.propagated[2:] == [([b'DEL', b'a'], 3)]
+    assert list(command.storage.store) == ['b']
+
+
+def test_del(command, monkeypatch):
+    run(command, 'SET', 'a', '1')
+    run(command, 'SET', 'b', '1', 'PX', '10')
+    run(command, 'XADD', 's', '1-1', 'f', 'v')
+    later(monkeypatch, 11)
+    # b expired, and is deleted as such rather than by the DEL
+    assert run(command, 'DEL', 'a', 'b', 's', 'missing') == b':2\r\n'
+    assert command.storage.store == {}
+    assert command.propagated[3:] == [([b'DEL', b'b'], 0), ([b'DEL', b'a', b'b', b's', b'missing'], 0)]
+    assert run(command, 'DEL', 'a') == b':0\r\n'
+    assert len(command.propagated) == 5
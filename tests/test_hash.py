@@ -0,0 +1,59 @@
+from app import hash as redis_hash
+from app.commands import Command
+from app.hash import RedisHash
+from tests.helpers import run, bulk_array
+
+
+def test_converts_past_max_entries():
+    hash = RedisHash()
+    for idx in range(redis_hash.HASH_MAX_LISTPACK_ENTRIES):
+        hash.set(b'f%d' % idx, idx)
+    assert hash.encoding == 'listpack'
+    assert hash.set(b'one more', b'v')
+    assert hash.encoding == 'hashtable'
+    assert len(hash) == redis_hash.HASH_MAX_LISTPACK_ENTRIES + 1
+    assert hash.get(b'f5') == 5
+
+
+def test_converts_on_long_field_or_value():
+    hash = RedisHash()
+    hash.set(b'f', b'x' * redis_hash.HASH_MAX_LISTPACK_VALUE)
+    assert hash.encoding == 'listpack'
+    hash.set(b'f', b'x' * (redis_hash.HASH_MAX_LISTPACK_VALUE + 1))
+    assert hash.encoding == 'hashtable'
+    hash = RedisHash()
+    hash.set(b'x' * (redis_hash.HASH_MAX_LISTPACK_VALUE + 1), b'v')
+    assert hash.encoding == 'hashtable'
+
+
+def test_loaded_hash_picks_encoding():
+    fields = {b'f%d' % idx: b'%d' % idx for idx in range(redis_hash.HASH_MAX_LISTPACK_ENTRIES)}
+    assert RedisHash(fields).encoding == 'listpack'
+    assert RedisHash(fields).get(b'f3') == 3
+    fields[b'extra'] = b'v'
+    assert RedisHash(fields).encoding == 'hashtable'
+
+
+def test_value_equal_to_field_skipped():
+    hash = RedisHash()
+    hash.set(b'a', b'b')
+    hash.set(b'b', b'c')
+    assert hash.find(b'b') == 2
+    assert hash.get(b'b') == b'c'
+    assert hash.delete(b'b')
+    assert list(hash.items()) == [(b'a', b'b')]
+    assert not hash.delete(b'b')
+
+
+def test_commands():
+    command = Command()
+    assert run(command, 'HSET', 'h', 'a', '1', 'b', 'x') == b':2\r\n'
+    assert run(command, 'HSET', 'h', 'a', '2') == b':0\r\n'
+    assert run(command, 'HINCRBY', 'h', 'a', '40') == b':42\r\n'
+    assert run(command, 'HINCRBY', 'h', 'b', '1') == b'-ERR hash value is not an integer\r\n'
+    assert run(command, 'HGETALL', 'h') == bulk_array('a', '42', 'b', 'x')
+    assert run(command, 'HDEL', 'h', 'a', 'b', 'c') == b':2\r\n'
+    # the last field took the key with it
+    assert run(command, 'TYPE', 'h') == b'+none\r\n'
+    run(command, 'SET', 's', 'v')
+    assert run(command, 'HGET', 's', 'f').startswith(b'-WRONGTYPE')
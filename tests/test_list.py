@@ -0,0 +1,61 @@
+import random
+
+from app import quicklist
+from app.commands import Command
+from app.quicklist import QuickList
+from tests.helpers import run, bulk_array
+
+
+def check_chunks(ql: QuickList):
+    '''Every chunk but the ends is full, what locate() relies on.'''
+    chunks = list(ql.chunks)
+    assert all(chunks)
+    assert all(len(chunk) == quicklist.CHUNK_SIZE for chunk in chunks[1:-1])
+    assert sum(map(len, chunks)) == len(ql)
+
+
+def test_matches_a_list():
+    rng = random.Random(25)
+    ql, reference = QuickList(range(300)), list(range(300))
+    for step in range(5000):
+        op = rng.randrange(4)
+        if op == 0:
+            ql.push_left(step)
+            reference.insert(0, step)
+        elif op == 1:
+            ql.push_right(step)
+            reference.append(step)
+        elif op == 2:
+            assert ql.pop_left() == (reference.pop(0) if reference else None)
+        else:
+            assert ql.pop_right() == (reference.pop() if reference else None)
+        if step % 50 == 0:
+            check_chunks(ql)
+            start, stop = rng.randrange(-400, 400), rng.randrange(-400, 400)
+            n = len(reference)
+            lo, hi = max(start + n if start < 0 else start, 0), min(stop + n if stop < 0 else stop, n - 1)
+            assert ql.range(start, stop) == (reference[lo:hi + 1] if lo <= hi else [])
+            idx = rng.randrange(-400, 400)
+            expected = reference[idx] if -n <= idx < n else None
+            assert ql.index(idx) == expected
+    assert list(ql) == reference
+
+
+def test_pop_with_count():
+    command = Command()
+    run(command, 'RPUSH', 'l', *range(5))
+    assert run(command, 'LPOP', 'l', '2') == bulk_array(0, 1)
+    assert run(command, 'RPOP', 'l', '10') == bulk_array(4, 3, 2)
+    assert run(command, 'LPOP', 'l', '2') == b'*-1\r\n'
+    assert run(command, 'LPOP', 'l') == b'$-1\r\n'
+    assert run(command, 'LLEN', 'l') == b':0\r\n'
+
+
+def test_lrange_and_lindex():
+    command = Command()
+    run(command, 'RPUSH', 'l', *range(1000))
+    assert run(command, 'LRANGE', 'l', '-3', '-1') == bulk_array(997, 998, 999)
+    assert run(command, 'LRANGE', 'l', '126', '129') == bulk_array(126, 127, 128, 129)
+    assert run(command, 'LRANGE', 'l', '5', '2') == b'*0\r\n'
+    assert run(command, 'LINDEX', 'l', '-1000') == b'$1\r\n0\r\n'
+    assert run(command, 'LINDEX', 'l', '1000') == b'$-1\r\n'
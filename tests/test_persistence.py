@@ -0,0 +1,141 @@
+import io
+import time
+
+import pytest
+
+from app import clock
+from app.aof import AppendOnlyFile
+from app.commands import Command
+from app.persistence import Persistence
+from app.rdb_writer import RDBWriter
+from app.storage import Keyspace, QuickList, RedisHash, RedisStream, SortedSet
+from tests.helpers import run
+
+
+def fill(command: Command, db: int):
+    run(command, 'SELECT', db)
+    run(command, 'SET', 'string', 'hello')
+    run(command, 'SET', 'int', '-12345')
+    run(command, 'SET', 'ttl', 'v', 'PX', '100000')
+    run(command, 'SET', 'wide int', str(2**40))
+    run(command, 'INCR', 'n')
+    run(command, 'RPUSH', 'list', *range(300))
+    run(command, 'LPUSH', 'short list', 'a', 'b')
+    run(command, 'HSET', 'hash', 'f', 'v', 'n', '7')
+    run(command, 'HSET', 'big hash', *[x for idx in range(200) for x in ('f%d' % idx, idx)])
+    run(command, 'HSET', 'long hash', 'f', 'x' * 100)
+    run(command, 'ZADD', 'zset', '1.5', 'a', '-2', 'b', 'inf', 'c')
+    run(command, 'ZADD', 'big zset', *[x for idx in range(200) for x in (idx / 3, 'm%d' % idx)])
+    run(command, 'XADD', 'stream', '1-1', 'a', 'b')
+    run(command, 'XADD', 'stream', '2-1', 'c', 'd', 'e', 'f')
+
+
+def contents(keyspace: Keyspace):
+    '''Every key of every db as plain values, with its TTL and encoding.'''
+    found = {}
+    for db in keyspace.dbs:
+        for key, value in db.store.items():
+            if isinstance(value, QuickList):
+                value = 'list', list(value)
+            elif isinstance(value, RedisHash):
+                value = 'hash', value.encoding, dict(value.items())
+            elif isinstance(value, SortedSet):
+                value = 'zset', value.encoding, list(value)
+            elif isinstance(value, RedisStream):
+                value = 'stream', value.ids, value.entries
+            found[db.id, key] = value, db.expires.get(key)
+    return found
+
+
+@pytest.fixture
+def keyspace():
+    keyspace = Keyspace()
+    command = Command(keyspace=keyspace)
+    fill(command, 0)
+    fill(command, 7)
+    return keyspace
+
+
+def test_every_encoding_present(keyspace):
+    found = contents(keyspace)
+    assert found[0, 'hash'][0][1] == 'listpack' and found[0, 'big hash'][0][1] == 'hashtable'
+    assert found[0, 'long hash'][0][1] == 'hashtable'
+    assert found[0, 'zset'][0][1] == 'listpack' and found[0, 'big zset'][0][1] == 'skiplist'
+
+
+def test_rdb_round_trip(keyspace):
+    f = io.BytesIO()
+    size = RDBWriter(keyspace).write(f)
+    assert size == len(f.getvalue())
+    loaded = Keyspace()
+    loaded.load_snapshot(f.getvalue())
+    assert contents(loaded) == contents(keyspace)
+
+
+@pytest.fixture
+def persistence(tmp_path):
+    persistence = Persistence(Keyspace())
+    persistence.aof = AppendOnlyFile(tmp_path / 'appendonlydir', 'appendonly.aof', 'no')
+    persistence.aof.create(persistence.write_rdb)
+    return persistence
+
+
+def replayed(persistence: Persistence):
+    persistence.aof.flush()
+    aof = AppendOnlyFile(persistence.aof.dir, persistence.aof.filename, 'no')
+    keyspace = Keyspace()
+    aof.load(keyspace, Command(keyspace=keyspace))
+    return keyspace
+
+
+def wait_for_child(persistence: Persistence):
+    deadline = time.monotonic() + 10
+    while persistence.child_pid is not None:
+        assert time.monotonic() < deadline
+        persistence.check_child()
+        time.sleep(0.01)
+
+
+def test_aof_replay(persistence):
+    command = Command(keyspace=persistence.keyspace, persistence=persistence)
+    fill(command, 0)
+    fill(command, 7)
+    for args in (['MULTI'], ['INCR', 'n'], ['SELECT', '3'], ['SET', 'string', 'bye'], ['EXEC'],
+                 ['DEL', 'int', 'missing'], ['ZREM', 'zset', 'a'],
+                 ['HINCRBY', 'hash', 'n', '2'], ['HDEL', 'big hash', 'f1'], ['LPOP', 'list']):
+        run(command, *args)
+    assert contents(replayed(persistence)) == contents(persistence.keyspace)
+
+
+def test_aof_keeps_expiry(persistence, monkeypatch):
+    command = Command(keyspace=persistence.keyspace, persistence=persistence)
+    run(command, 'SET', 'ttl', 'v', 'PX', '100')
+    # replayed later, the key expires when it would have
+    monkeypatch.setattr(clock, '_now_ms', clock.now_ms() + 101)
+    assert replayed(persistence)[0].get('ttl') is None
+
+
+def test_only_changes_are_logged(persistence):
+    command = Command(keyspace=persistence.keyspace, persistence=persistence)
+    run(command, 'DEL', 'missing')
+    run(command, 'SET', 'string', 'hello')
+    run(command, 'INCR', 'string')
+    assert persistence.dirty == 1
+    persistence.aof.flush()
+    [(name, _)] = persistence.aof.incrs
+    assert (persistence.aof.dir / name).read_bytes() == (b'*2\r\n$6\r\nSELECT\r\n$1\r\n0\r\n'
+                                                         b'*3\r\n$3\r\nSET\r\n$6\r\nstring\r\n$5\r\nhello\r\n')
+
+
+def test_aof_rewrite(persistence):
+    command = Command(keyspace=persistence.keyspace, persistence=persistence)
+    fill(command, 0)
+    assert persistence.rewrite_aof()
+    # goes to the new incremental file while the child writes the base
+    fill(command, 7)
+    wait_for_child(persistence)
+    assert persistence.last_aof_rewrite_status == 'ok'
+    assert persistence.aof.base == ('appendonly.aof.2.base.rdb', 2)
+    assert [seq for _, seq in persistence.aof.incrs] == [2]
+    run(command, 'RPOP', 'list')
+    assert contents(replayed(persistence)) == contents(persistence.keyspace)
@@ -0,0 +1,105 @@
+import pytest
+
+from app.commands import ReplicaCommand
+from app.encoder import ENCODER, EncodedMessageType
+from app.namespace import server_config
+from app.storage import Keyspace
+from tests.helpers import FakeSocket, Recorder, run
+
+
+def commands(command: Recorder):
+    return [b' '.join(cmd_arr).decode() for cmd_arr, _ in command.propagated]
+
+
+@pytest.fixture
+def command():
+    command = Recorder()
+    for args in (['SET', 's', 'x'], ['SET', 'n', '1'], ['RPUSH', 'l', 'a'], ['HSET', 'h', 'f', 'v'], ['ZADD', 'z', '1', 'm']):
+        run(command, *args)
+    command.propagated.clear()
+    return command
+
+
+@pytest.mark.parametrize('args', [
+    ['INCR', 's'],
+    ['SET', 'k'],
+    ['XADD', 'st', '0-0', 'f', 'v'],
+    ['ZADD', 'z', 'XX', '1', 'absent'],
+    ['ZADD', 'z', '1', 'm'],
+    ['ZADD', 'z', 'NX', 'INCR', '1', 'm'],
+    ['ZADD', 'z', 'GT', '0', 'm'],
+    ['ZREM', 'z', 'absent'],
+    ['ZADD', 's', '1', 'm'],
+    ['HDEL', 'h', 'absent'],
+    ['HDEL', 'missing', 'f'],
+    ['HINCRBY', 'h', 'f', '1'],
+    ['LPOP', 'missing'],
+    ['RPOP', 'l', '0'],
+    ['LPUSH', 's', 'x'],
+])
+def test_no_op_not_propagated(command, args):
+    run(command, *args)
+    assert command.propagated == []
+    assert command.dirty == 5
+
+
+@pytest.mark.parametrize('args', [
+    ['SET', 'k', 'v'],
+    ['INCR', 'n'],
+    ['XADD', 'st', '1-1', 'f', 'v'],
+    ['ZADD', 'z', 'XX', 'CH', '2', 'm'],
+    ['ZADD', 'z', 'INCR', '1', 'm'],
+    ['ZREM', 'z', 'm', 'absent'],
+    ['HSET', 'h', 'f', 'v'],
+    ['HDEL', 'h', 'f', 'absent'],
+    ['HINCRBY', 'h', 'n', '1'],
+    ['LPOP', 'l'],
+    ['RPOP', 'l', '5'],
+    ['FLUSHDB'],
+])
+def test_write_propagated(command, args):
+    run(command, *args)
+    assert commands(command) == [' '.join(args)]
+
+
+def test_exec_wrapped_in_multi(command):
+    for args in (['MULTI'], ['SET', 'a', '1'], ['INCR', 's'], ['SELECT', '2'], ['INCR', 'a'], ['EXEC']):
+        run(command, *args)
+    assert command.propagated == [([b'MULTI'], 0), ([b'SET', b'a', b'1'], 0), ([b'INCR', b'a'], 2),
+                                  ([b'EXEC'], 2)]
+
+
+def test_exec_with_one_write_not_wrapped(command):
+    for args in (['MULTI'], ['GET', 's'], ['HSET', 'h', 'g', 'w'], ['HDEL', 'h', 'absent'], ['EXEC']):
+        run(command, *args)
+    assert commands(command) == ['HSET h g w']
+
+
+def test_exec_without_writes(command):
+    for args in (['MULTI'], ['INCR', 's'], ['LPOP', 'missing'], ['BLPOP', 'missing', '0'], ['EXEC']):
+        run(command, *args)
+    assert command.propagated == []
+
+
+def test_blocking_pop_propagated_as_pop():
+    keyspace = Keyspace()
+    blocked, socket = Recorder(keyspace=keyspace), FakeSocket()
+    assert run(blocked, 'BRPOP', 'q', 'r', '0', socket=socket) is None
+    pusher = Recorder(keyspace=keyspace)
+    run(pusher, 'RPUSH', 'r', 'a', 'b')
+    assert commands(pusher) == ['RPUSH r a b']
+    assert commands(blocked) == ['RPOP r']
+    run(blocked, 'BLPOP', 'q', 'r', '0')
+    assert commands(blocked) == ['RPOP r', 'LPOP r']
+
+
+def test_replica_counts_transaction_once(monkeypatch):
+    monkeypatch.setattr(server_config, 'acked_commands', 0)
+    monkeypatch.setattr(server_config, 'master_db', 0)
+    replica = ReplicaCommand()
+    stream = [[b'MULTI'], [b'SET', b'a', b'1'], [b'INCR', b'a'], [b'EXEC']]
+    for cmd_arr in stream:
+        replica.handle_cmd(cmd_arr, FakeSocket())
+    assert server_config.acked_commands == sum(len(ENCODER.encode(cmd_arr, EncodedMessageType.ARRAY))
+                                               for cmd_arr in stream) == 77
+    assert replica.storage.get('a') == 2
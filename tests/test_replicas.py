@@ -0,0 +1,118 @@
+import time
+from pathlib import Path
+
+import pytest
+
+from app.encoder import ENCODER
+from app.namespace import ConfigNamespace, server_config
+from app.persistence import Persistence
+from app.replicas import Replicas
+from app.storage import Keyspace
+from tests.helpers import FakeSocket
+
+
+class FakeReplica(FakeSocket):
+    '''A replica's connection, which takes all output right away.'''
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.closed = False
+
+    def flush(self):
+        pass
+
+    def when_drained(self, callback):
+        callback()
+
+    def output_size(self):
+        return 0
+
+    def getpeername(self):
+        return ('localhost', id(self))
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def replicas(tmp_path, monkeypatch):
+    monkeypatch.setattr(ConfigNamespace, 'dir', str(tmp_path), raising=False)
+    monkeypatch.setattr(ConfigNamespace, 'repl_backlog_size', 1024 * 1024, raising=False)
+    monkeypatch.setattr(ConfigNamespace, 'replica_output_buffer_limit', (0, 0, 0), raising=False)
+    keyspace = Keyspace()
+    keyspace[0].set('a', b'one')
+    keyspace[3].set('c', b'three')
+    keyspace[3].push('l', [b'x', b'y'], left=False)
+    return Replicas(Persistence(keyspace))
+
+
+def wait_for_child(persistence: Persistence):
+    deadline = time.monotonic() + 10
+    while persistence.child_pid is not None:
+        assert time.monotonic() < deadline
+        persistence.check_child()
+        time.sleep(0.01)
+
+
+def received_snapshot(sent: bytes):
+    '''Splits what a replica was sent into the FULLRESYNC reply, the RDB
+    loaded into a new keyspace, and the stream after it.'''
+    reply, _, rest = sent.partition(b'\r\n')
+    header, _, rest = rest.partition(b'\r\n')
+    size = int(header[1:])
+    keyspace = Keyspace()
+    keyspace.load_snapshot(rest[:size])
+    return reply, keyspace, rest[size:]
+
+
+def test_full_sync_snapshot_from_child(replicas):
+    offset = server_config.acked_commands
+    replica = FakeReplica()
+    replicas.full_sync(replica)
+    assert replicas.persistence.child_pid is not None
+    assert replicas.persistence.bgsave_in_progress()
+    # written after the fork, held back until the snapshot was sent
+    replicas.feed(ENCODER.encode_array([b'SET', b'b', b'2']), 0)
+    assert replica.sent == [b'+FULLRESYNC %s %d\r\n' % (server_config.replid.encode(), offset)]
+
+    wait_for_child(replicas.persistence)
+    reply, keyspace, stream = received_snapshot(b''.join(replica.sent))
+    assert reply.startswith(b'+FULLRESYNC')
+    assert keyspace[0].get('a') == b'one' and keyspace[0].get('b') is None
+    assert keyspace[3].get('c') == b'three'
+    assert keyspace[3].get_list('l').range(0, -1) == [b'x', b'y']
+    assert stream == ENCODER.encode_array([b'SELECT', b'0']) + ENCODER.encode_array([b'SET', b'b', b'2'])
+    assert replica not in replicas.syncing
+    assert not list(Path(ConfigNamespace.dir).glob('temp-*'))
+
+
+def test_replica_waits_for_running_child(replicas):
+    first, second = FakeReplica(), FakeReplica()
+    replicas.full_sync(first)
+    replicas.full_sync(second)
+    # no FULLRESYNC until a child snapshots for it
+    assert second.sent == [] and replicas.waiting_sync == [second]
+    replicas.persistence.keyspace[0].set('b', b'two')
+    replicas.feed(ENCODER.encode_array([b'SET', b'b', b'two']), 0)
+    wait_for_child(replicas.persistence)
+
+    replicas.start_pending_sync()
+    assert replicas.waiting_sync == []
+    wait_for_child(replicas.persistence)
+    _, keyspace, stream = received_snapshot(b''.join(second.sent))
+    # the second snapshot was taken after the write
+    assert keyspace[0].get('b') == b'two'
+    assert stream == b''
+
+
+def test_held_back_stream_counts_towards_limit(replicas, monkeypatch):
+    monkeypatch.setattr(ConfigNamespace, 'replica_output_buffer_limit', (100, 0, 0))
+    replica = FakeReplica()
+    replicas.full_sync(replica)
+    replicas.feed(ENCODER.encode_array([b'SET', b'b', b'x' * 50]), 0)
+    assert not replica.closed
+    replicas.feed(ENCODER.encode_array([b'SET', b'b', b'x' * 50]), 0)
+    assert replica.closed and replicas.disconnected_for_output == 1
+    wait_for_child(replicas.persistence)
+    # only the FULLRESYNC reply went out
+    assert len(replica.sent) == 1
@@ -0,0 +1,146 @@
+import random
+
+from app.commands import Command
+from app.scan import ScanOrder
+from tests.helpers import run
+
+
+def full_scan(order: ScanOrder, store: dict, count: int = 10, between=None):
+    '''Every key a scan returns, calling between() after each step.'''
+    cursor, found = 0, []
+    while True:
+        cursor, keys = order.scan(cursor, count, store)
+        found += keys
+        if cursor == 0:
+            return found
+        if between is not None:
+            between()
+
+
+def test_recreated_key_returned_once():
+    command = Command()
+    for args in (['XADD', 'h', '1-1', 'a', 'b'], ['DEL', 'h'], ['INCR', 'h']):
+        run(command, *args)
+    assert run(command, 'SCAN', '0', 'MATCH', 'h*', 'COUNT', '100') == b'*2\r\n$1\r\n0\r\n*1\r\n$1\r\nh\r\n'
+
+
+def test_recreated_keys_survive_compaction():
+    store = {}
+    order = ScanOrder()
+    for idx in range(2000):
+        store[idx] = None
+        order.add(idx)
+    for idx in range(0, 2000, 2):
+        del store[idx]
+    for idx in range(0, 2000, 4):
+        store[idx] = None
+        order.add(idx)
+    assert sorted(full_scan(order, store)) == sorted(store)
+    order.compact(store)
+    assert len(order.keys) == len(store)
+    assert sorted(full_scan(order, store)) == sorted(store)
+
+
+def test_cursor_remapped_across_compactions():
+    store = {}
+    order = ScanOrder()
+    for idx in range(5000):
+        store[idx] = None
+        order.add(idx)
+    rng = random.Random(21)
+    # kept for the whole scan, so it must return each of them
+    stable = set(rng.sample(range(5000), 1000))
+
+    def churn():
+        for key in rng.sample(range(5000), 20):
+            if key in stable:
+                continue
+            if key in store:
+                del store[key]
+            else:
+                store[key] = None
+                order.add(key)
+        if order.stale(len(store)) or rng.random() < 0.3:
+            order.compact(store)
+
+    found = full_scan(order, store, count=50, between=churn)
+    # others may come back after being deleted and added again
+    assert sorted(key for key in found if key in stable) == sorted(stable)
+    assert order.generation > 1
+
+
+def test_churn_does_not_keep_scan_going():
+    store = {key: None for key in range(1000)}
+    order = ScanOrder(store)
+    rng = random.Random(21)
+    calls = 0
+
+    def churn():
+        nonlocal calls
+        calls += 1
+        assert calls < 1000
+        # the db stays the same size, its keys go and come back faster than
+        # the scan moves, cron compacting them
+        for key in rng.sample(range(1000), 100):
+            del store[key]
+            store[key] = None
+            order.add(key)
+        if order.stale(len(store)):
+            order.compact(store)
+
+    found = full_scan(order, store, count=10, between=churn)
+    assert len(found) == len(set(found))
+    assert order.generation > 0
+
+
+def test_keys_added_during_scan_not_waited_for():
+    store = {key: None for key in range(100)}
+    order = ScanOrder(store)
+    cursor, found = order.scan(0, 10, store)
+    for key in range(100, 10000):
+        store[key] = None
+        order.add(key)
+    while cursor:
+        cursor, keys = order.scan(cursor, 10, store)
+        found += keys
+    assert sorted(found) == list(range(100))
+
+
+def test_mostly_stale_array_gives_empty_pages():
+    store = {}
+    order = ScanOrder()
+    for key in range(5000):
+        store[key] = None
+        order.add(key)
+    for key in range(10, 4990):
+        del store[key]
+    cursor, keys = order.scan(0, 10, store)
+    assert keys == list(range(10))
+    pages = []
+    while cursor:
+        cursor, keys = order.scan(cursor, 10, store)
+        pages.append(keys)
+    # at most 100 entries looked at per call, all of them stale in between
+    assert [] in pages
+    assert [key for page in pages for key in page] == list(range(4990, 5000))
+
+
+def test_cursor_of_forgotten_generation_ends_scan():
+    store = {key: None for key in range(100)}
+    order = ScanOrder(store)
+    cursor, _ = order.scan(0, 10, store)
+    for _ in range(ScanOrder.REMAPS_KEPT):
+        order.compact(store)
+    assert order.position(cursor) == (10, 100)
+    order.compact(store)
+    assert order.position(cursor) is None
+    assert order.scan(cursor, 10, store) == (0, [])
+
+
+def test_cursor_not_fitting_array_ends_scan():
+    store = {key: None for key in range(100)}
+    order = ScanOrder(store)
+    cursor, _ = order.scan(0, 10, store)
+    other = ScanOrder(range(20))
+    # like a cursor of a generation that wrapped around to this one
+    assert other.scan(cursor, 10, store) == (0, [])
@@ -0,0 +1,104 @@
+import random
+
+import pytest
+
+from app import zset
+from app.commands import Command
+from app.sortedlist import SortedList
+from app.zset import SortedSet, INF
+from tests.helpers import run, bulk_array
+
+
+def filled(n: int) -> SortedSet:
+    zs = SortedSet()
+    for idx in range(n):
+        zs.add(b'm%03d' % idx, float(idx))
+    return zs
+
+
+def test_converts_past_max_entries():
+    zs = filled(zset.ZSET_MAX_LISTPACK_ENTRIES)
+    assert zs.encoding == 'listpack'
+    zs.add(b'one more', 0.5)
+    assert zs.encoding == 'skiplist'
+    assert zs.rank(b'one more') == 1
+
+
+def test_converts_on_long_member():
+    zs = filled(3)
+    zs.add(b'x' * zset.ZSET_MAX_LISTPACK_VALUE, 10)
+    assert zs.encoding == 'listpack'
+    zs.add(b'x' * (zset.ZSET_MAX_LISTPACK_VALUE + 1), 11)
+    assert zs.encoding == 'skiplist'
+
+
+def test_loaded_set_picks_encoding():
+    small = {b'm%d' % idx: float(idx) for idx in range(zset.ZSET_MAX_LISTPACK_ENTRIES)}
+    assert SortedSet(small).encoding == 'listpack'
+    small[b'extra'] = 1.0
+    assert SortedSet(small).encoding == 'skiplist'
+
+
+@pytest.mark.parametrize('n', [3, 200])
+def test_range_by_score_limit(n):
+    zs = filled(n)
+    expected = [(float(idx), b'm%03d' % idx) for idx in range(n)]
+    for offset in (0, 1, 2, n - 1, n, n + 2, n + 5):
+        for count in (-1, 0, 1, 2, 10):
+            end = None if count < 0 else offset + count
+            assert zs.range_by_score(-INF, False, INF, False, offset, count) == expected[offset:end]
+            assert zs.range_by_score(-INF, False, INF, False, offset, count, reverse=True) == expected[::-1][offset:end]
+
+
+@pytest.mark.parametrize('n', [3, 200])
+def test_range_by_score_exclusive_bounds(n):
+    zs = filled(n)
+    assert [score for score, _ in zs.range_by_score(0, True, 2, True)] == [1.0]
+    assert [score for score, _ in zs.range_by_score(1, True, 2, True)] == []
+    assert [score for score, _ in zs.range_by_score(1, False, 2, False, reverse=True)] == [2.0, 1.0]
+
+
+@pytest.mark.parametrize('n', [3, 200])
+def test_range_by_rank(n):
+    zs = filled(n)
+    pairs = list(zs)
+    assert zs.range_by_rank(0, -1) == pairs
+    assert zs.range_by_rank(-2, -1) == pairs[-2:]
+    assert zs.range_by_rank(0, 1, reverse=True) == pairs[::-1][:2]
+    assert zs.range_by_rank(5, 1) == []
+    assert zs.range_by_rank(n, n + 10) == []
+
+
+@pytest.mark.parametrize('n', [3, 200])
+def test_zrange_rev_limit_past_end(n):
+    command = Command()
+    run(command, 'ZADD', 'rz', *[x for idx in range(n) for x in (idx + 1, 'm%03d' % idx)])
+    assert run(command, 'ZRANGE', 'rz', '+inf', '-inf', 'BYSCORE', 'REV', 'LIMIT', n + 2, 10) == b'*0\r\n'
+    assert run(command, 'ZRANGE', 'rz', '+inf', '-inf', 'BYSCORE', 'REV', 'LIMIT', n - 1, 10) == bulk_array('m000')
+    assert run(command, 'ZRANGEBYSCORE', 'rz', '-inf', '+inf', 'LIMIT', n, 10) == b'*0\r\n'
+
+
+def test_sortedlist_rank_index():
+    # small LOAD so adds and removes split and drop sublists
+    values = SortedList()
+    values.LOAD = 4
+    reference = []
+    rng = random.Random(23)
+    for step in range(2000):
+        value = rng.randrange(500)
+        if value in reference and rng.random() < 0.4:
+            values.discard(value)
+            reference.remove(value)
+        else:
+            values.add(value)
+            reference.append(value)
+            reference.sort()
+        if step % 7 == 0:
+            probe = rng.randrange(500)
+            assert values.bisect_left(probe) == len([v for v in reference if v < probe])
+            assert values.bisect_right(probe) == len([v for v in reference if v <= probe])
+        if reference and step % 11 == 0:
+            idx = rng.randrange(len(reference))
+            assert values[idx] == reference[idx]
+            assert values.islice(idx, idx + 9) == reference[idx:idx + 9]
+    assert list(values) == reference